@@ -1,17 +1,26 @@
 from flask import Flask, request
 import sys
-import pip
-from concrete.util.util import read_yaml_file, write_yaml_file
-from matplotlib.style import context
+from concrete.util.util import write_yaml_file, get_gzip_copy_path, list_dir_cached
 from concrete.logger import logging, get_log_dataframe
 from concrete.exception import ConcreteException
 import os, sys
 import json
+import mimetypes
+import hmac
+import uuid
+import threading
 from concrete.config.configuration import Configuration
-from concrete.constants import CONFIG_DIR, get_current_time_stamp
-from concrete.pipeline.pipeline import Pipeline
-from concrete.entity.concrete_predictor import ConcretePredictor, ConcreteData
-from flask import send_file, abort, render_template
+from concrete.config.config_loader import load_config_file
+from concrete.constants import CONFIG_DIR, get_current_time_stamp, PROFILE_DIR_NAME, PROFILE_REQUEST_DIR_NAME, \
+    PROFILE_TOKEN_ENV_KEY, PROFILE_TOKEN_HEADER, PROFILE_REQUEST_SAMPLE_INTERVAL, PROFILE_MAX_REQUEST_PROFILES
+from concrete.util.profiler import SamplingProfiler, prune_profiles
+from concrete.entity.training_job_queue import get_training_job_queue
+from concrete.entity.concrete_predictor import ConcreteData
+from concrete.entity.model_server import ModelServer
+from concrete.entity.prediction_input_validator import PredictionInputValidator
+from concrete.entity.mix_design_optimizer import MixDesignOptimizer
+from concrete.entity.sensitivity_analysis import SensitivityAnalysis
+from flask import send_file, abort, render_template, jsonify, g
 
 
 ROOT_DIR = os.getcwd()
@@ -26,9 +35,145 @@ MODEL_DIR = os.path.join(ROOT_DIR, SAVED_MODELS_DIR_NAME)
 
 CONCRETE_DATA_KEY = "concrete_data"
 CONCRETE_COMPRESSIVE_STRENGTH_KEY = "concrete_compressive_strength"
+PREDICTION_INTERVAL_KEY = "prediction_interval"
+ATTRIBUTIONS_KEY = "attributions"
+EXPERIMENT_PAGE_SIZE = 20
 
 app = Flask(__name__)
 
+model_server: ModelServer = None
+
+
+def get_model_server() -> ModelServer:
+    global model_server
+    if model_server is None:
+        model_server = ModelServer(model_serving_config=Configuration().get_model_serving_config())
+    return model_server
+
+
+prediction_input_validator: PredictionInputValidator = None
+
+
+def get_prediction_input_validator() -> PredictionInputValidator:
+    global prediction_input_validator
+    if prediction_input_validator is None:
+        schema_file_path = Configuration().get_data_validation_config().schema_file_path
+        prediction_input_validator = PredictionInputValidator(schema_file_path=schema_file_path)
+    return prediction_input_validator
+
+
+#(model version, optimizer) of the champion model the optimizer was built for
+mix_design_optimizer: tuple = None
+
+
+def get_mix_design_optimizer() -> tuple:
+    """
+    Returns the champion's model version and the optimizer built for it.
+    """
+    global mix_design_optimizer
+    version, model = get_model_server().get_champion_model()
+    if mix_design_optimizer is None or mix_design_optimizer[0] != version:
+        mix_design_optimizer = (version, MixDesignOptimizer(model=model, input_validator=get_prediction_input_validator()))
+    return mix_design_optimizer
+
+
+#(model version, analysis, surfaces) of the champion model, surfaces None when the version has none
+sensitivity: tuple = None
+
+
+def get_sensitivity() -> tuple:
+    """
+    Returns the champion's model version, its sensitivity analysis and the surfaces saved when
+    the version was exported, read once per version. Surfaces are None when the registry has
+    no model path for the version, surfaces of another version are never served in its place.
+    """
+    global sensitivity
+    server = get_model_server()
+    version, model = server.get_champion_model()
+    if sensitivity is None or sensitivity[0] != version:
+        model_path = server.model_registry.get_model_path(version)
+        sensitivity_file_path = None if model_path is None else SensitivityAnalysis.get_surfaces_file_path(model_path)
+        surfaces = SensitivityAnalysis.load_surfaces(sensitivity_file_path) \
+            if sensitivity_file_path is not None and os.path.exists(sensitivity_file_path) else None
+        schema_file_path = Configuration().get_data_validation_config().schema_file_path
+        sensitivity = (version, SensitivityAnalysis(model=model, schema_file_path=schema_file_path), surfaces)
+    return sensitivity
+
+
+def create_app() -> Flask:
+    """
+    App factory used by gunicorn. The served models are loaded here, once in the gunicorn
+    master when the app is preloaded, so that the forked workers share their memory.
+    """
+    try:
+        get_model_server()
+        get_prediction_input_validator()
+        return app
+    except Exception as e:
+        raise ConcreteException(e, sys) from e
+
+
+def is_profiling_requested() -> bool:
+    """
+    Requests are profiled only when they carry the admin profiling token in the X-Profile-Token
+    header and a token is set in the environment. The token is not accepted in the url, where
+    access logs, proxies and browser histories would record it.
+    """
+    profile_token = os.environ.get(PROFILE_TOKEN_ENV_KEY)
+    request_token = request.headers.get(PROFILE_TOKEN_HEADER)
+    return bool(profile_token) and bool(request_token) and hmac.compare_digest(profile_token, request_token)
+
+
+@app.before_request
+def start_request_profiler():
+    try:
+        if not is_profiling_requested():
+            return
+        profile_dir = os.path.join(Configuration().training_pipeline_config.artifact_dir, PROFILE_DIR_NAME,
+                                   PROFILE_REQUEST_DIR_NAME)
+        g.profiler = SamplingProfiler(output_dir=profile_dir,
+                                      name=f"{get_current_time_stamp()}_{request.endpoint}_{uuid.uuid4().hex[:8]}",
+                                      interval=PROFILE_REQUEST_SAMPLE_INTERVAL,
+                                      thread_ids={threading.get_ident()}).start()
+    except Exception as e:
+        raise ConcreteException(e, sys) from e
+
+
+@app.after_request
+def stop_request_profiler(response):
+    try:
+        profiler = g.pop("profiler", None)
+        if profiler is None:
+            return response
+        flame_graph_file_path = profiler.stop()
+        prune_profiles(profile_dir=profiler.output_dir, max_profiles=PROFILE_MAX_REQUEST_PROFILES)
+        #the profile is browsable from the artifact pages
+        response.headers["X-Profile-Path"] = f"/artifact/{os.path.relpath(flame_graph_file_path, ROOT_DIR)}"
+        return response
+    except Exception as e:
+        raise ConcreteException(e, sys) from e
+
+
+def send_artifact_file(file_path: str):
+    """
+    Streams the file with conditional and range request support. The gzip copy written when
+    the file was saved is sent instead to clients accepting gzip.
+    """
+    try:
+        #relative paths are resolved from the working directory, not from the app package
+        file_path = os.path.abspath(file_path)
+        gzip_file_path = get_gzip_copy_path(file_path) if "gzip" in request.accept_encodings else None
+        if gzip_file_path is None:
+            response = send_file(file_path, conditional=True)
+        else:
+            mimetype = mimetypes.guess_type(file_path)[0] or "application/octet-stream"
+            response = send_file(gzip_file_path, mimetype=mimetype, conditional=True)
+            response.headers["Content-Encoding"] = "gzip"
+        response.vary.add("Accept-Encoding")
+        return response
+    except Exception as e:
+        raise ConcreteException(e, sys) from e
+
 
 @app.route('/artifact', defaults={'req_path': 'concrete'})
 @app.route('/artifact/<path:req_path>')
@@ -45,16 +190,10 @@ def render_artifact_dir(req_path):
 
         # Check if path is a file and serve
         if os.path.isfile(abs_path):
-            if ".html" in abs_path:
-                with open(abs_path, "r", encoding="utf-8") as file:
-                    content = ''
-                    for line in file.readlines():
-                        content = f"{content}{line}"
-                    return content
-            return send_file(abs_path)
+            return send_artifact_file(abs_path)
 
         # Show directory contents
-        files = {os.path.join(abs_path, file_name): file_name for file_name in os.listdir(abs_path) if
+        files = {os.path.join(abs_path, file_name): file_name for file_name in list_dir_cached(abs_path) if
                 "artifact" in os.path.join(abs_path, file_name)}
 
         result = {
@@ -77,9 +216,14 @@ def index():
 @app.route('/view_experiment_hist', methods=['GET', 'POST'])
 def view_experiment_history():
     try:
-        experiment_df = Pipeline.get_experiments_status()
+        #training pipeline dependencies are only imported by the routes using them
+        from concrete.pipeline.pipeline import Pipeline
+        page = max(request.args.get("page", default=1, type=int), 1)
+        experiment_df = Pipeline.get_experiments_status(limit=EXPERIMENT_PAGE_SIZE, page=page)
         context = {
-            "experiment": experiment_df.to_html(classes='table table-striped col-12')
+            "experiment": experiment_df.to_html(classes='table table-striped col-12'),
+            "page": page,
+            "has_next_page": len(experiment_df) == EXPERIMENT_PAGE_SIZE
         }
         return render_template('experiment_history.html', context=context)
     except Exception as e:
@@ -88,27 +232,42 @@ def view_experiment_history():
 @app.route('/train', methods=['GET', 'POST'])
 def train():
     try:
-        message = ""
-        pipeline = Pipeline(config=Configuration(current_time_stamp=get_current_time_stamp()))
-        if not Pipeline.experiment.running_status:
-            message = "Training started."
-            pipeline.start()
+        from concrete.pipeline.pipeline import Pipeline
+        job_queue = get_training_job_queue(Configuration().training_pipeline_config.artifact_dir)
+        job, is_new_job = job_queue.submit_job()
+        if is_new_job:
+            message = "Training job queued."
         else:
-            message = "Training is already in progress."
+            message = f"Training is already {job.status}."
         context = {
-            "experiment": pipeline.get_experiments_status().to_html(classes='table table-striped col-12'),
-            "message": message
+            "experiment": Pipeline.get_experiments_status().to_html(classes='table table-striped col-12'),
+            "message": message,
+            "job_id": job.job_id
         }
         return render_template('train.html', context=context)
     except Exception as e:
         raise ConcreteException(e, sys) from e
 
+@app.route('/train/status', methods=['GET'])
+def train_status():
+    try:
+        job_queue = get_training_job_queue(Configuration().training_pipeline_config.artifact_dir)
+        job_id = request.args.get("job_id")
+        job = job_queue.get_job(job_id) if job_id else job_queue.get_latest_job()
+        if job is None:
+            return jsonify({"message": "No training job found."}), 404
+        return jsonify(job._asdict())
+    except Exception as e:
+        raise ConcreteException(e, sys) from e
+
 @app.route('/predict', methods=['GET', 'POST'])
 def predict():
     try:
         context = {
             CONCRETE_DATA_KEY: None,
-            CONCRETE_COMPRESSIVE_STRENGTH_KEY: None
+            CONCRETE_COMPRESSIVE_STRENGTH_KEY: None,
+            PREDICTION_INTERVAL_KEY: None,
+            ATTRIBUTIONS_KEY: None
         }
 
         if request.method == 'POST':
@@ -130,17 +289,134 @@ def predict():
                                         fine_aggregate=fine_aggregate,
                                         age=age)
             concrete_df = concrete_data.get_concrete_input_data_frame()
-            concrete_predictor = ConcretePredictor(model_dir=MODEL_DIR)
-            concrete_compresive_strength = concrete_predictor.predict(X=concrete_df)
+            served_prediction = get_model_server().predict(X=concrete_df, with_attributions=True)
+            prediction_interval = None
+            if served_prediction.lower is not None:
+                prediction_interval = (f"{served_prediction.lower[0]:.2f} to {served_prediction.upper[0]:.2f} "
+                                       f"({served_prediction.coverage:.0%} interval)")
+            attributions = None
+            if served_prediction.attributions is not None:
+                attributions = {column: round(float(contribution), 2) for column, contribution in
+                                zip(served_prediction.attributions.columns, served_prediction.attributions.contributions[0])}
             context = {
                 CONCRETE_DATA_KEY: concrete_data.get_concrete_data_as_dict(),
-                CONCRETE_COMPRESSIVE_STRENGTH_KEY: concrete_compresive_strength,
+                CONCRETE_COMPRESSIVE_STRENGTH_KEY: served_prediction.prediction,
+                PREDICTION_INTERVAL_KEY: prediction_interval,
+                ATTRIBUTIONS_KEY: attributions
             }
             return render_template('predict.html', context=context)
         return render_template("predict.html", context=context)
     except Exception as e:
         raise ConcreteException(e, sys) from e
 
+@app.route('/api/v1/predict', methods=['POST'])
+def api_predict():
+    """
+    JSON prediction api. The body is one row or a list of rows of input values in the schema
+    column order, e.g. [540.0, 0.0, 0.0, 162.0, 2.5, 1040.0, 676.0, 28].
+    Intervals are [lower, upper] bounds of each prediction, null for models without calibrated intervals.
+    With ?attributions=true the response gives the contribution of each input to each prediction,
+    predictions being bias plus the sum of their contributions, null for unsupported models.
+    """
+    try:
+        payload = request.get_json(silent=True)
+        if payload is None:
+            return jsonify({"message": "Request body must be JSON."}), 400
+        validator = get_prediction_input_validator()
+        X, error_message = validator.validate(payload)
+        if error_message is not None:
+            return jsonify({"message": error_message}), 400
+        with_attributions = request.args.get(ATTRIBUTIONS_KEY, "false").lower() in ("true", "1")
+        served_prediction = get_model_server().predict(X=validator.to_data_frame(X), with_attributions=with_attributions)
+        intervals = None
+        if served_prediction.lower is not None:
+            intervals = [[float(lower), float(upper)] for lower, upper in zip(served_prediction.lower, served_prediction.upper)]
+        response = {"predictions": [float(value) for value in served_prediction.prediction],
+                    "intervals": intervals,
+                    "interval_coverage": served_prediction.coverage,
+                    "version": served_prediction.version}
+        if with_attributions:
+            attributions = served_prediction.attributions
+            response[ATTRIBUTIONS_KEY] = None if attributions is None else {
+                "columns": attributions.columns,
+                "bias": [float(value) for value in attributions.bias],
+                "contributions": attributions.contributions.tolist()
+            }
+        return jsonify(response)
+    except Exception as e:
+        raise ConcreteException(e, sys) from e
+
+@app.route('/api/v1/mix_design', methods=['POST'])
+def api_mix_design():
+    """
+    Cheapest mix reaching a target strength. The body gives target_strength (MPa), age (days),
+    costs per kg of every ingredient and optionally ingredient bounds, e.g.
+    {"target_strength": 40, "age": 28, "costs": {"cement": 0.12, ...}, "bounds": {"cement": [150, 450]}}.
+    Bounds default to the training data ranges, extrapolated_inputs lists the inputs of the mix outside them.
+    """
+    try:
+        payload = request.get_json(silent=True)
+        if payload is None:
+            return jsonify({"message": "Request body must be JSON."}), 400
+        version, optimizer = get_mix_design_optimizer()
+        mix_design_request, error_message = optimizer.validate_request(payload)
+        if error_message is not None:
+            return jsonify({"message": error_message}), 400
+        return jsonify(dict(optimizer.optimize(mix_design_request)._asdict(), version=version))
+    except Exception as e:
+        raise ConcreteException(e, sys) from e
+
+@app.route('/api/v1/sensitivity', methods=['GET', 'POST'])
+def api_sensitivity():
+    """
+    Sensitivity surfaces of the champion model, computed when it was exported. GET returns the
+    partial dependence and ICE curves of the inputs and the 2-D partial dependence grids of their
+    pairs, optionally of some inputs only, e.g. ?features=water,cement,age. POST returns the ICE
+    curves of one mix on the same grids, e.g. {"mix": [540.0, 0.0, 0.0, 162.0, 2.5, 1040.0, 676.0, 28]},
+    optionally with "features": ["water", "cement"].
+    """
+    try:
+        payload = None
+        if request.method == 'POST':
+            payload = request.get_json(silent=True)
+            if not isinstance(payload, dict):
+                return jsonify({"message": "Request body must be a JSON object."}), 400
+            features = payload.get("features")
+        else:
+            features = request.args.get("features")
+            features = None if features is None else [feature.strip() for feature in features.split(",") if feature.strip()]
+        version, analysis, surfaces = get_sensitivity()
+        if features is not None and (not isinstance(features, list) or not features
+                                     or not set(features) <= set(analysis.columns)):
+            return jsonify({"message": f"features must be a list of inputs: {analysis.columns}"}), 400
+        if surfaces is None:
+            return jsonify({"message": f"No sensitivity surfaces were computed for model version [{version}]."}), 404
+        if payload is None:
+            return jsonify(dict(SensitivityAnalysis.surfaces_to_dict(surfaces=surfaces, columns=features), version=version))
+        X, error_message = analysis.input_validator.validate(payload.get("mix"))
+        if error_message is None and len(X) != 1:
+            error_message = "mix must be one row of input values."
+        if error_message is not None:
+            return jsonify({"message": error_message}), 400
+        curves = analysis.compute_mix_curves(mix=X[0], surfaces=surfaces, columns=features)
+        return jsonify({"mix": X[0].tolist(),
+                        "curves": {column: {"grid": surfaces[f"grid/{column}"].astype(float).round(3).tolist(),
+                                            "prediction": column_curve.round(3).tolist()}
+                                   for column, column_curve in curves.items()},
+                        "version": version})
+    except Exception as e:
+        raise ConcreteException(e, sys) from e
+
+@app.route('/model_server/stats', methods=['GET'])
+def model_server_stats():
+    """
+    Statistics of the worker answering the request, see ModelServer.get_stats.
+    """
+    try:
+        return jsonify(get_model_server().get_stats())
+    except Exception as e:
+        raise ConcreteException(e, sys) from e
+
 @app.route('/saved_models', defaults={'req_path': 'saved_models'})
 @app.route('/saved_models/<path:req_path>')
 def saved_models_dir(req_path):
@@ -156,10 +432,10 @@ def saved_models_dir(req_path):
 
         # Check if path is a file and serve
         if os.path.isfile(abs_path):
-            return send_file(abs_path)
+            return send_artifact_file(abs_path)
 
         # Show directory contents
-        files = {os.path.join(abs_path, file): file for file in os.listdir(abs_path)}
+        files = {os.path.join(abs_path, file): file for file in list_dir_cached(abs_path)}
 
         result = {
             "files": files,
@@ -180,8 +456,9 @@ def update_model_config():
             model_config = json.loads(model_config)
 
             write_yaml_file(file_path=MODEL_CONFIG_FILE_PATH, data=model_config)
+            return render_template('update_model.html', result={"model_config": model_config})
 
-        model_config = read_yaml_file(file_path=MODEL_CONFIG_FILE_PATH)
+        model_config = load_config_file(MODEL_CONFIG_FILE_PATH)
         return render_template('update_model.html', result={"model_config": model_config})
 
     except Exception as e:
@@ -209,7 +486,7 @@ def render_log_dir(req_path):
         
 
         # Show directory contents
-        files = {os.path.join(abs_path, file): file for file in os.listdir(abs_path)}
+        files = {os.path.join(abs_path, file): file for file in list_dir_cached(abs_path)}
 
         result = {
             "files": files,
@@ -0,0 +1,45 @@
+import sys
+import json
+import argparse
+import subprocess
+
+#training and reporting dependencies the web app must only load when a request needs them
+HEAVY_MODULES = ["pandas", "sklearn", "evidently", "matplotlib"]
+#seconds importing the web app may take in a fresh interpreter, gunicorn workers and restarts wait for it
+IMPORT_BUDGET_SECONDS = 2.0
+
+
+def get_loaded_modules(module_name: str) -> dict:
+    """
+    Imports module_name in a fresh interpreter, returns the heavy modules it loaded and the import time.
+    """
+    script = (f"import sys, time, json\n"
+              f"start_time = time.perf_counter()\n"
+              f"import {module_name}\n"
+              f"print(json.dumps({{'seconds': time.perf_counter() - start_time,\n"
+              f"                  'loaded': [name for name in {HEAVY_MODULES!r} if name in sys.modules]}}))\n")
+    output = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Checks that importing the web app does not load the training and "
+                                                 "reporting dependencies and stays within its time budget. "
+                                                 "Run from the project root.")
+    parser.add_argument("--module", default="app", help="module to import")
+    parser.add_argument("--max-seconds", type=float, default=IMPORT_BUDGET_SECONDS, help="import time budget")
+    args = parser.parse_args()
+    result = get_loaded_modules(args.module)
+    print(f"import {args.module}: {result['seconds']:.3f}s, budget: {args.max_seconds:.3f}s")
+    is_failed = result["seconds"] > args.max_seconds
+    if result["loaded"]:
+        print(f"import {args.module} loaded: {', '.join(result['loaded'])}")
+        is_failed = True
+    else:
+        print(f"import {args.module} loaded none of: {', '.join(HEAVY_MODULES)}")
+    if is_failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,17 +3,31 @@ from concrete.exception import ConcreteException
 import sys, os
 from concrete.logger import logging
 from concrete.entity.artifact_entity import DataIngestionArtifact
+from concrete.util.util import read_yaml_file, write_yaml_file_atomic
+from concrete.constants import LATEST_POINTER_FILE_NAME, PROCESSING_MODE_CHUNKED
+from concrete.entity.blob_store import BlobStore
+from concrete.entity.memory_budget import MemoryBudget
 import tarfile
 from six.moves import urllib
 import pandas as pd, numpy as np
-from sklearn.model_selection import StratifiedShuffleSplit
+
+TARGET_COLUMN_NAME = 'concrete_compressive_strength'
+#upper edges of the strength bins used for stratification: (-inf,20], (20,40], ..., (80,inf)
+STRENGTH_BIN_EDGES = [20, 40, 60, 80]
+#a chunk is held as read, in hash order and split into train and test rows
+SPLIT_WORKING_SET_FACTOR = 3
 
 
 class DataIngestion:
-    def __init__(self, data_ingestion_config: DataInjestionConfig) -> None:
+    def __init__(self, data_ingestion_config: DataInjestionConfig, blob_store: BlobStore = None) -> None:
+        """
+        blob_store: when given, the downloaded and split files are stored in it
+        """
         try:
             logging.info(f"{'='*20} Data Ingestion Log Started {'='*20}")
             self.data_ingestion_config = data_ingestion_config
+            self.blob_store = blob_store
+            self.memory_budget = MemoryBudget(stage_name="data_ingestion", budget_mb=data_ingestion_config.memory_budget_mb)
         except Exception as e:
             raise ConcreteException(e,sys) from e
 
@@ -29,18 +43,36 @@ class DataIngestion:
                                 raw_file_name)
             logging.info(f"Downloading [{raw_file_name}] from [{download_url}] to [{raw_data_dir}]")
             urllib.request.urlretrieve(download_url, raw_file_path)
+            if self.blob_store is not None:
+                self.blob_store.put_file(raw_file_path)
             logging.info(f"Downloaded [{raw_file_name}] successfully.")
         except Exception as e:
             raise ConcreteException(e,sys) from e
 
+    def get_data_ingestion_dir(self) -> str:
+        ingested_data_dir = os.path.dirname(self.data_ingestion_config.ingested_train_dir)
+        return os.path.dirname(os.path.dirname(ingested_data_dir))
+
     def get_previous_train_file_path(self, train_file_name):
+        """
+        Train file of the previous ingestion, read from the latest pointer of the data ingestion
+        directory. Without a pointer the most recent other time stamp folder is used, and the
+        current train file when there is no previous ingestion.
+        """
         try:
+            data_ingestion_dir = self.get_data_ingestion_dir()
+            latest_pointer_file_path = os.path.join(data_ingestion_dir, LATEST_POINTER_FILE_NAME)
+            if os.path.exists(latest_pointer_file_path):
+                return read_yaml_file(file_path=latest_pointer_file_path)["train_file_path"]
             ingested_data_dir, train_folder = os.path.split(self.data_ingestion_config.ingested_train_dir)
             timestamp_dir, ingested_data_folder = os.path.split(ingested_data_dir)
-            data_ingestion_dir =  os.path.dirname(timestamp_dir)
-            previous_timestamp_folder = os.listdir(data_ingestion_dir)[-1]
-            previous_train_file_path = os.path.join(data_ingestion_dir,
-                                                    previous_timestamp_folder,
+            previous_timestamp_folders = sorted(folder_name for folder_name in os.listdir(data_ingestion_dir)
+                                                if folder_name != os.path.basename(timestamp_dir)
+                                                and os.path.isdir(os.path.join(data_ingestion_dir, folder_name)))
+            previous_timestamp_dir = timestamp_dir
+            if previous_timestamp_folders:
+                previous_timestamp_dir = os.path.join(data_ingestion_dir, previous_timestamp_folders[-1])
+            previous_train_file_path = os.path.join(previous_timestamp_dir,
                                                     ingested_data_folder,
                                                     train_folder,
                                                     train_file_name)
@@ -49,6 +81,93 @@ class DataIngestion:
             raise ConcreteException(e,sys) from e
 
 
+    def get_row_hash(self, chunk: pd.DataFrame) -> np.ndarray:
+        """
+        Returns a hash of every row's content salted with the split random state.
+        """
+        try:
+            hash_key = f"{self.data_ingestion_config.split_random_state:016d}"[-16:]
+            return pd.util.hash_pandas_object(chunk, index=False, hash_key=hash_key).to_numpy()
+        except Exception as e:
+            raise ConcreteException(e,sys) from e
+
+    def get_strength_bin(self, chunk: pd.DataFrame) -> np.ndarray:
+        try:
+            return np.digitize(chunk[TARGET_COLUMN_NAME].to_numpy(), STRENGTH_BIN_EDGES, right=True).astype(np.int8)
+        except Exception as e:
+            raise ConcreteException(e,sys) from e
+
+    def get_test_mask(self, strength_bin: np.ndarray, row_hash: np.ndarray) -> np.ndarray:
+        """
+        Returns a boolean mask marking the rows of the file that belong to the test set, given the
+        strength bin and hash of every row. Rows of each bin are ranked by their hash and test rows
+        are picked at a fixed stride of test_size along the ranks, so every bin's train/test ratio
+        is exact and the split only depends on the rows' content and the random state, not on the
+        order of the file or the chunk size. Appended rows shift the ranks in their bins and can
+        move some earlier train rows to the test set, incremental updates are evaluated on the test
+        rows the previous model was not trained on.
+        """
+        try:
+            test_size = self.data_ingestion_config.test_size
+            order = np.lexsort((row_hash, strength_bin))
+            sorted_bin = strength_bin[order]
+            position = np.arange(len(sorted_bin)) - np.searchsorted(sorted_bin, sorted_bin, side='left')
+            test_mask = np.empty(len(strength_bin), dtype=bool)
+            test_mask[order] = np.floor((position + 1) * test_size) > np.floor(position * test_size)
+            return test_mask
+        except Exception as e:
+            raise ConcreteException(e,sys) from e
+
+    def get_split_chunk_size(self, file_path: str) -> tuple:
+        """
+        Rows per chunk of the split, the configured chunk size capped by the memory budget, and
+        the processing mode: in memory when the whole file is split as a single chunk.
+        """
+        try:
+            header_columns = MemoryBudget.get_header_columns(file_path)
+            estimated_bytes = self.memory_budget.estimate_csv_bytes(file_path, header_columns)
+            processing_mode = self.memory_budget.choose_processing_mode(estimated_bytes,
+                                                                        working_set_factor=SPLIT_WORKING_SET_FACTOR)
+            chunk_size = self.data_ingestion_config.split_chunk_size
+            if processing_mode == PROCESSING_MODE_CHUNKED:
+                chunk_size = min(chunk_size, self.memory_budget.get_chunk_rows(MemoryBudget.get_row_bytes(header_columns),
+                                                                              working_set_factor=SPLIT_WORKING_SET_FACTOR))
+            elif MemoryBudget.estimate_row_count(file_path) > chunk_size:
+                processing_mode = PROCESSING_MODE_CHUNKED
+            return chunk_size, processing_mode
+        except Exception as e:
+            raise ConcreteException(e,sys) from e
+
+    def shuffle_split_file(self, file_path: str, chunk_size: int, row_count: int):
+        """
+        Puts a split file written chunk by chunk in row hash order across chunks, holding about one
+        chunk in memory: rows are spread over bucket files by hash, then every bucket is sorted by
+        hash and appended. Without it the rows keep the order of the raw file's chunks.
+        """
+        try:
+            bucket_count = -(-row_count // chunk_size)
+            if bucket_count <= 1:
+                return
+            bucket_file_paths = [f"{file_path}.bucket{bucket_number}" for bucket_number in range(bucket_count)]
+            for chunk in pd.read_csv(file_path, chunksize=chunk_size):
+                bucket = self.get_row_hash(chunk) % bucket_count
+                for bucket_number, bucket_chunk in chunk.groupby(bucket):
+                    bucket_file_path = bucket_file_paths[bucket_number]
+                    bucket_chunk.to_csv(bucket_file_path, mode='a', header=not os.path.exists(bucket_file_path), index=False)
+            shuffled_file_path = f"{file_path}.shuffled"
+            pd.read_csv(file_path, nrows=0).to_csv(shuffled_file_path, index=False)
+            for bucket_file_path in bucket_file_paths:
+                if not os.path.exists(bucket_file_path):
+                    continue
+                bucket_df = pd.read_csv(bucket_file_path)
+                bucket_df = bucket_df.iloc[np.argsort(self.get_row_hash(bucket_df), kind='stable')]
+                bucket_df.to_csv(shuffled_file_path, mode='a', header=False, index=False)
+                os.remove(bucket_file_path)
+            os.replace(shuffled_file_path, file_path)
+            logging.info(f"Shuffled [{file_path}] through {bucket_count} hash buckets")
+        except Exception as e:
+            raise ConcreteException(e,sys) from e
+
     def split_data_as_train_test(self):
         try:
             raw_data_dir = self.data_ingestion_config.raw_data_dir
@@ -56,41 +175,48 @@ class DataIngestion:
             previous_train_file_path = self.get_previous_train_file_path(file_name)
             concrete_file_path = os.path.join(raw_data_dir,
                                 file_name)
-            logging.info(f'Reading xls file: [{concrete_file_path}]')
-            concrete_df = pd.read_csv(concrete_file_path)
-            concrete_df['strength_cat'] = pd.cut(concrete_df['concrete_compressive_strength'],
-                                       bins= [0,20,40,60,80,np.inf],
-                                       labels= [1,2,3,4,5])
-            logging.info(f"Splitting the dataset into train and test")
-            strat_train_set = None
-            strat_test_set = None
-            split = StratifiedShuffleSplit(n_splits=1,
-                    test_size=0.2, 
-                    random_state=13)
-            for train_index, test_index in split.split(concrete_df,concrete_df['strength_cat']):
-                strat_train_set = concrete_df.loc[train_index].drop(['strength_cat'], axis=1)
-                strat_test_set = concrete_df.loc[test_index].drop(['strength_cat'], axis=1)
             train_file_path = os.path.join(self.data_ingestion_config.ingested_train_dir,
                               file_name)
             test_file_path = os.path.join(self.data_ingestion_config.ingested_test_dir,
                              file_name)
-            if strat_train_set is not None:
-                os.makedirs(self.data_ingestion_config.ingested_train_dir,
-                            exist_ok=True)
-                logging.info(f"Exporting training dataset to file: [{train_file_path}]")
-                strat_train_set.to_csv(train_file_path,
-                                       index=False)
-            if strat_test_set is not None:
-                os.makedirs(self.data_ingestion_config.ingested_test_dir,
-                            exist_ok=True)
-                logging.info(f"Exporting test dataset to file: [{test_file_path}]")
-                strat_test_set.to_csv(test_file_path,
-                                      index=False)
+            os.makedirs(self.data_ingestion_config.ingested_train_dir, exist_ok=True)
+            os.makedirs(self.data_ingestion_config.ingested_test_dir, exist_ok=True)
+            chunk_size, processing_mode = self.get_split_chunk_size(concrete_file_path)
+            logging.info(f"Splitting [{concrete_file_path}] into train and test in chunks of {chunk_size} rows")
+            #a first pass keeps the strength bin and hash of every row, 9 bytes per row, to rank the rows of each bin
+            strength_bins, row_hashes = [], []
+            for chunk in pd.read_csv(concrete_file_path, chunksize=chunk_size):
+                strength_bins.append(self.get_strength_bin(chunk))
+                row_hashes.append(self.get_row_hash(chunk))
+            file_test_mask = self.get_test_mask(np.concatenate(strength_bins), np.concatenate(row_hashes))
+            del strength_bins, row_hashes
+            train_rows, test_rows = 0, 0
+            for chunk_number, chunk in enumerate(pd.read_csv(concrete_file_path, chunksize=chunk_size)):
+                test_mask = file_test_mask[train_rows + test_rows:train_rows + test_rows + len(chunk)]
+                #rows are written in hash order so that each split is shuffled within the chunk
+                shuffle_order = np.argsort(self.get_row_hash(chunk), kind='stable')
+                chunk, test_mask = chunk.iloc[shuffle_order], test_mask[shuffle_order]
+                write_mode, write_header = ('w', True) if chunk_number == 0 else ('a', False)
+                chunk[~test_mask].to_csv(train_file_path, mode=write_mode, header=write_header, index=False)
+                chunk[test_mask].to_csv(test_file_path, mode=write_mode, header=write_header, index=False)
+                train_rows += int((~test_mask).sum())
+                test_rows += int(test_mask.sum())
+            if processing_mode == PROCESSING_MODE_CHUNKED:
+                self.shuffle_split_file(train_file_path, chunk_size=chunk_size, row_count=train_rows)
+                self.shuffle_split_file(test_file_path, chunk_size=chunk_size, row_count=test_rows)
+            logging.info(f"Exported {train_rows} rows to training dataset file: [{train_file_path}]")
+            logging.info(f"Exported {test_rows} rows to test dataset file: [{test_file_path}]")
+            if self.blob_store is not None:
+                self.blob_store.put_file(train_file_path)
+                self.blob_store.put_file(test_file_path)
+            write_yaml_file_atomic(file_path=os.path.join(self.get_data_ingestion_dir(), LATEST_POINTER_FILE_NAME),
+                                   data={"train_file_path": train_file_path, "test_file_path": test_file_path})
             data_ingestion_artifact = DataIngestionArtifact(train_file_path=train_file_path,
                                                             test_file_path=test_file_path,
                                                             is_ingested=True,
                                                             message=f"Data Ingestion Completed sucessfully",
-                                                            previous_train_file_path=previous_train_file_path)
+                                                            previous_train_file_path=previous_train_file_path,
+                                                            processing_mode=processing_mode)
             logging.info(f'Data Ingestion Artifact: {data_ingestion_artifact}')
             return data_ingestion_artifact
         except Exception as e:
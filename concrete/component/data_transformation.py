@@ -1,4 +1,5 @@
 import os, sys
+import copy
 from concrete.entity.artifact_entity import DataIngestionArtifact, DataTransformationArtifact, DataValidationArtifact
 from concrete.entity.config_entity import DataTransformationConfig
 from concrete.exception import ConcreteException
@@ -10,13 +11,28 @@ from sklearn.compose import ColumnTransformer
 from sklearn.impute import SimpleImputer
 from concrete.constants import *
 import numpy as np, pandas as pd
-from concrete.util.util import read_yaml_file,save_object,save_numpy_array_data,load_data
+from concrete.util.util import save_object,save_numpy_array_data,load_data
+from concrete.config.config_loader import load_config_file, SCHEMA_REQUIRED_KEYS
+from concrete.entity.preprocessor_store import PreprocessorStore
+from concrete.entity.artifact_store import ArtifactStore
+from concrete.entity.memory_budget import MemoryBudget
+
+#train and test data frames, their input features and the transformed and concatenated arrays
+TRANSFORMATION_WORKING_SET_FACTOR = 4
 
 class OutlierRemover(BaseEstimator, TransformerMixin):
-    def __init__(self, continuous_features:list) -> None:
+    #default of objects pickled before quartiles existed
+    quartiles = None
+
+    def __init__(self, continuous_features:list, quartiles:dict = None) -> None:
+        """
+        quartiles: (q1, q3) of continuous features to use instead of the quartiles of the transformed
+                   data, set when the data is transformed in chunks
+        """
         try:
             super().__init__()
             self.continuous_features = continuous_features
+            self.quartiles = quartiles
         except Exception as e:
             raise ConcreteException(e, sys) from e
 
@@ -26,9 +42,13 @@ class OutlierRemover(BaseEstimator, TransformerMixin):
 
     def transform(self, X, y=None):
         try:
+            quartiles = self.quartiles or dict()
             for column in self.continuous_features:
-                q1 = X[column].quantile(0.25)
-                q3 = X[column].quantile(0.75)
+                if column in quartiles:
+                    q1, q3 = quartiles[column]
+                else:
+                    q1 = X[column].quantile(0.25)
+                    q3 = X[column].quantile(0.75)
                 iqr = q3-q1
                 lf = q1 - 1.5*iqr
                 uf = q3 + 1.5*iqr
@@ -61,19 +81,128 @@ class UnnecessaryFeatureRemover(BaseEstimator, TransformerMixin):
 class DataTransformation:
     def __init__(self, data_transformation_config:DataTransformationConfig,
                  data_ingestion_artifact:DataIngestionArtifact,
-                 data_validation_artifact:DataValidationArtifact ) -> None:
+                 data_validation_artifact:DataValidationArtifact,
+                 artifact_store:ArtifactStore = None) -> None:
         try:
             logging.info(f"{'='*20} Data Transformation Log Started {'='*20}")
             self.data_transformation_config = data_transformation_config
             self.data_ingestion_artifact = data_ingestion_artifact
             self.data_validation_artifact = data_validation_artifact
+            self.artifact_store = ArtifactStore(persist_in_background=False) if artifact_store is None else artifact_store
+            self.memory_budget = MemoryBudget(stage_name="data_transformation",
+                                              budget_mb=data_transformation_config.memory_budget_mb)
+        except Exception as e:
+            raise ConcreteException(e,sys) from e
+
+    def get_processing_mode(self, schema: dict) -> tuple:
+        """
+        Processing mode and rows per chunk for transforming the train and test files.
+        """
+        try:
+            schema_columns = schema[SCHEMA_COLUMNS_KEY]
+            estimated_bytes = sum(self.memory_budget.estimate_csv_bytes(file_path, schema_columns)
+                                  for file_path in [self.data_ingestion_artifact.train_file_path,
+                                                    self.data_ingestion_artifact.test_file_path])
+            processing_mode = self.memory_budget.choose_processing_mode(estimated_bytes,
+                                                                        working_set_factor=TRANSFORMATION_WORKING_SET_FACTOR)
+            chunk_rows = self.memory_budget.get_chunk_rows(MemoryBudget.get_row_bytes(schema_columns),
+                                                           working_set_factor=TRANSFORMATION_WORKING_SET_FACTOR)
+            return processing_mode, chunk_rows
+        except Exception as e:
+            raise ConcreteException(e,sys) from e
+
+    @staticmethod
+    def get_outlier_removers(preprocessing_obj: ColumnTransformer) -> list:
+        transformers = getattr(preprocessing_obj, "transformers_", preprocessing_obj.transformers)
+        return [step for _, transformer, _ in transformers for _, step in getattr(transformer, "steps", [])
+                if isinstance(step, OutlierRemover)]
+
+    @staticmethod
+    def get_inference_preprocessor(preprocessing_obj: ColumnTransformer) -> ColumnTransformer:
+        """
+        Copy of preprocessing_obj whose outlier removers keep every row. Outlier removers drop the
+        rows outside the quartile fences of each batch, which would misalign predictions with
+        their input rows.
+        """
+        try:
+            inference_preprocessing_obj = copy.deepcopy(preprocessing_obj)
+            for outlier_remover in DataTransformation.get_outlier_removers(inference_preprocessing_obj):
+                outlier_remover.quartiles = {column: (-np.inf, np.inf) for column in outlier_remover.continuous_features}
+            return inference_preprocessing_obj
+        except Exception as e:
+            raise ConcreteException(e,sys) from e
+
+    @staticmethod
+    def get_transformed_feature_columns(preprocessing_obj: ColumnTransformer) -> list:
+        """
+        Input column of each transformed feature. Pipelines output one feature per input column,
+        less the columns their unnecessary feature removers drop.
+        """
+        try:
+            feature_columns = []
+            for name, transformer, columns in preprocessing_obj.transformers_:
+                if isinstance(transformer, str) and transformer == "drop":
+                    continue
+                droppable_columns = [column for _, step in getattr(transformer, "steps", [])
+                                     if isinstance(step, UnnecessaryFeatureRemover) for column in step.droppable_columns]
+                output_columns = [column for column in columns if column not in droppable_columns]
+                output_slice = preprocessing_obj.output_indices_[name]
+                if len(output_columns) != output_slice.stop - output_slice.start:
+                    raise Exception(f"Transformer [{name}] does not output one feature per input column")
+                feature_columns.extend(output_columns)
+            return feature_columns
+        except Exception as e:
+            raise ConcreteException(e,sys) from e
+
+    @staticmethod
+    def set_outlier_quartiles(preprocessing_obj: ColumnTransformer, file_path: str = None):
+        """
+        Makes the outlier removers of preprocessing_obj use the quartiles of the whole file instead
+        of those of each chunk, reading one column at a time. file_path None resets them.
+        """
+        try:
+            for outlier_remover in DataTransformation.get_outlier_removers(preprocessing_obj):
+                outlier_remover.quartiles = None if file_path is None else \
+                    {column: tuple(pd.read_csv(file_path, usecols=[column])[column].quantile([0.25, 0.75]))
+                     for column in outlier_remover.continuous_features}
+        except Exception as e:
+            raise ConcreteException(e,sys) from e
+
+    def transform_in_chunks(self, preprocessing_obj, file_path: str, target_column: str,
+                            transformed_file_path: str, chunk_rows: int) -> np.ndarray:
+        """
+        Transforms a csv file chunk by chunk into a memory mapped array saved in npy format at
+        transformed_file_path, which load_numpy_array_data reads like the in-memory output.
+        """
+        try:
+            row_count = sum(len(chunk) for chunk in pd.read_csv(file_path, usecols=[0], chunksize=chunk_rows))
+            chunk_transformer = copy.deepcopy(preprocessing_obj)
+            DataTransformation.set_outlier_quartiles(chunk_transformer, file_path)
+            transformed_arr, row = None, 0
+            for chunk in pd.read_csv(file_path, chunksize=chunk_rows):
+                chunk_arr = np.c_[chunk_transformer.transform(chunk.drop(target_column, axis=1)),
+                                  np.array(chunk[[target_column]])]
+                if transformed_arr is None:
+                    os.makedirs(os.path.dirname(transformed_file_path), exist_ok=True)
+                    transformed_arr = np.lib.format.open_memmap(transformed_file_path, mode="w+", dtype=chunk_arr.dtype,
+                                                                shape=(row_count, chunk_arr.shape[1]))
+                transformed_arr[row:row + len(chunk_arr)] = chunk_arr
+                row += len(chunk_arr)
+            if transformed_arr is None:
+                raise Exception(f"[{file_path}] has no rows to transform.")
+            transformed_arr.flush()
+            logging.info(f"Transformed {row} rows of [{file_path}] in chunks of {chunk_rows} rows to [{transformed_file_path}]")
+            if self.artifact_store.blob_store is not None:
+                self.artifact_store.blob_store.put_file(transformed_file_path)
+            self.artifact_store.put(transformed_file_path, transformed_arr)
+            return transformed_arr
         except Exception as e:
             raise ConcreteException(e,sys) from e
 
     def get_transformer_object(self)-> ColumnTransformer:
         try:
             schema_file_path = self.data_validation_artifact.schema_file_path
-            schema = read_yaml_file(schema_file_path)
+            schema = load_config_file(schema_file_path, required_keys=SCHEMA_REQUIRED_KEYS)
             numerical_columns = schema[SCHEMA_NUMERICAL_COLUMNS_KEY]
             categorical_columns = schema[SCHEMA_CATEGORICAL_COLUMNS_KEY]
             droppable_columns = self.data_validation_artifact.droppable_columns
@@ -97,42 +226,77 @@ class DataTransformation:
 
     def initiate_data_transformation(self)-> DataTransformationArtifact:
         try:
-            logging.info("Obtaining preprocessing object")
-            preprocessing_obj = self.get_transformer_object()
             schema_file_path = self.data_validation_artifact.schema_file_path
-            schema = read_yaml_file(schema_file_path)
-            logging.info("Obtaining train and test dataset")
-            train_df = load_data(self.data_ingestion_artifact.train_file_path, schema_file_path)
-            test_df = load_data(self.data_ingestion_artifact.test_file_path, schema_file_path)
+            preprocessor_store = PreprocessorStore(store_dir=self.data_transformation_config.preprocessor_store_dir)
+            preprocessor_key = PreprocessorStore.get_key(schema_file_path=schema_file_path,
+                                                         droppable_columns=self.data_validation_artifact.droppable_columns,
+                                                         train_file_path=self.data_ingestion_artifact.train_file_path)
+            logging.info("Obtaining preprocessing object")
+            preprocessing_obj = preprocessor_store.get(preprocessor_key)
+            is_preprocessing_obj_fitted = preprocessing_obj is not None
+            if not is_preprocessing_obj_fitted:
+                preprocessing_obj = self.get_transformer_object()
+            schema = load_config_file(schema_file_path, required_keys=SCHEMA_REQUIRED_KEYS)
             target_column = schema[SCHEMA_TARGET_COLUMN_KEY][0]
-            logging.info("Splitting the datasets into input and output features")
-            X_train = train_df.drop(target_column, axis=1)
-            y_train = train_df[[target_column]]
-            X_test = test_df.drop(target_column, axis=1)
-            y_test = test_df[[target_column]]
-            logging.info("Transforming input features using preprocessing object file.")
-            X_train_arr = preprocessing_obj.fit_transform(X_train)
-            X_test_arr = preprocessing_obj.transform(X_test)
-            logging.info("Concatenating transformed input features with output features")
-            train_arr = np.c_[X_train_arr, np.array(y_train)]
-            test_arr = np.c_[X_test_arr, np.array(y_test)]
-            logging.info("Saving transformed train and test datasets")
             transformed_test_dir = self.data_transformation_config.transformed_test_dir
             transformed_train_dir = self.data_transformation_config.transformed_train_dir
+            #both processing modes write npy files: np.save in memory, a memory mapped npy array in chunks
             transformed_test_file_path = os.path.join(transformed_test_dir,
-                                                      os.path.basename(self.data_ingestion_artifact.test_file_path).replace('.csv','.npz'))
+                                                      os.path.basename(self.data_ingestion_artifact.test_file_path).replace('.csv','.npy'))
             transformed_train_file_path = os.path.join(transformed_train_dir,
-                                                      os.path.basename(self.data_ingestion_artifact.train_file_path).replace('.csv','.npz'))       
-            save_numpy_array_data(file_path=transformed_train_file_path,array=train_arr)
-            save_numpy_array_data(file_path=transformed_test_file_path,array=test_arr)
-            preprocessed_object_file_path = self.data_transformation_config.preprocessed_object_file_path
-            logging.info("Saving preprocesing object file")
-            save_object(preprocessed_object_file_path, preprocessing_obj)
+                                                      os.path.basename(self.data_ingestion_artifact.train_file_path).replace('.csv','.npy'))
+            processing_mode, chunk_rows = self.get_processing_mode(schema)
+            if processing_mode == PROCESSING_MODE_CHUNKED:
+                if not is_preprocessing_obj_fitted:
+                    logging.info("Fitting preprocessing object on a sample of the train dataset")
+                    train_sample_df = MemoryBudget.read_csv_sample(self.data_ingestion_artifact.train_file_path,
+                                                                   max_rows=chunk_rows, chunk_rows=chunk_rows)
+                    DataTransformation.set_outlier_quartiles(preprocessing_obj, self.data_ingestion_artifact.train_file_path)
+                    preprocessing_obj.fit(train_sample_df.drop(target_column, axis=1))
+                    DataTransformation.set_outlier_quartiles(preprocessing_obj)
+                logging.info("Transforming train and test datasets in chunks")
+                for file_path, transformed_file_path in [(self.data_ingestion_artifact.train_file_path, transformed_train_file_path),
+                                                         (self.data_ingestion_artifact.test_file_path, transformed_test_file_path)]:
+                    self.transform_in_chunks(preprocessing_obj, file_path=file_path, target_column=target_column,
+                                             transformed_file_path=transformed_file_path, chunk_rows=chunk_rows)
+            else:
+                logging.info("Obtaining train and test dataset")
+                data_loader = lambda file_path: load_data(file_path, schema_file_path)
+                train_df = self.artifact_store.get(self.data_ingestion_artifact.train_file_path, data_loader)
+                test_df = self.artifact_store.get(self.data_ingestion_artifact.test_file_path, data_loader)
+                logging.info("Splitting the datasets into input and output features")
+                X_train = train_df.drop(target_column, axis=1)
+                y_train = train_df[[target_column]]
+                X_test = test_df.drop(target_column, axis=1)
+                y_test = test_df[[target_column]]
+                logging.info("Transforming input features using preprocessing object file.")
+                if is_preprocessing_obj_fitted:
+                    X_train_arr = preprocessing_obj.transform(X_train)
+                else:
+                    X_train_arr = preprocessing_obj.fit_transform(X_train)
+                X_test_arr = preprocessing_obj.transform(X_test)
+                logging.info("Concatenating transformed input features with output features")
+                train_arr = np.c_[X_train_arr, np.array(y_train)]
+                test_arr = np.c_[X_test_arr, np.array(y_test)]
+                logging.info("Saving transformed train and test datasets")
+                self.artifact_store.put(transformed_train_file_path, train_arr, save_numpy_array_data)
+                self.artifact_store.put(transformed_test_file_path, test_arr, save_numpy_array_data)
+            preprocessed_object_file_path = preprocessor_store.get_file_path(preprocessor_key)
+            if is_preprocessing_obj_fitted and preprocessed_object_file_path is not None and os.path.exists(preprocessed_object_file_path):
+                logging.info(f"Fitted preprocessing object already saved at: [{preprocessed_object_file_path}]")
+            else:
+                preprocessed_object_file_path = self.data_transformation_config.preprocessed_object_file_path
+                logging.info("Saving preprocesing object file")
+                self.artifact_store.put(preprocessed_object_file_path, preprocessing_obj, save_object)
+                preprocessor_store.put(preprocessor_key, preprocessing_obj, preprocessed_object_file_path)
             data_transformation_artifact = DataTransformationArtifact(transformed_test_file_path=transformed_test_file_path,
                                                                     transformed_train_file_path=transformed_train_file_path,
                                                                     preprocessed_object_file_path=preprocessed_object_file_path,
+                                                                    preprocessing_object=preprocessing_obj,
+                                                                    preprocessor_key=preprocessor_key,
                                                                     is_transformed=True,
-                                                                    message="Data Transformation completed successfully.")
+                                                                    message="Data Transformation completed successfully.",
+                                                                    processing_mode=processing_mode)
             logging.info(f"Data Transformation Artifact: {data_transformation_artifact}")
             return data_transformation_artifact
         except Exception as e:
@@ -5,30 +5,88 @@ from concrete.constants import *
 from concrete.exception import ConcreteException
 from concrete.entity.config_entity import DataInjestionConfig, DataValidationConfig
 from concrete.entity.artifact_entity import DataIngestionArtifact, DataValidationArtifact
-from concrete.util.util import read_yaml_file, get_previous_timestamp_dir
-from evidently.model_profile import Profile
-from evidently.model_profile.sections import DataDriftProfileSection
-from evidently.dashboard import Dashboard
-from evidently.dashboard.tabs import DataDriftTab
+from concrete.util.util import get_previous_timestamp_dir, save_gzip_copy
+from concrete.config.config_loader import load_config_file, SCHEMA_REQUIRED_KEYS
+from concrete.entity.artifact_store import ArtifactStore
+from concrete.entity.memory_budget import MemoryBudget
 from concrete.logger import logging
 import numpy as np
 import json
 
+#train, test and previous train data frames plus the copies drift and correlation analysis make
+VALIDATION_WORKING_SET_FACTOR = 2
+
 class DataValidation:
     def __init__(self,
                 data_validation_config: DataValidationConfig,
-                data_ingestion_artifact: DataIngestionArtifact) -> None:
+                data_ingestion_artifact: DataIngestionArtifact,
+                artifact_store: ArtifactStore = None) -> None:
         try:
             logging.info(f"{'='*20} Data Validation Log Started {'='*20}")
             self.data_validation_config = data_validation_config
             self.data_ingestion_artifact = data_ingestion_artifact
+            self.artifact_store = ArtifactStore(persist_in_background=False) if artifact_store is None else artifact_store
             self.train_file_path = self.data_ingestion_artifact.train_file_path
             self.test_file_path = self.data_ingestion_artifact.test_file_path
-            self.train_df = pd.read_csv(self.train_file_path)
-            self.test_df = pd.read_csv(self.test_file_path)
-            self.schema = read_yaml_file(self.data_validation_config.schema_file_path)
+            self.schema = load_config_file(self.data_validation_config.schema_file_path, required_keys=SCHEMA_REQUIRED_KEYS)
             self.previous_train_file_path = self.data_ingestion_artifact.previous_train_file_path
-            self.previous_train_df = pd.read_csv(self.previous_train_file_path)
+            self.memory_budget = MemoryBudget(stage_name="data_validation", budget_mb=data_validation_config.memory_budget_mb)
+            self.processing_mode, self.chunk_rows = self.get_processing_mode()
+            self.train_df = self.load_dataset(self.train_file_path)
+            self.test_df = self.load_dataset(self.test_file_path)
+            self.previous_train_df = self.load_dataset(self.previous_train_file_path)
+        except Exception as e:
+            raise ConcreteException(e,sys) from e
+
+    def get_processing_mode(self) -> tuple:
+        """
+        Processing mode and rows per chunk for the train, test and previous train files.
+        """
+        try:
+            schema_columns = self.schema[SCHEMA_COLUMNS_KEY]
+            file_paths = [self.train_file_path, self.test_file_path, self.previous_train_file_path]
+            estimated_bytes = sum(self.memory_budget.estimate_csv_bytes(file_path, schema_columns) for file_path in file_paths)
+            processing_mode = self.memory_budget.choose_processing_mode(estimated_bytes,
+                                                                        working_set_factor=VALIDATION_WORKING_SET_FACTOR)
+            #the budget is shared by the three files
+            chunk_rows = self.memory_budget.get_chunk_rows(MemoryBudget.get_row_bytes(schema_columns),
+                                                           working_set_factor=VALIDATION_WORKING_SET_FACTOR * len(file_paths))
+            return processing_mode, chunk_rows
+        except Exception as e:
+            raise ConcreteException(e,sys) from e
+
+    def load_dataset(self, file_path: str) -> pd.DataFrame:
+        """
+        The whole dataset in memory mode. In chunked mode a sample that fits the budget, drift and
+        correlation are then computed on the samples and the schema is checked chunk by chunk.
+        """
+        try:
+            if self.processing_mode == PROCESSING_MODE_IN_MEMORY:
+                return self.artifact_store.get(file_path, pd.read_csv)
+            return MemoryBudget.read_csv_sample(file_path, max_rows=self.chunk_rows, chunk_rows=self.chunk_rows)
+        except Exception as e:
+            raise ConcreteException(e,sys) from e
+
+    def get_dataset_summary(self, file_path: str, df: pd.DataFrame) -> tuple:
+        """
+        Columns, dtypes and distinct values of the domain value columns of a dataset. In chunked
+        mode the file is read chunk by chunk and the dtypes of the chunks are combined.
+        """
+        try:
+            domain_columns = list(self.schema[SCHEMA_DOMAIN_VALUE_KEY].keys())
+            if self.processing_mode == PROCESSING_MODE_IN_MEMORY:
+                return list(df.columns), df.dtypes.to_dict(), {column: set(df[column].unique())
+                                                               for column in domain_columns if column in df.columns}
+            columns, dtypes, unique_values = [], dict(), dict()
+            for chunk in pd.read_csv(file_path, chunksize=self.chunk_rows):
+                columns = list(chunk.columns)
+                for column, dtype in chunk.dtypes.items():
+                    previous_dtype = dtypes.get(column, dtype)
+                    dtypes[column] = dtype if previous_dtype == dtype else np.result_type(previous_dtype, dtype)
+                for column in domain_columns:
+                    if column in chunk.columns:
+                        unique_values.setdefault(column, set()).update(chunk[column].unique())
+            return columns, dtypes, unique_values
         except Exception as e:
             raise ConcreteException(e,sys) from e
 
@@ -55,33 +113,35 @@ class DataValidation:
             schema_domain_value = self.schema[SCHEMA_DOMAIN_VALUE_KEY]
             schema_numerical_columns = self.schema[SCHEMA_NUMERICAL_COLUMNS_KEY]
             schema_categorical_columns = self.schema[SCHEMA_CATEGORICAL_COLUMNS_KEY]
+            train_columns, train_dtypes, train_unique_values = self.get_dataset_summary(self.train_file_path, self.train_df)
+            test_columns, _, test_unique_values = self.get_dataset_summary(self.test_file_path, self.test_df)
             logging.info("Checking no. of columns in train and test dataset")
-            check_no_of_columns = len(schema_columns) == len(self.train_df.columns) and len(schema_columns) == len(self.test_df.columns)
+            check_no_of_columns = len(schema_columns) == len(train_columns) and len(schema_columns) == len(test_columns)
             if not check_no_of_columns:
                 raise Exception("Train and/or test dataset does not have columns given in schema.")
             else:
                 logging.info('No. of columns are same in train and test dataset and in schema file.')
                 logging.info("Checking columns names")
                 for column in schema_columns.keys():
-                    if column not in self.train_df.columns:
+                    if column not in train_columns:
                         raise Exception(f"Train dataset does not have column '{column}' required in schema file")
-                    if column not in self.test_df.columns:
+                    if column not in test_columns:
                         raise Exception(f"Test dataset does not have column '{column}' required in schema file")
                 else:
                     logging.info(f"Train and test dataset have column required in schema file")
             logging.info("Checking the datatypes of all columns")
             for column in schema_columns.keys():
-                if self.train_df[column].dtype == schema_columns[column]:
+                if train_dtypes[column] == schema_columns[column]:
                     logging.info(f"Column '{column}' has correct datatype.")
                 else:
                     raise Exception(f"Column '{column}' does not have correct datatype.")
             logging.info("Checking the domain values of categorical columns")
             for column, cats in schema_domain_value.items():
                 logging.info(f"Checking domain values of column '{column}'")
-                for cat in self.train_df[column].unique():
+                for cat in train_unique_values[column]:
                     if cat not in schema_domain_value[column]:
                         raise Exception(f"category '{cat}' is an unwanted value in column '{column}' of test dataset")
-                for cat in self.test_df[column].unique():
+                for cat in test_unique_values[column]:
                     if cat not in schema_domain_value[column]:
                         raise Exception(f"category '{cat}' is an unwanted value in column '{column}' of test dataset")
                 else:
@@ -117,6 +177,9 @@ class DataValidation:
 
     def get_and_save_data_drift_report(self):
         try:
+            #evidently is only imported when a drift report is built
+            from evidently.model_profile import Profile
+            from evidently.model_profile.sections import DataDriftProfileSection
             profile = Profile(sections = [DataDriftProfileSection()])
             profile.calculate(self.train_df, self.previous_train_df)
             report = json.loads(profile.json())
@@ -131,9 +194,12 @@ class DataValidation:
 
     def save_data_drift_report_page(self):
         try:
+            from evidently.dashboard import Dashboard
+            from evidently.dashboard.tabs import DataDriftTab
             dashboard = Dashboard(tabs= [DataDriftTab()])
             dashboard.calculate(self.train_df, self.previous_train_df)
             dashboard.save(self.data_validation_config.report_page_file_path)
+            save_gzip_copy(file_path=self.data_validation_config.report_page_file_path)
         except Exception as e:
             raise ConcreteException(e,sys) from e
 
@@ -145,22 +211,30 @@ class DataValidation:
         except Exception as e:
             raise ConcreteException(e,sys) from e
 
-    def initiate_data_validation(self)-> DataValidationArtifact:
+    def get_data_validation_artifact(self, validation_status: bool, droppable_columns: list)-> DataValidationArtifact:
         try:
-            self.do_train_test_files_exist()
-            validation_status =self.validate_dataset_schema()
-            self.does_data_drift_occur()
-            droppable_columns = self.check_for_correlation()
             data_validation_artifact = DataValidationArtifact(schema_file_path=self.data_validation_config.schema_file_path,
                                                             droppable_columns= droppable_columns,
                                                             report_file_path=self.data_validation_config.report_page_file_path,
                                                             report_page_file_path=self.data_validation_config.report_page_file_path,
                                                             is_validated=validation_status,
-                                                            message="Data Validation performed sucessfully.")
+                                                            message="Data Validation performed sucessfully.",
+                                                            processing_mode=self.processing_mode)
             logging.info(f"Data Validation Artifact : {data_validation_artifact}")
             return data_validation_artifact
         except Exception as e:
             raise ConcreteException(e,sys) from e
 
+    def initiate_data_validation(self)-> DataValidationArtifact:
+        try:
+            self.do_train_test_files_exist()
+            validation_status =self.validate_dataset_schema()
+            self.does_data_drift_occur()
+            droppable_columns = self.check_for_correlation()
+            return self.get_data_validation_artifact(validation_status=validation_status,
+                                                     droppable_columns=droppable_columns)
+        except Exception as e:
+            raise ConcreteException(e,sys) from e
+
     def __del__(self):
         logging.info(f"{'='*20}Data Validation log ended{'='*20} \n\n")
\ No newline at end of file
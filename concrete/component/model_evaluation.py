@@ -1,42 +1,71 @@
 import os, sys
+import json
+import hashlib
 import numpy as np
+from collections import namedtuple
 from concrete.entity.config_entity import ModelEvaluationConfig
-from concrete.entity.artifact_entity import DataIngestionArtifact, DataValidationArtifact, ModelTrainerArtifact, ModelEvaluationArtifact
+from concrete.entity.artifact_entity import DataIngestionArtifact, DataValidationArtifact, DataTransformationArtifact, ModelTrainerArtifact, ModelEvaluationArtifact
 from concrete.exception import ConcreteException
 from concrete.logger import logging
-from concrete.util.util import load_data, load_object, read_yaml_file, write_yaml_file
-from concrete.entity.model_factory import evaluate_regression_model
+from concrete.util.util import load_data, load_split_object, read_yaml_file, write_yaml_file, load_numpy_array_data, get_file_hash, \
+    open_artifact_file
+from concrete.config.config_loader import load_config_file, SCHEMA_REQUIRED_KEYS
+from concrete.entity.model_factory import evaluate_regression_predictions
+from concrete.entity.evaluation_engine import BootstrapEvaluator
+from concrete.entity.artifact_store import ArtifactStore
 from concrete.constants import *
 
 
+ModelPredictions = namedtuple("ModelPredictions", ["model_path", "train_prediction", "test_prediction"])
+
+
+def save_model_predictions(file_path: str, model_predictions: ModelPredictions, blob_store=None):
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    with open_artifact_file(file_path, blob_store) as file_obj:
+        np.savez(file_obj,
+                 train_prediction=model_predictions.train_prediction,
+                 test_prediction=model_predictions.test_prediction)
+
+
 class ModelEvaluation:
     def __init__(self,
                  model_evaluation_config: ModelEvaluationConfig,
                  data_ingestion_artifact: DataIngestionArtifact,
                  data_validation_artifact: DataValidationArtifact,
-                 model_trainer_artifact: ModelTrainerArtifact) -> None:
+                 model_trainer_artifact: ModelTrainerArtifact,
+                 artifact_store: ArtifactStore = None,
+                 data_transformation_artifact: DataTransformationArtifact = None) -> None:
         try:
             logging.info(f"{'>>' * 30}Model Evaluation log started.{'<<' * 30} ")
             self.model_evaluation_config = model_evaluation_config
             self.data_ingestion_artifact = data_ingestion_artifact
             self.data_validation_artifact = data_validation_artifact
             self.model_trainer_artifact = model_trainer_artifact
+            self.data_transformation_artifact = data_transformation_artifact
+            self.artifact_store = ArtifactStore(persist_in_background=False) if artifact_store is None else artifact_store
         except Exception as e:
             raise ConcreteException(e,sys) from e
 
-    def get_best_model(self):
+    def get_best_model_path(self):
         try:
-            model = None
             model_evaluation_file_path = self.model_evaluation_config.model_evaluation_file_path
             if not os.path.exists(model_evaluation_file_path):
                 write_yaml_file(file_path=model_evaluation_file_path)
-                return model
+                return None
             model_eval_file_content = read_yaml_file(file_path=model_evaluation_file_path)
             model_eval_file_content = dict() if model_eval_file_content is None else model_eval_file_content
             if BEST_MODEL_KEY not in model_eval_file_content:
-                return model
-            model = load_object(file_path=model_eval_file_content[BEST_MODEL_KEY][MODEL_PATH_KEY])
-            return model
+                return None
+            return model_eval_file_content[BEST_MODEL_KEY][MODEL_PATH_KEY]
+        except Exception as e:
+            raise ConcreteException(e,sys) from e
+
+    def get_best_model(self):
+        try:
+            model_path = self.get_best_model_path()
+            if model_path is None:
+                return None
+            return load_split_object(file_path=model_path)
         except Exception as e:
             raise ConcreteException(e,sys) from e
 
@@ -52,6 +81,9 @@ class ModelEvaluation:
             eval_result = {
                 BEST_MODEL_KEY: {
                     MODEL_PATH_KEY: model_evaluation_artifact.evaluated_model_path,
+                    TRAIN_FILE_PATH_KEY: self.data_ingestion_artifact.train_file_path,
+                    RETRAIN_STRATEGY_KEY: self.model_trainer_artifact.retrain_strategy,
+                    NEW_ROW_COUNT_KEY: int(self.model_trainer_artifact.new_row_count),
                 }
             }
             if previous_best_model is not None:
@@ -67,43 +99,172 @@ class ModelEvaluation:
         except Exception as e:
             raise ConcreteException(e,sys) from e
 
-    def initiate_model_evaluation(self)-> ModelEvaluationArtifact:
+    def get_dataset_fingerprint(self) -> str:
+        """
+        Hash identifying the train and test datasets and the schema they are read with.
+        """
+        try:
+            fingerprint_content = {
+                "train_data": get_file_hash(self.data_ingestion_artifact.train_file_path),
+                "test_data": get_file_hash(self.data_ingestion_artifact.test_file_path),
+                "schema": get_file_hash(self.data_validation_artifact.schema_file_path)
+            }
+            return hashlib.sha256(json.dumps(fingerprint_content, sort_keys=True).encode()).hexdigest()
+        except Exception as e:
+            raise ConcreteException(e,sys) from e
+
+    @staticmethod
+    def get_prediction_cache_file_path(model_path: str, dataset_fingerprint: str) -> str:
+        """
+        Predictions of a model are cached next to the model file, one file per dataset fingerprint.
+        """
+        return os.path.join(os.path.dirname(model_path), EVALUATION_CACHE_DIR_NAME, f"{dataset_fingerprint}.npz")
+
+    def get_input_data(self):
+        """
+        Returns train input features, train target, test input features and test target
+        read from the ingested csv files.
+        """
         try:
-            trained_model_file_path = self.model_trainer_artifact.trained_model_file_path
-            trained_model_object = load_object(file_path=trained_model_file_path)
             train_file_path = self.data_ingestion_artifact.train_file_path
             test_file_path = self.data_ingestion_artifact.test_file_path
             schema_file_path = self.data_validation_artifact.schema_file_path
-            train_dataframe = load_data(file_path=train_file_path,
-                                                           schema_file_path=schema_file_path)
-            test_dataframe = load_data(file_path=test_file_path,
-                                                          schema_file_path=schema_file_path)
-            schema_content = read_yaml_file(file_path=schema_file_path)
+            data_loader = lambda file_path: load_data(file_path=file_path, schema_file_path=schema_file_path)
+            train_dataframe = self.artifact_store.get(train_file_path, data_loader)
+            test_dataframe = self.artifact_store.get(test_file_path, data_loader)
+            schema_content = load_config_file(schema_file_path, required_keys=SCHEMA_REQUIRED_KEYS)
             target_column_name = schema_content[SCHEMA_TARGET_COLUMN_KEY]
             logging.info(f"Converting target column into numpy array.")
-            train_target_arr = np.array(train_dataframe[target_column_name])
-            test_target_arr = np.array(test_dataframe[target_column_name])
-            logging.info(f"Conversion completed target column into numpy array.")
+            train_target_arr = np.array(train_dataframe[target_column_name]).ravel()
+            test_target_arr = np.array(test_dataframe[target_column_name]).ravel()
             logging.info(f"Dropping target column from the dataframe.")
-            train_dataframe.drop(target_column_name, axis=1, inplace=True)
-            test_dataframe.drop(target_column_name, axis=1, inplace=True)
-            logging.info(f"Dropping target column from the dataframe completed.")
-            model = self.get_best_model()
-            if model is None:
+            train_dataframe = train_dataframe.drop(target_column_name, axis=1)
+            test_dataframe = test_dataframe.drop(target_column_name, axis=1)
+            return train_dataframe, train_target_arr, test_dataframe, test_target_arr
+        except Exception as e:
+            raise ConcreteException(e,sys) from e
+
+    def get_transformed_data(self):
+        """
+        Returns train input features, train target, test input features and test target
+        from the arrays produced by data transformation, None if they are not available.
+        """
+        try:
+            if self.data_transformation_artifact is None:
+                return None
+            train_array = self.artifact_store.get(self.data_transformation_artifact.transformed_train_file_path,
+                                                  load_numpy_array_data)
+            test_array = self.artifact_store.get(self.data_transformation_artifact.transformed_test_file_path,
+                                                 load_numpy_array_data)
+            return train_array[:,:-1], train_array[:,-1], test_array[:,:-1], test_array[:,-1]
+        except Exception as e:
+            raise ConcreteException(e,sys) from e
+
+    def predict_with_model(self, model) -> tuple:
+        """
+        Returns train and test predictions of an EstimatorModel. When the model was built on
+        the same fitted preprocessor as the current run, its estimator is applied to the
+        transformed arrays of the run instead of transforming the raw data again.
+        """
+        try:
+            transformed_data = self.get_transformed_data()
+            preprocessor_key = getattr(model, "preprocessor_key", None)
+            if transformed_data is not None and preprocessor_key is not None \
+                    and preprocessor_key == self.data_transformation_artifact.preprocessor_key:
+                x_train, _, x_test, _ = transformed_data
+                logging.info(f"Scoring [{model}] on the shared transformed dataset.")
+                return model.trained_model_object.predict(x_train), model.trained_model_object.predict(x_test)
+            x_train, _, x_test, _ = self.get_input_data()
+            logging.info(f"Scoring [{model}] on the raw dataset.")
+            return model.predict(x_train), model.predict(x_test)
+        except Exception as e:
+            raise ConcreteException(e,sys) from e
+
+    def get_best_model_predictions(self, best_model=None):
+        """
+        Returns ModelPredictions of the currently accepted model on the current datasets, None if
+        no model has been accepted yet. Predictions are read from the cache kept next to the model
+        and computed, then cached, only when the datasets have not been scored before.
+        best_model: accepted model if it has already been loaded
+        """
+        try:
+            model_path = self.get_best_model_path()
+            if model_path is None:
+                return None
+            cache_file_path = ModelEvaluation.get_prediction_cache_file_path(model_path=model_path,
+                                                                             dataset_fingerprint=self.get_dataset_fingerprint())
+            if os.path.exists(cache_file_path):
+                logging.info(f"Reusing cached predictions of accepted model: [{cache_file_path}]")
+                with np.load(cache_file_path) as cached_predictions:
+                    return ModelPredictions(model_path=model_path,
+                                            train_prediction=cached_predictions["train_prediction"],
+                                            test_prediction=cached_predictions["test_prediction"])
+            model = load_split_object(file_path=model_path) if best_model is None else best_model
+            train_prediction, test_prediction = self.predict_with_model(model)
+            model_predictions = ModelPredictions(model_path=model_path,
+                                                 train_prediction=train_prediction,
+                                                 test_prediction=test_prediction)
+            self.artifact_store.put(cache_file_path, model_predictions, save_model_predictions)
+            return model_predictions
+        except Exception as e:
+            raise ConcreteException(e,sys) from e
+
+    def is_significantly_better(self, best_model_test_prediction: np.ndarray,
+                                trained_model_test_prediction: np.ndarray,
+                                test_target_arr: np.ndarray) -> bool:
+        """
+        Paired bootstrap check that the trained model improves the test r2 score of the accepted
+        model at the configured confidence level. Always true when bootstrapping is disabled.
+        """
+        try:
+            n_resamples = self.model_evaluation_config.bootstrap_resamples
+            if not n_resamples:
+                return True
+            bootstrap_evaluator = BootstrapEvaluator(y_true=test_target_arr,
+                                                     n_resamples=n_resamples,
+                                                     confidence_level=self.model_evaluation_config.confidence_level)
+            logging.info(f"Accepted model bootstrap test metrics: {bootstrap_evaluator.evaluate(best_model_test_prediction)}")
+            logging.info(f"Trained model bootstrap test metrics: {bootstrap_evaluator.evaluate(trained_model_test_prediction)}")
+            metric_difference = bootstrap_evaluator.compare(baseline_y_pred=best_model_test_prediction,
+                                                            candidate_y_pred=trained_model_test_prediction)
+            return metric_difference.r2.lower > 0
+        except Exception as e:
+            raise ConcreteException(e,sys) from e
+
+    def initiate_model_evaluation(self, best_model_predictions: ModelPredictions = None)-> ModelEvaluationArtifact:
+        """
+        best_model_predictions: ModelPredictions of the accepted model if already computed
+        """
+        try:
+            trained_model_file_path = self.model_trainer_artifact.trained_model_file_path
+            if best_model_predictions is None:
+                best_model_predictions = self.get_best_model_predictions()
+            if best_model_predictions is None:
                 logging.info("Not found any existing model. Hence accepting trained model")
                 model_evaluation_artifact = ModelEvaluationArtifact(evaluated_model_path=trained_model_file_path,
                                                                     is_model_accepted=True)
                 self.update_evaluation_report(model_evaluation_artifact)
                 logging.info(f"Model Evaluation Artifact: {model_evaluation_artifact}")
                 return model_evaluation_artifact
-            model_list = [model, trained_model_object]
-            metric_info_artifact = evaluate_regression_model(model_list=model_list,
-                                                               X_train=train_dataframe,
-                                                               y_train=train_target_arr,
-                                                               X_test=test_dataframe,
-                                                               y_test=test_target_arr,
-                                                               base_accuracy=self.model_trainer_artifact.model_accuracy,
-                                                               )
+            trained_model_object = self.artifact_store.get(trained_model_file_path, load_split_object)
+            transformed_data = self.get_transformed_data()
+            if transformed_data is None:
+                _, train_target_arr, _, test_target_arr = self.get_input_data()
+            else:
+                _, train_target_arr, _, test_target_arr = transformed_data
+            train_prediction, test_prediction = self.predict_with_model(trained_model_object)
+            trained_model_predictions = ModelPredictions(model_path=trained_model_file_path,
+                                                         train_prediction=train_prediction,
+                                                         test_prediction=test_prediction)
+            model_list = [best_model_predictions.model_path, trained_model_object]
+            prediction_list = [(best_model_predictions.train_prediction, best_model_predictions.test_prediction),
+                               (trained_model_predictions.train_prediction, trained_model_predictions.test_prediction)]
+            metric_info_artifact = evaluate_regression_predictions(model_list=model_list,
+                                                                   prediction_list=prediction_list,
+                                                                   y_train=train_target_arr,
+                                                                   y_test=test_target_arr,
+                                                                   base_accuracy=self.model_trainer_artifact.model_accuracy,
+                                                                   )
             logging.info(f"Model evaluation completed. model metric artifact: {metric_info_artifact}")
             if metric_info_artifact is None:
                 response = ModelEvaluationArtifact(is_model_accepted=False,
@@ -111,14 +272,21 @@ class ModelEvaluation:
                                                    )
                 logging.info(f"Model Evaluation Artifact: {response}")
                 return response
-            if metric_info_artifact.index_number == 1:
+            is_trained_model_better = metric_info_artifact.index_number == 1 and \
+                self.is_significantly_better(best_model_test_prediction=best_model_predictions.test_prediction,
+                                             trained_model_test_prediction=trained_model_predictions.test_prediction,
+                                             test_target_arr=test_target_arr)
+            if is_trained_model_better:
                 model_evaluation_artifact = ModelEvaluationArtifact(evaluated_model_path=trained_model_file_path,
                                                                     is_model_accepted=True)
                 self.update_evaluation_report(model_evaluation_artifact)
+                cache_file_path = ModelEvaluation.get_prediction_cache_file_path(model_path=trained_model_file_path,
+                                                                                 dataset_fingerprint=self.get_dataset_fingerprint())
+                self.artifact_store.put(cache_file_path, trained_model_predictions, save_model_predictions)
                 logging.info(f"Model accepted. Model eval artifact {model_evaluation_artifact} created")
 
             else:
-                logging.info("Trained model is no better than existing model hence not accepting trained model")
+                logging.info("Trained model is not significantly better than existing model hence not accepting trained model")
                 model_evaluation_artifact = ModelEvaluationArtifact(evaluated_model_path=trained_model_file_path,
                                                                     is_model_accepted=False)
             return model_evaluation_artifact
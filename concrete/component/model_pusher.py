@@ -1,22 +1,86 @@
 import os,sys
-import shutil
-from concrete.entity.artifact_entity import ModelEvaluationArtifact, ModelPusherArtifact
+import tarfile
+from concrete.entity.artifact_entity import ModelEvaluationArtifact, ModelPusherArtifact, ModelTrainerArtifact, \
+    DataIngestionArtifact, DataValidationArtifact
 from concrete.entity.config_entity import ModelPusherConfig
 from concrete.exception import ConcreteException
 from concrete.logger import logging
+from concrete.entity.artifact_store import ArtifactStore
+from concrete.entity.model_registry import ModelRegistry
+from concrete.entity.memory_budget import MemoryBudget
+from concrete.entity.sensitivity_analysis import SensitivityAnalysis
+from concrete.util.util import load_split_object, save_split_object, get_split_object_blob_path
+from concrete.constants import MODEL_ARCHIVE_FILE_EXTENSION, SENSITIVITY_BACKGROUND_ROWS, SENSITIVITY_MAX_BATCH_ROWS
 
 
 
 class ModelPusher:
     def __init__(self, model_pusher_config:ModelPusherConfig,
-                 model_evaluation_artifact:ModelEvaluationArtifact) -> None:
+                 model_evaluation_artifact:ModelEvaluationArtifact,
+                 artifact_store:ArtifactStore = None,
+                 model_trainer_artifact:ModelTrainerArtifact = None,
+                 data_ingestion_artifact:DataIngestionArtifact = None,
+                 data_validation_artifact:DataValidationArtifact = None) -> None:
+        """
+        model_trainer_artifact: metrics of the trained model recorded in the model registry
+        data_ingestion_artifact, data_validation_artifact: training data and schema the sensitivity
+                                                           surfaces of the model are computed with,
+                                                           no surfaces are computed without them
+        """
         try:
             self.model_pusher_config = model_pusher_config
             self.model_evaluation_artifact = model_evaluation_artifact
+            self.model_trainer_artifact = model_trainer_artifact
+            self.data_ingestion_artifact = data_ingestion_artifact
+            self.data_validation_artifact = data_validation_artifact
+            self.artifact_store = ArtifactStore(persist_in_background=False) if artifact_store is None else artifact_store
+        except Exception as e:
+            raise ConcreteException(e, sys) from e
+
+    def archive_model(self, export_model_file_path: str) -> str:
+        """
+        Writes a compressed archive of the exported model files next to them, for archival copies.
+        """
+        try:
+            archive_file_path = f"{os.path.splitext(export_model_file_path)[0]}{MODEL_ARCHIVE_FILE_EXTENSION}"
+            with tarfile.open(archive_file_path, "w:gz") as archive:
+                for file_path in [export_model_file_path, get_split_object_blob_path(export_model_file_path),
+                                  SensitivityAnalysis.get_surfaces_file_path(export_model_file_path)]:
+                    if os.path.exists(file_path):
+                        archive.add(file_path, arcname=os.path.basename(file_path))
+            logging.info(f"Exported model archived at: [{archive_file_path}]")
+            return archive_file_path
+        except Exception as e:
+            raise ConcreteException(e, sys) from e
+
+    def save_sensitivity_surfaces(self, export_model_file_path: str, model) -> str:
+        """
+        Computes the sensitivity surfaces of the exported model on a sample of the training data
+        and saves them next to it, so serving reads them instead of predicting. Returns their
+        file path, None when the training data is not known.
+        """
+        try:
+            if self.data_ingestion_artifact is None or self.data_validation_artifact is None:
+                logging.info("Sensitivity surfaces are not computed, training data is not known.")
+                return None
+            background = MemoryBudget.read_csv_sample(file_path=self.data_ingestion_artifact.train_file_path,
+                                                      max_rows=SENSITIVITY_BACKGROUND_ROWS,
+                                                      chunk_rows=SENSITIVITY_MAX_BATCH_ROWS)
+            sensitivity_analysis = SensitivityAnalysis(model=model,
+                                                       schema_file_path=self.data_validation_artifact.schema_file_path)
+            surfaces = sensitivity_analysis.compute_surfaces(background=background)
+            sensitivity_file_path = SensitivityAnalysis.get_surfaces_file_path(export_model_file_path)
+            SensitivityAnalysis.save_surfaces(file_path=sensitivity_file_path, surfaces=surfaces,
+                                              blob_store=self.artifact_store.blob_store)
+            return sensitivity_file_path
         except Exception as e:
             raise ConcreteException(e, sys) from e
 
     def export_model(self)-> ModelPusherArtifact:
+        """
+        Exports the model in split format: large numpy arrays such as tree node tables go to an
+        uncompressed blob that prediction workers memory map, the rest of the model is pickled.
+        """
         try:
             evaluated_model_file_path = self.model_evaluation_artifact.evaluated_model_path
             export_dir = self.model_pusher_config.export_dir_path
@@ -24,11 +88,24 @@ class ModelPusher:
             export_model_file_path = os.path.join(export_dir, model_file_name)
             logging.info(f"Exporting model file: [{export_model_file_path}]")
             os.makedirs(export_dir, exist_ok=True)
-            shutil.copy(src=evaluated_model_file_path, dst=export_model_file_path)
+            model = self.artifact_store.get(evaluated_model_file_path, load_split_object)
+            save_split_object(file_path=export_model_file_path, obj=model, blob_store=self.artifact_store.blob_store)
+            sensitivity_file_path = self.save_sensitivity_surfaces(export_model_file_path=export_model_file_path, model=model)
+            if self.model_pusher_config.archive_model:
+                self.archive_model(export_model_file_path=export_model_file_path)
             #we can call a function to save model to Azure blob storage/ google cloud strorage / s3 bucket
-            logging.info(f"Trained model: {evaluated_model_file_path} is copied in export dir:[{export_model_file_path}]")
+            metrics = dict()
+            if self.model_trainer_artifact is not None:
+                metrics = {metric_name: getattr(self.model_trainer_artifact, metric_name)
+                           for metric_name in ["train_rmse", "test_rmse", "train_accuracy", "test_accuracy", "model_accuracy"]}
+            ModelRegistry(model_dir=os.path.dirname(export_dir)).register(version=os.path.basename(export_dir),
+                                                                          model_path=export_model_file_path,
+                                                                          metrics=metrics,
+                                                                          source_model_path=evaluated_model_file_path)
+            logging.info(f"Trained model: {evaluated_model_file_path} is exported in export dir:[{export_model_file_path}]")
             model_pusher_artifact = ModelPusherArtifact(is_model_pusher=True,
-                                                        export_model_file_path=export_model_file_path
+                                                        export_model_file_path=export_model_file_path,
+                                                        sensitivity_file_path=sensitivity_file_path
                                                         )
             logging.info(f"Model pusher artifact: [{model_pusher_artifact}]")
             return model_pusher_artifact
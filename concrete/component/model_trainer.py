@@ -1,21 +1,90 @@
 from concrete.exception import ConcreteException
-from concrete.entity.artifact_entity import DataTransformationArtifact, ModelTrainerArtifact
+from concrete.entity.artifact_entity import DataIngestionArtifact, DataTransformationArtifact, DataValidationArtifact, ModelTrainerArtifact
 from concrete.entity.config_entity import ModelTrainerConfig
 from concrete.logger import logging
-from concrete.util.util import load_numpy_array_data, load_object, save_object
+from concrete.util.util import load_numpy_array_data, load_object, save_split_object, load_split_object, load_data, \
+    read_yaml_file
+from concrete.config.config_loader import load_config_file, SCHEMA_REQUIRED_KEYS
 from concrete.entity.model_factory import ModelFactory, GridSearchedBestModel, MetricInfoArtifact, evaluate_regression_model
+from concrete.entity.artifact_store import ArtifactStore
+from concrete.entity.tree_arrays import TreeArrays, BAGGING_ESTIMATORS
+from concrete.entity.attribution_engine import AttributionEngine, Attribution
+from concrete.entity.ridge_statistics import RidgeStatistics
+from concrete.component.data_transformation import DataTransformation
+from concrete.constants import BEST_MODEL_KEY, MODEL_PATH_KEY, TRAIN_FILE_PATH_KEY, SCHEMA_TARGET_COLUMN_KEY, \
+    PREDICTION_INTERVAL_COVERAGE, SCHEMA_NUMERICAL_COLUMNS_KEY, TRAINING_RANGE_CHUNK_ROWS
+from sklearn.base import clone
+from collections import namedtuple
+import numpy as np
+import pandas as pd
 import os, sys
+import math
+import copy
 from typing import List
 
+RETRAIN_MODE_INCREMENTAL = "incremental"
+
+RETRAIN_STRATEGY_FULL = "full"
+RETRAIN_STRATEGY_WARM_START = "warm_start"
+RETRAIN_STRATEGY_PARTIAL_FIT = "partial_fit"
+RETRAIN_STRATEGY_APPEND_REFIT = "append_refit"
+RETRAIN_STRATEGY_SUFFICIENT_STATISTICS = "sufficient_statistics"
+RETRAIN_STRATEGY_UNCHANGED = "unchanged"
+
+#lower and upper are None for models without calibrated intervals
+PredictionInterval = namedtuple("PredictionInterval", ["prediction", "lower", "upper", "coverage"])
+
 class EstimatorModel:
-    def __init__(self, preprocessing_object, trained_model_object):
+    #defaults of models pickled before prediction intervals existed
+    interval_coverage = None
+    interval_quantile = None
+    interval_scale_offset = None
+    tree_arrays = None
+    feature_means = None
+    attribution_engine = None
+    ridge_statistics = None
+    inference_preprocessing_object = None
+    input_ranges = None
+    mass_range = None
+
+    def __init__(self, preprocessing_object, trained_model_object, preprocessor_key=None, feature_means=None,
+                 ridge_statistics: RidgeStatistics = None, input_ranges: dict = None, mass_range: tuple = None):
         """
         TrainedModel constructor
         preprocessing_object: preprocessing_object
         trained_model_object: trained_model_object
+        preprocessor_key: key of preprocessing_object in the preprocessor store
+        feature_means: means of the transformed training features, the background of linear attributions
+        ridge_statistics: sufficient statistics of the training rows of a ridge or linear regression
+        input_ranges: {input column: (min, max)} over the training rows, the domain the model was fitted on
+        mass_range: (min, max) over the training rows of the sum of the numerical inputs, the mass per m3 of a mix
         """
         self.preprocessing_object = preprocessing_object
         self.trained_model_object = trained_model_object
+        self.preprocessor_key = preprocessor_key
+        self.feature_means = feature_means
+        self.ridge_statistics = ridge_statistics
+        self.input_ranges = input_ranges
+        self.mass_range = mass_range
+        #built before saving so the flattened trees are stored in the memory mapped blob of the split format
+        self.tree_arrays = TreeArrays.from_estimator(trained_model_object)
+
+    def get_inference_preprocessor(self):
+        """
+        Copy of preprocessing_object keeping every row, built on first use.
+        """
+        if self.inference_preprocessing_object is None:
+            self.inference_preprocessing_object = DataTransformation.get_inference_preprocessor(self.preprocessing_object)
+        return self.inference_preprocessing_object
+
+    def transform(self, X):
+        """
+        Transforms raw inputs into the features of the estimator, one row per input row.
+        """
+        transformed_feature = self.get_inference_preprocessor().transform(X)
+        if len(transformed_feature) != len(X):
+            raise Exception(f"Preprocessing returned [{len(transformed_feature)}] rows for [{len(X)}] input rows")
+        return transformed_feature
 
     def predict(self, X):
         """
@@ -23,9 +92,87 @@ class EstimatorModel:
         which gurantees that the inputs are in the same format as the training data
         At last it perform prediction on transformed features
         """
-        transformed_feature = self.preprocessing_object.transform(X)
+        transformed_feature = self.transform(X)
         return self.trained_model_object.predict(transformed_feature)
 
+    def get_tree_arrays(self) -> TreeArrays:
+        """
+        Flattened trees of a tree ensemble estimator, built on first use for models saved without them.
+        None for other estimators.
+        """
+        if self.tree_arrays is None:
+            self.tree_arrays = TreeArrays.from_estimator(self.trained_model_object)
+        return self.tree_arrays
+
+    def predict_transformed_with_scale(self, transformed_feature) -> tuple:
+        """
+        Returns the predictions and the scale of their intervals: the standard deviation of the
+        tree predictions plus the scale offset for bagging ensembles, else 1.
+        """
+        if self.interval_scale_offset is None:
+            prediction = self.trained_model_object.predict(transformed_feature)
+            return prediction, np.ones(len(prediction))
+        tree_predictions = self.get_tree_arrays().predict_trees(transformed_feature)
+        return tree_predictions.mean(axis=1), tree_predictions.std(axis=1) + self.interval_scale_offset
+
+    def calibrate_intervals(self, transformed_feature, y, coverage: float = PREDICTION_INTERVAL_COVERAGE):
+        """
+        Split conformal calibration on rows the estimator was not fitted on. The interval of a
+        prediction is prediction +- interval_quantile * scale, interval_quantile being the
+        conformal quantile of the calibration residuals divided by their scale. For bagging
+        ensembles the scale follows the spread of the tree predictions, so intervals widen
+        where the trees disagree; for other estimators intervals have a constant width.
+        """
+        if isinstance(self.trained_model_object, BAGGING_ESTIMATORS):
+            tree_predictions = self.get_tree_arrays().predict_trees(transformed_feature)
+            self.interval_scale_offset = float(np.median(tree_predictions.std(axis=1))) or 1.0
+        else:
+            self.interval_scale_offset = None
+        prediction, scale = self.predict_transformed_with_scale(transformed_feature)
+        scores = np.abs(np.ravel(y) - prediction) / scale
+        #the conformal quantile is the ceil((n + 1) * coverage)-th smallest score, the largest when fewer rows
+        rank = min(len(scores), math.ceil((len(scores) + 1) * coverage))
+        self.interval_quantile = float(np.sort(scores)[rank - 1])
+        self.interval_coverage = coverage
+        logging.info(f"Calibrated {coverage} prediction intervals on [{len(scores)}] rows, "
+                     f"quantile: [{self.interval_quantile}], scale offset: [{self.interval_scale_offset}]")
+
+    def get_attribution_engine(self) -> AttributionEngine:
+        """
+        Attribution engine of the estimator, built on first use. None for unsupported estimators.
+        """
+        if self.attribution_engine is None and AttributionEngine.is_supported(self.trained_model_object):
+            feature_columns = DataTransformation.get_transformed_feature_columns(self.preprocessing_object)
+            columns = list(getattr(self.preprocessing_object, "feature_names_in_", dict.fromkeys(feature_columns)))
+            self.attribution_engine = AttributionEngine(estimator=self.trained_model_object,
+                                                        columns=columns,
+                                                        feature_columns=feature_columns,
+                                                        feature_means=self.feature_means,
+                                                        tree_arrays=self.get_tree_arrays())
+        return self.attribution_engine
+
+    def attribute(self, X) -> Attribution:
+        """
+        Contributions of each input to the predictions of X, None for unsupported estimators.
+        """
+        attribution_engine = self.get_attribution_engine()
+        if attribution_engine is None:
+            return None
+        return attribution_engine.attribute(self.transform(X))
+
+    def predict_with_interval(self, X) -> PredictionInterval:
+        """
+        Predictions with their intervals, from the same pass over the transformed inputs.
+        """
+        transformed_feature = self.transform(X)
+        if self.interval_quantile is None:
+            return PredictionInterval(prediction=self.trained_model_object.predict(transformed_feature),
+                                      lower=None, upper=None, coverage=None)
+        prediction, scale = self.predict_transformed_with_scale(transformed_feature)
+        half_width = self.interval_quantile * scale
+        return PredictionInterval(prediction=prediction, lower=prediction - half_width, upper=prediction + half_width,
+                                  coverage=self.interval_coverage)
+
     def __repr__(self):
         return f"{type(self.trained_model_object).__name__}()"
 
@@ -36,22 +183,209 @@ class EstimatorModel:
 class ModelTrainer:
     def __init__(self,
                  model_trainer_config:ModelTrainerConfig,
-                 data_transformation_artifact: DataTransformationArtifact) -> None:
+                 data_transformation_artifact: DataTransformationArtifact,
+                 artifact_store: ArtifactStore = None,
+                 data_ingestion_artifact: DataIngestionArtifact = None,
+                 data_validation_artifact: DataValidationArtifact = None) -> None:
+        """
+        data_ingestion_artifact, data_validation_artifact: required by the incremental retrain mode
+        """
         try:
             logging.info(f"{'>>' * 30}Model trainer log started.{'<<' * 30} ")
             self.model_trainer_config = model_trainer_config
             self.data_transformation_artifact = data_transformation_artifact
+            self.data_ingestion_artifact = data_ingestion_artifact
+            self.data_validation_artifact = data_validation_artifact
+            self.artifact_store = ArtifactStore(persist_in_background=False) if artifact_store is None else artifact_store
+        except Exception as e:
+            raise ConcreteException(e, sys) from e
+
+    def get_previous_model_entry(self) -> dict:
+        """
+        Returns the entry of the currently accepted model in model_evaluation.yaml, None if there is none.
+        """
+        try:
+            model_evaluation_file_path = self.model_trainer_config.model_evaluation_file_path
+            if not os.path.exists(model_evaluation_file_path):
+                return None
+            model_eval_content = read_yaml_file(file_path=model_evaluation_file_path)
+            if model_eval_content is None or BEST_MODEL_KEY not in model_eval_content:
+                return None
+            return model_eval_content[BEST_MODEL_KEY]
+        except Exception as e:
+            raise ConcreteException(e, sys) from e
+
+    def get_training_ranges(self) -> tuple:
+        """
+        Returns the (min, max) of every input column over the training file and the (min, max) of the
+        sum of the numerical inputs, reading the file in chunks.
+        """
+        try:
+            schema_file_path = self.data_validation_artifact.schema_file_path
+            schema = load_config_file(schema_file_path, required_keys=SCHEMA_REQUIRED_KEYS)
+            target_columns = schema[SCHEMA_TARGET_COLUMN_KEY]
+            lower, upper, mass_lower, mass_upper = None, None, np.inf, -np.inf
+            for chunk in pd.read_csv(self.data_ingestion_artifact.train_file_path, chunksize=TRAINING_RANGE_CHUNK_ROWS):
+                chunk = chunk.drop(columns=target_columns)
+                lower = chunk.min() if lower is None else np.minimum(lower, chunk.min())
+                upper = chunk.max() if upper is None else np.maximum(upper, chunk.max())
+                mass = chunk[schema[SCHEMA_NUMERICAL_COLUMNS_KEY]].sum(axis=1)
+                mass_lower, mass_upper = min(mass_lower, float(mass.min())), max(mass_upper, float(mass.max()))
+            input_ranges = {column: (float(lower[column]), float(upper[column])) for column in lower.index}
+            logging.info(f"Training input ranges: {input_ranges}, mass range: {(mass_lower, mass_upper)}")
+            return input_ranges, (mass_lower, mass_upper)
+        except Exception as e:
+            raise ConcreteException(e, sys) from e
+
+    def get_new_rows(self, previous_train_file_path: str) -> tuple:
+        """
+        Returns the rows of the current training file that the previous model was not trained on
+        and the rows of the previous training file, both split into input features and target.
+        Rows are matched on the hash of their content.
+        """
+        try:
+            schema_file_path = self.data_validation_artifact.schema_file_path
+            target_column = load_config_file(schema_file_path, required_keys=SCHEMA_REQUIRED_KEYS)[SCHEMA_TARGET_COLUMN_KEY][0]
+            data_loader = lambda file_path: load_data(file_path, schema_file_path)
+            train_df = self.artifact_store.get(self.data_ingestion_artifact.train_file_path, data_loader)
+            previous_train_df = load_data(previous_train_file_path, schema_file_path)
+            previous_train_df = previous_train_df.reindex(columns=train_df.columns)
+            previous_row_hash = pd.util.hash_pandas_object(previous_train_df, index=False).to_numpy()
+            row_hash = pd.util.hash_pandas_object(train_df, index=False).to_numpy()
+            new_train_df = train_df[~np.isin(row_hash, previous_row_hash)]
+            logging.info(f"Found [{len(new_train_df)}] new training rows since the previous accepted model.")
+            return (new_train_df.drop(target_column, axis=1), new_train_df[target_column].to_numpy(),
+                    previous_train_df.drop(target_column, axis=1), previous_train_df[target_column].to_numpy())
+        except Exception as e:
+            raise ConcreteException(e, sys) from e
+
+    def update_estimator(self, previous_estimator, preprocessing_obj, x_new, y_new, x_previous, y_previous,
+                         ridge_statistics: RidgeStatistics = None) -> tuple:
+        """
+        Returns the estimator updated with the new rows, the strategy used and the ridge statistics
+        of the updated estimator (None for other estimators):
+        warm_start adds trees or boosting stages fitted on the new rows, sufficient_statistics adds
+        the new rows to the ridge statistics of the previous model and solves the ridge system again,
+        partial_fit updates the estimator with the new rows and append_refit refits the estimator with
+        its previous parameters, without parameter search, on the previous training rows followed by
+        the new rows.
+        """
+        try:
+            if len(y_new) == 0:
+                return previous_estimator, RETRAIN_STRATEGY_UNCHANGED, ridge_statistics
+            x_new_arr = preprocessing_obj.transform(x_new.copy())
+            estimator_params = previous_estimator.get_params()
+            if "warm_start" in estimator_params and "n_estimators" in estimator_params:
+                estimator = copy.deepcopy(previous_estimator)
+                estimator.set_params(warm_start=True,
+                                     n_estimators=estimator_params["n_estimators"] + self.model_trainer_config.warm_start_n_estimators)
+                estimator.fit(x_new_arr, y_new)
+                estimator.set_params(warm_start=estimator_params["warm_start"])
+                return estimator, RETRAIN_STRATEGY_WARM_START, None
+            is_ridge = RidgeStatistics.is_supported(previous_estimator)
+            if is_ridge and ridge_statistics is not None:
+                ridge_statistics = copy.deepcopy(ridge_statistics).update(x_new_arr, y_new)
+                estimator = ridge_statistics.solve(copy.deepcopy(previous_estimator))
+                return estimator, RETRAIN_STRATEGY_SUFFICIENT_STATISTICS, ridge_statistics
+            if hasattr(previous_estimator, "partial_fit"):
+                estimator = copy.deepcopy(previous_estimator)
+                estimator.partial_fit(x_new_arr, y_new)
+                return estimator, RETRAIN_STRATEGY_PARTIAL_FIT, None
+            x_train_arr, y_train = np.r_[preprocessing_obj.transform(x_previous.copy()), x_new_arr], np.r_[y_previous, y_new]
+            estimator = clone(previous_estimator)
+            estimator.fit(x_train_arr, y_train)
+            #models saved without ridge statistics get them with their first refit
+            ridge_statistics = RidgeStatistics(x_train_arr.shape[1]).update(x_train_arr, y_train) if is_ridge else None
+            return estimator, RETRAIN_STRATEGY_APPEND_REFIT, ridge_statistics
+        except Exception as e:
+            raise ConcreteException(e, sys) from e
+
+    def initiate_incremental_model_trainer(self) -> ModelTrainerArtifact:
+        """
+        Updates the currently accepted model with the rows ingested since it was trained, keeping its
+        preprocessing object. Returns None when a full training is needed instead: no accepted model,
+        its training file is no longer available or the updated model is not acceptable.
+        """
+        try:
+            previous_model_entry = self.get_previous_model_entry()
+            if previous_model_entry is None or previous_model_entry.get(TRAIN_FILE_PATH_KEY) is None:
+                logging.info("No accepted model with a recorded training file, training from scratch.")
+                return None
+            previous_train_file_path = previous_model_entry[TRAIN_FILE_PATH_KEY]
+            if not os.path.exists(previous_train_file_path) or not os.path.exists(previous_model_entry[MODEL_PATH_KEY]):
+                logging.info(f"Training file [{previous_train_file_path}] of the accepted model is not available, "
+                             f"training from scratch.")
+                return None
+            previous_model = load_split_object(file_path=previous_model_entry[MODEL_PATH_KEY])
+            x_new, y_new, x_previous, y_previous = self.get_new_rows(previous_train_file_path=previous_train_file_path)
+            estimator, retrain_strategy, ridge_statistics = self.update_estimator(
+                previous_estimator=previous_model.trained_model_object,
+                preprocessing_obj=previous_model.get_inference_preprocessor(),
+                x_new=x_new, y_new=y_new, x_previous=x_previous, y_previous=y_previous,
+                ridge_statistics=previous_model.ridge_statistics)
+            logging.info(f"Updated [{estimator}] with [{len(y_new)}] new rows using [{retrain_strategy}].")
+            input_ranges, mass_range = self.get_training_ranges()
+            model = EstimatorModel(preprocessing_object=previous_model.preprocessing_object,
+                                   trained_model_object=estimator,
+                                   preprocessor_key=previous_model.preprocessor_key,
+                                   feature_means=previous_model.feature_means,
+                                   ridge_statistics=ridge_statistics,
+                                   input_ranges=input_ranges,
+                                   mass_range=mass_range)
+            schema_file_path = self.data_validation_artifact.schema_file_path
+            target_column = load_config_file(schema_file_path, required_keys=SCHEMA_REQUIRED_KEYS)[SCHEMA_TARGET_COLUMN_KEY][0]
+            data_loader = lambda file_path: load_data(file_path, schema_file_path)
+            train_df = self.artifact_store.get(self.data_ingestion_artifact.train_file_path, data_loader)
+            test_df = self.artifact_store.get(self.data_ingestion_artifact.test_file_path, data_loader)
+            #the update is evaluated, and its intervals calibrated, on the test rows the previous model was not trained on
+            x_test, y_test = test_df.drop(target_column, axis=1), test_df[target_column].to_numpy()
+            is_unseen = ~np.isin(pd.util.hash_pandas_object(x_test, index=False).to_numpy(),
+                                 pd.util.hash_pandas_object(x_previous.reindex(columns=x_test.columns), index=False).to_numpy())
+            if not is_unseen.any():
+                logging.info("No test rows left that the previous model was not trained on, training from scratch.")
+                return None
+            x_test, y_test = x_test[is_unseen], y_test[is_unseen]
+            logging.info(f"Evaluating the updated model on [{len(y_test)}] test rows the previous model was not trained on.")
+            metric_info: MetricInfoArtifact = evaluate_regression_model(model_list=[model],
+                                                                        X_train=train_df.drop(target_column, axis=1),
+                                                                        y_train=train_df[target_column].to_numpy(),
+                                                                        X_test=x_test,
+                                                                        y_test=y_test,
+                                                                        base_accuracy=self.model_trainer_config.base_accuracy)
+            if metric_info is None:
+                logging.info("Incrementally updated model is not acceptable, training from scratch.")
+                return None
+            model.calibrate_intervals(transformed_feature=model.transform(x_test), y=y_test)
+            trained_model_file_path = self.model_trainer_config.trained_model_file_path
+            logging.info(f"Saving model at path: {trained_model_file_path}")
+            self.artifact_store.put(trained_model_file_path, model, save_split_object)
+            model_trainer_artifact = ModelTrainerArtifact(is_trained=True,
+                                                          message="Model updated incrementally",
+                                                          trained_model_file_path=trained_model_file_path,
+                                                          train_rmse=metric_info.train_rmse,
+                                                          test_rmse=metric_info.test_rmse,
+                                                          train_accuracy=metric_info.train_accuracy,
+                                                          test_accuracy=metric_info.test_accuracy,
+                                                          model_accuracy=metric_info.model_accuracy,
+                                                          retrain_strategy=retrain_strategy,
+                                                          new_row_count=len(y_new))
+            logging.info(f"Model Trainer Artifact: {model_trainer_artifact}")
+            return model_trainer_artifact
         except Exception as e:
             raise ConcreteException(e, sys) from e
 
     def initiate_model_trainer(self):
         try:
+            if self.model_trainer_config.retrain_mode == RETRAIN_MODE_INCREMENTAL:
+                model_trainer_artifact = self.initiate_incremental_model_trainer()
+                if model_trainer_artifact is not None:
+                    return model_trainer_artifact
             logging.info(f"Loading transformed training dataset")
             transformed_train_file_path = self.data_transformation_artifact.transformed_train_file_path
-            train_array = load_numpy_array_data(file_path=transformed_train_file_path)
+            train_array = self.artifact_store.get(transformed_train_file_path, load_numpy_array_data)
             logging.info(f"Loading transformed testing dataset")
             transformed_test_file_path = self.data_transformation_artifact.transformed_test_file_path
-            test_array = load_numpy_array_data(file_path=transformed_test_file_path)
+            test_array = self.artifact_store.get(transformed_test_file_path, load_numpy_array_data)
             logging.info(f"Splitting training and testing input and target feature")
             x_train,y_train,x_test,y_test = train_array[:,:-1],train_array[:,-1],test_array[:,:-1],test_array[:,-1]
             logging.info(f"Extracting model config file path")
@@ -73,12 +407,24 @@ class ModelTrainer:
                                                                        y_test=y_test,
                                                                        base_accuracy=base_accuracy)
             logging.info(f"Best found model on both training and testing dataset.")
-            preprocessing_obj=  load_object(file_path=self.data_transformation_artifact.preprocessed_object_file_path)
+            preprocessing_obj = self.data_transformation_artifact.preprocessing_object
+            if preprocessing_obj is None:
+                preprocessing_obj = self.artifact_store.get(self.data_transformation_artifact.preprocessed_object_file_path,
+                                                            load_object)
             model_object = metric_info.model_object
             trained_model_file_path=self.model_trainer_config.trained_model_file_path
-            model = EstimatorModel(preprocessing_object=preprocessing_obj,trained_model_object=model_object)
+            input_ranges, mass_range = self.get_training_ranges()
+            model = EstimatorModel(preprocessing_object=preprocessing_obj,
+                                   trained_model_object=model_object,
+                                   preprocessor_key=self.data_transformation_artifact.preprocessor_key,
+                                   feature_means=x_train.mean(axis=0),
+                                   ridge_statistics=RidgeStatistics(x_train.shape[1]).update(x_train, y_train)
+                                   if RidgeStatistics.is_supported(model_object) else None,
+                                   input_ranges=input_ranges,
+                                   mass_range=mass_range)
+            model.calibrate_intervals(transformed_feature=x_test, y=y_test)
             logging.info(f"Saving model at path: {trained_model_file_path}")
-            save_object(file_path=trained_model_file_path,obj=model)
+            self.artifact_store.put(trained_model_file_path, model, save_split_object)
             model_trainer_artifact = ModelTrainerArtifact(is_trained=True,
                                                           message="Model Trained successfully",
                                                           trained_model_file_path=trained_model_file_path,
@@ -86,7 +432,9 @@ class ModelTrainer:
                                                           test_rmse=metric_info.test_rmse,
                                                           train_accuracy=metric_info.train_accuracy,
                                                           test_accuracy=metric_info.test_accuracy,
-                                                          model_accuracy=metric_info.model_accuracy)
+                                                          model_accuracy=metric_info.model_accuracy,
+                                                          retrain_strategy=RETRAIN_STRATEGY_FULL,
+                                                          new_row_count=len(y_train))
             logging.info(f"Model Trainer Artifact: {model_trainer_artifact}")
             return model_trainer_artifact
         except Exception as e:
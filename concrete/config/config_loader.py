@@ -0,0 +1,96 @@
+import os
+import sys
+import threading
+import yaml
+from concrete.exception import ConcreteException
+from concrete.logger import logging
+from concrete.constants import *
+
+CONFIG_REQUIRED_KEYS = [TRAINING_PIPELINE_CONFIG_KEY, DATA_INGESTION_CONFIG_KEY, DATA_VALIDATION_CONFIG_KEY,
+                        DATA_TRANSFORMATION_CONFIG_KEY, MODEL_TRAINER_CONFIG_KEY, MODEL_EVALUATION_CONFIG_KEY,
+                        MODEL_PUSHER_CONFIG_KEY, MODEL_SERVING_CONFIG_KEY, RETENTION_CONFIG_KEY]
+
+SCHEMA_REQUIRED_KEYS = [SCHEMA_COLUMNS_KEY, SCHEMA_NUMERICAL_COLUMNS_KEY, SCHEMA_CATEGORICAL_COLUMNS_KEY,
+                        SCHEMA_TARGET_COLUMN_KEY, SCHEMA_DOMAIN_VALUE_KEY]
+
+
+def raise_read_only(*args, **kwargs):
+    raise TypeError("Configuration loaded by load_config_file is read-only.")
+
+
+class FrozenDict(dict):
+    """
+    Read-only dict. Copies and pickles of it are plain dicts.
+    """
+    __setitem__ = __delitem__ = __ior__ = clear = pop = popitem = setdefault = update = raise_read_only
+
+    def __reduce__(self):
+        return dict, (dict(self),)
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+
+class FrozenList(list):
+    """
+    Read-only list. Copies and pickles of it are plain lists.
+    """
+    __setitem__ = __delitem__ = __iadd__ = __imul__ = raise_read_only
+    append = extend = insert = remove = pop = clear = sort = reverse = raise_read_only
+
+    def __reduce__(self):
+        return list, (list(self),)
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+
+def freeze(obj):
+    if isinstance(obj, dict):
+        return FrozenDict((key, freeze(value)) for key, value in obj.items())
+    if isinstance(obj, list):
+        return FrozenList(freeze(value) for value in obj)
+    return obj
+
+
+#absolute file path -> ((modification time, size), frozen content)
+loaded_config_files: dict = {}
+loaded_config_files_lock = threading.Lock()
+
+
+def load_config_file(file_path: str, required_keys: list = None) -> FrozenDict:
+    """
+    Parses a YAML configuration file once per process and returns its content as a read-only
+    FrozenDict. The file is parsed again only when its modification time or size changes.
+    Files the pipeline rewrites while it runs, like the model evaluation file, are read
+    with read_yaml_file instead.
+    required_keys: top level keys the file must have, checked when the file is parsed
+    """
+    try:
+        file_path = os.path.abspath(file_path)
+        file_stat = os.stat(file_path)
+        file_signature = (file_stat.st_mtime_ns, file_stat.st_size)
+        with loaded_config_files_lock:
+            loaded_config_file = loaded_config_files.get(file_path)
+        if loaded_config_file is not None and loaded_config_file[0] == file_signature:
+            content = loaded_config_file[1]
+        else:
+            with open(file_path, "rb") as yaml_file:
+                content = freeze(yaml.safe_load(yaml_file))
+            if not isinstance(content, dict):
+                raise Exception(f"Configuration file [{file_path}] does not hold a mapping.")
+            logging.info(f"Parsed configuration file: [{file_path}]")
+            with loaded_config_files_lock:
+                loaded_config_files[file_path] = (file_signature, content)
+        missing_keys = [key for key in required_keys or [] if key not in content]
+        if missing_keys:
+            raise Exception(f"Configuration file [{file_path}] is missing required keys: {missing_keys}")
+        return content
+    except Exception as e:
+        raise ConcreteException(e, sys) from e
@@ -1,9 +1,9 @@
 import sys,os
-from concrete.entity.config_entity import DataInjestionConfig, DataValidationConfig, DataTransformationConfig, ModelTrainerConfig, ModelEvaluationConfig, ModelPusherConfig, TrainingPipelineConfig
-from concrete.util.util import read_yaml_file
+from concrete.entity.config_entity import DataInjestionConfig, DataValidationConfig, DataTransformationConfig, ModelTrainerConfig, ModelEvaluationConfig, ModelPusherConfig, ModelServingConfig, TrainingPipelineConfig, RetentionConfig
+from concrete.config.config_loader import load_config_file, CONFIG_REQUIRED_KEYS
 from concrete.constants import *
 from concrete.exception import ConcreteException
-from concrete.logger import logging
+from concrete.logger import logging, LOG_DIR
 
 class Configuration:
     def __init__(self,
@@ -11,7 +11,7 @@ class Configuration:
                 current_time_stamp:str = get_current_time_stamp()
                 ) -> None:
         try:
-            self.config_info = read_yaml_file(config_file_path)
+            self.config_info = load_config_file(config_file_path, required_keys=CONFIG_REQUIRED_KEYS)
             self.training_pipeline_config = self.get_training_pipeline_config()
             self.time_stamp = current_time_stamp
         except Exception as e:
@@ -40,7 +40,11 @@ class Configuration:
                                     dataset_download_url=dataset_download_url, 
                                     raw_data_dir=raw_data_dir, 
                                     ingested_train_dir=ingested_train_dir, 
-                                    ingested_test_dir=ingested_test_dir
+                                    ingested_test_dir=ingested_test_dir,
+                                    split_chunk_size=data_ingestion_info[DATA_INGESTION_SPLIT_CHUNK_SIZE_KEY],
+                                    test_size=data_ingestion_info[DATA_INGESTION_TEST_SIZE_KEY],
+                                    split_random_state=data_ingestion_info[DATA_INGESTION_SPLIT_RANDOM_STATE_KEY],
+                                    memory_budget_mb=data_ingestion_info[MEMORY_BUDGET_MB_KEY]
             )
             logging.info(f'DataInjestionConfig: {data_ingestion_config}')
             return data_ingestion_config
@@ -64,7 +68,8 @@ class Configuration:
                                             data_validation_info[DATA_VALIDATION_SCHEMA_FILE_NAME_KEY])
             data_validation_config = DataValidationConfig(schema_file_path=schema_file_path,
                                                             report_file_path=report_file_path,
-                                                            report_page_file_path=report_page_file_path)
+                                                            report_page_file_path=report_page_file_path,
+                                                            memory_budget_mb=data_validation_info[MEMORY_BUDGET_MB_KEY])
             logging.info(f"DataValidationConfig: {data_validation_config}")
             return data_validation_config
         except Exception as e:
@@ -91,10 +96,15 @@ class Configuration:
                                             data_transformation_artifact_dir,
                                             data_transformation_info[DATA_TRANSFORMATION_PREPROCESSING_DIR_KEY],
                                             data_transformation_info[DATA_TRANSFORMATION_PREPROCESSED_OBJECT_FILE_NAME_KEY])
+            preprocessor_store_dir = os.path.join(
+                                    artifact_dir,
+                                    data_transformation_info[DATA_TRANSFORMATION_PREPROCESSOR_STORE_DIR_KEY])
             data_transformation_config = DataTransformationConfig(
                                         transformed_train_dir= transformed_train_dir,
                                         transformed_test_dir= transformed_test_dir,
-                                        preprocessed_object_file_path= preprocessed_object_file_path)
+                                        preprocessed_object_file_path= preprocessed_object_file_path,
+                                        preprocessor_store_dir= preprocessor_store_dir,
+                                        memory_budget_mb= data_transformation_info[MEMORY_BUDGET_MB_KEY])
             logging.info(f"DataTransformationConfig: {data_transformation_config}")
             return data_transformation_config
         except Exception as e:
@@ -116,7 +126,10 @@ class Configuration:
             model_trainer_config = ModelTrainerConfig(
                                     trained_model_file_path= trained_model_file_path,
                                     base_accuracy= base_accuracy,
-                                    model_config_file_path=model_config_file_path)
+                                    model_config_file_path=model_config_file_path,
+                                    retrain_mode=model_trainer_info[MODEL_TRAINER_RETRAIN_MODE_KEY],
+                                    warm_start_n_estimators=model_trainer_info[MODEL_TRAINER_WARM_START_N_ESTIMATORS_KEY],
+                                    model_evaluation_file_path=self.get_model_evaluation_config().model_evaluation_file_path)
             logging.info(f"Model Trainer Config: {model_trainer_config}")
             return model_trainer_config                 
         except Exception as e:
@@ -131,7 +144,9 @@ class Configuration:
                                         model_evaluation_info[MODEL_EVALUATION_FILE_NAME_KEY])
             model_evaluation_config = ModelEvaluationConfig(
                                     model_evaluation_file_path=model_evaluation_file_path,
-                                    time_stamp=self.time_stamp)
+                                    time_stamp=self.time_stamp,
+                                    bootstrap_resamples=model_evaluation_info[MODEL_EVALUATION_BOOTSTRAP_RESAMPLES_KEY],
+                                    confidence_level=model_evaluation_info[MODEL_EVALUATION_CONFIDENCE_LEVEL_KEY])
             logging.info(f"Model Evaluation Config: {model_evaluation_config}")
             return model_evaluation_config
         except Exception as e:
@@ -144,19 +159,63 @@ class Configuration:
             export_dir_path = os.path.join(ROOT_DIR,
                                            model_pusher_info[MODEL_PUSHER_EXPORT_DIR_KEY],
                                            time_stamp)
-            model_pusher_config = ModelPusherConfig(export_dir_path= export_dir_path)
+            model_pusher_config = ModelPusherConfig(export_dir_path= export_dir_path,
+                                                    archive_model=model_pusher_info[MODEL_PUSHER_ARCHIVE_MODEL_KEY])
             logging.info(f"Model Pusher Config : {model_pusher_config}")
             return model_pusher_config
         except Exception as e:
             raise ConcreteException(e,sys) from e
 
+    def get_model_serving_config(self)-> ModelServingConfig:
+        try:
+            model_serving_info = self.config_info[MODEL_SERVING_CONFIG_KEY]
+            model_dir = os.path.join(ROOT_DIR, self.config_info[MODEL_PUSHER_CONFIG_KEY][MODEL_PUSHER_EXPORT_DIR_KEY])
+            champion_version = model_serving_info[MODEL_SERVING_CHAMPION_VERSION_KEY]
+            challenger_version = model_serving_info[MODEL_SERVING_CHALLENGER_VERSION_KEY]
+            model_serving_config = ModelServingConfig(model_dir=model_dir,
+                                                      champion_version=None if champion_version is None else str(champion_version),
+                                                      challenger_version=None if challenger_version is None else str(challenger_version),
+                                                      challenger_traffic_fraction=model_serving_info[MODEL_SERVING_CHALLENGER_TRAFFIC_FRACTION_KEY],
+                                                      shadow_scoring=model_serving_info[MODEL_SERVING_SHADOW_SCORING_KEY],
+                                                      shadow_max_workers=model_serving_info[MODEL_SERVING_SHADOW_MAX_WORKERS_KEY])
+            logging.info(f"Model Serving Config: {model_serving_config}")
+            return model_serving_config
+        except Exception as e:
+            raise ConcreteException(e,sys) from e
+
+    def get_retention_config(self)-> RetentionConfig:
+        try:
+            artifact_dir = self.training_pipeline_config.artifact_dir
+            retention_info = self.config_info[RETENTION_CONFIG_KEY]
+            preprocessor_store_dir = os.path.join(artifact_dir,
+                                                  self.config_info[DATA_TRANSFORMATION_CONFIG_KEY][DATA_TRANSFORMATION_PREPROCESSOR_STORE_DIR_KEY])
+            model_dir = os.path.join(ROOT_DIR, self.config_info[MODEL_PUSHER_CONFIG_KEY][MODEL_PUSHER_EXPORT_DIR_KEY])
+            retention_config = RetentionConfig(artifact_dir=artifact_dir,
+                                               archive_dir=os.path.join(artifact_dir, retention_info[RETENTION_ARCHIVE_DIR_KEY]),
+                                               keep_last_runs=retention_info[RETENTION_KEEP_LAST_RUNS_KEY],
+                                               archive_expired_runs=retention_info[RETENTION_ARCHIVE_EXPIRED_RUNS_KEY],
+                                               log_dir=os.path.join(ROOT_DIR, LOG_DIR),
+                                               log_retention_days=retention_info[RETENTION_LOG_RETENTION_DAYS_KEY],
+                                               model_evaluation_file_path=self.get_model_evaluation_config().model_evaluation_file_path,
+                                               preprocessor_store_dir=preprocessor_store_dir,
+                                               model_dir=model_dir)
+            logging.info(f"Retention Config: {retention_config}")
+            return retention_config
+        except Exception as e:
+            raise ConcreteException(e,sys) from e
+
     def get_training_pipeline_config(self)->TrainingPipelineConfig:
         try:
             training_pipeline_info = self.config_info[TRAINING_PIPELINE_CONFIG_KEY]
             artifact_dir = os.path.join(ROOT_DIR,
                                         training_pipeline_info[TRAINING_PIPELINE_NAME_KEY],
                                         training_pipeline_info[TRAINING_PIPELINE_ARTIFACT_DIR_KEY])
-            training_pipeline_config = TrainingPipelineConfig(artifact_dir=artifact_dir)
+            training_pipeline_config = TrainingPipelineConfig(artifact_dir=artifact_dir,
+                                                              max_workers=training_pipeline_info[TRAINING_PIPELINE_MAX_WORKERS_KEY],
+                                                              training_worker_niceness=training_pipeline_info[TRAINING_PIPELINE_WORKER_NICENESS_KEY],
+                                                              training_job_poll_interval=training_pipeline_info[TRAINING_PIPELINE_JOB_POLL_INTERVAL_KEY],
+                                                              profile=training_pipeline_info[TRAINING_PIPELINE_PROFILE_KEY],
+                                                              profile_sample_interval=training_pipeline_info[TRAINING_PIPELINE_PROFILE_SAMPLE_INTERVAL_KEY])
             logging.info(f"Training pipeling config: {training_pipeline_config}")
             return training_pipeline_config
         except Exception as e:
@@ -15,6 +15,11 @@ def get_current_time_stamp():
 TRAINING_PIPELINE_CONFIG_KEY = "training_pipeline_config"
 TRAINING_PIPELINE_ARTIFACT_DIR_KEY = "artifact_dir"
 TRAINING_PIPELINE_NAME_KEY = "pipeline_name"
+TRAINING_PIPELINE_MAX_WORKERS_KEY = "max_workers"
+TRAINING_PIPELINE_WORKER_NICENESS_KEY = "training_worker_niceness"
+TRAINING_PIPELINE_JOB_POLL_INTERVAL_KEY = "training_job_poll_interval"
+TRAINING_PIPELINE_PROFILE_KEY = "profile"
+TRAINING_PIPELINE_PROFILE_SAMPLE_INTERVAL_KEY = "profile_sample_interval"
 
 #Data ingestion related variables
 DATA_INGESTION_CONFIG_KEY = "data_ingestion_config"
@@ -25,6 +30,11 @@ DATA_INGESTION_TGZ_DOWNLOAD_DIR_KEY = "tgz_download_dir"
 DATA_INGESTION_INGESTED_DIR_NAME_KEY = "ingested_dir"
 DATA_INGESTION_TRAIN_DIR_KEY = "ingested_train_dir"
 DATA_INGESTION_TEST_DIR_KEY = "ingested_test_dir"
+DATA_INGESTION_SPLIT_CHUNK_SIZE_KEY = "split_chunk_size"
+DATA_INGESTION_TEST_SIZE_KEY = "test_size"
+DATA_INGESTION_SPLIT_RANDOM_STATE_KEY = "split_random_state"
+#per stage memory budget, in the data ingestion, validation and transformation sections
+MEMORY_BUDGET_MB_KEY = "memory_budget_mb"
 
 #Data Validation related variables
 DATA_VALIDATION_CONFIG_KEY = 'data_validation_config'
@@ -38,6 +48,7 @@ SCHEMA_NUMERICAL_COLUMNS_KEY = 'numerical_columns'
 SCHEMA_CATEGORICAL_COLUMNS_KEY = 'categorical_columns'
 SCHEMA_TARGET_COLUMN_KEY = 'target_column'
 SCHEMA_DOMAIN_VALUE_KEY = 'domain_value'
+SCHEMA_BOUNDS_KEY = 'bounds'
 
 #Data Transformation related variables
 DATA_TRANSFORMATION_CONFIG_KEY = 'data_transformation_config'
@@ -48,6 +59,7 @@ DATA_TRANSFORMATION_TRANSFORMED_TRAIN_DIR_KEY = "transformed_train_dir"
 DATA_TRANSFORMATION_TRANSFORMED_TEST_DIR_KEY = "transformed_test_dir"
 DATA_TRANSFORMATION_PREPROCESSING_DIR_KEY = "preprocessing_dir"
 DATA_TRANSFORMATION_PREPROCESSED_OBJECT_FILE_NAME_KEY = "preprocessed_object_file_name"
+DATA_TRANSFORMATION_PREPROCESSOR_STORE_DIR_KEY = "preprocessor_store_dir"
 DATASET_SCHEMA_COLUMNS_KEY = "columns"
 
 #Model trainer related variables
@@ -58,22 +70,119 @@ MODEL_TRAINER_MODEL_FILE_NAME_KEY = 'model_file_name'
 MODEL_TRAINER_BASE_ACCURACY_KEY = 'base_accuracy'
 MODEL_TRAINER_MODEL_CONFIG_DIR_NAME_KEY = 'model_config_dir'
 MODEL_TRAINER_MODEL_CONFIG_FILE_NAME_KEY = 'model_config_file_name'
+MODEL_TRAINER_RETRAIN_MODE_KEY = 'retrain_mode'
+MODEL_TRAINER_WARM_START_N_ESTIMATORS_KEY = 'warm_start_n_estimators'
 
 
 #Model evaluation related variables
 MODEL_EVALUATION_CONFIG_KEY = 'model_evaluation_config'
 MODEL_EVALUATION_ARTIFACT_DIR = 'model_evaluation'
 MODEL_EVALUATION_FILE_NAME_KEY = 'model_evaluation_file_name'
+MODEL_EVALUATION_BOOTSTRAP_RESAMPLES_KEY = 'bootstrap_resamples'
+MODEL_EVALUATION_CONFIDENCE_LEVEL_KEY = 'confidence_level'
 
 #Model pusher related variables
 MODEL_PUSHER_CONFIG_KEY = 'model_pusher_config'
 MODEL_PUSHER_ARTIFACT_DIR = 'model_pusher'
 MODEL_PUSHER_EXPORT_DIR_KEY = 'model_export_dir'
+MODEL_PUSHER_ARCHIVE_MODEL_KEY = 'archive_model'
+MODEL_ARCHIVE_FILE_EXTENSION = '.tar.gz'
+MODEL_REGISTRY_FILE_NAME = 'registry.yaml'
+
+#Model serving related variables
+MODEL_SERVING_CONFIG_KEY = 'model_serving_config'
+MODEL_SERVING_CHAMPION_VERSION_KEY = 'champion_version'
+MODEL_SERVING_CHALLENGER_VERSION_KEY = 'challenger_version'
+MODEL_SERVING_CHALLENGER_TRAFFIC_FRACTION_KEY = 'challenger_traffic_fraction'
+MODEL_SERVING_SHADOW_SCORING_KEY = 'shadow_scoring'
+MODEL_SERVING_SHADOW_MAX_WORKERS_KEY = 'shadow_max_workers'
+#shadow scoring requests queued or running per shadow worker, further requests are not shadow scored
+SHADOW_MAX_PENDING_PER_WORKER = 4
+
+RETENTION_CONFIG_KEY = 'retention_config'
+RETENTION_KEEP_LAST_RUNS_KEY = 'keep_last_runs'
+RETENTION_ARCHIVE_EXPIRED_RUNS_KEY = 'archive_expired_runs'
+RETENTION_ARCHIVE_DIR_KEY = 'archive_dir'
+RETENTION_LOG_RETENTION_DAYS_KEY = 'log_retention_days'
+
+#Split object format used for exported models
+SPLIT_OBJECT_BLOB_EXTENSION = '.arrays'
+SPLIT_OBJECT_MIN_ARRAY_BYTES = 4096
+SPLIT_OBJECT_ARRAY_ALIGNMENT = 64
+GZIP_FILE_EXTENSION = '.gz'
+DIRECTORY_LISTING_CACHE_SIZE = 1024
+
+BLOB_STORE_DIR_NAME = "blob_store"
+
+PROFILE_DIR_NAME = "profiles"
+PROFILE_REQUEST_DIR_NAME = "requests"
+PROFILE_COLLAPSED_FILE_EXTENSION = ".collapsed.txt"
+PROFILE_FLAME_GRAPH_FILE_EXTENSION = ".svg"
+#requests are profiled when they carry the token set in this environment variable
+PROFILE_TOKEN_ENV_KEY = "CONCRETE_PROFILE_TOKEN"
+PROFILE_TOKEN_HEADER = "X-Profile-Token"
+PROFILE_REQUEST_SAMPLE_INTERVAL = 0.001
+PROFILE_MAX_REQUEST_PROFILES = 100
+#unlinked blobs younger than this are not garbage collected, they may be about to be linked
+BLOB_GC_GRACE_SECONDS = 60*60
 
 
 BEST_MODEL_KEY = "best_model"
 HISTORY_KEY = "history"
 MODEL_PATH_KEY = "model_path"
+TRAIN_FILE_PATH_KEY = "train_file_path"
+RETRAIN_STRATEGY_KEY = "retrain_strategy"
+NEW_ROW_COUNT_KEY = "new_row_count"
+EVALUATION_CACHE_DIR_NAME = "evaluation_cache"
 
 EXPERIMENT_DIR_NAME="experiment"
-EXPERIMENT_FILE_NAME="experiment.csv"
\ No newline at end of file
+EXPERIMENT_FILE_NAME="experiment.csv"
+EXPERIMENT_DB_FILE_NAME="experiment.db"
+TRAINING_JOB_DB_FILE_NAME="training_job.db"
+TRAINING_WORKER_LOCK_FILE_NAME="training_worker.lock"
+#seconds the gunicorn master waits before starting the training worker again after it exited
+TRAINING_WORKER_RESTART_DELAY_SECONDS = 5
+
+LATEST_POINTER_FILE_NAME = "latest.yaml"
+MODEL_RELOAD_MARKER_FILE_NAME = "reload.marker"
+
+#log files are rotated when they reach LOG_MAX_BYTES, rotated files are gzip compressed
+LOG_MAX_BYTES = 10*1024*1024
+LOG_BACKUP_COUNT = 5
+LOG_COMPRESS_IDLE_SECONDS = 24*60*60
+RUN_TIME_STAMP_PATTERN = r"^\d{4}-\d{2}-\d{2}-\d{2}-\d{2}-\d{2}$"
+
+PIPELINE_REPORT_DIR_NAME = "pipeline_report"
+CRITICAL_PATH_REPORT_FILE_NAME = "critical_path.json"
+
+PROCESSING_MODE_IN_MEMORY = "in_memory"
+PROCESSING_MODE_CHUNKED = "chunked"
+#leading bytes of a csv file read to estimate its row count
+MEMORY_ESTIMATE_SAMPLE_BYTES = 64*1024
+#estimated size of a value of an object or string column
+MEMORY_OBJECT_VALUE_BYTES = 64
+MEMORY_MIN_CHUNK_ROWS = 100
+
+#mix design optimizer, population sizes and generations of api requests are capped
+MIX_DESIGN_POPULATION_SIZE = 100000
+MIX_DESIGN_GENERATIONS = 20
+MIX_DESIGN_ELITE_FRACTION = 0.01
+MIX_DESIGN_MAX_POPULATION_SIZE = 1000000
+MIX_DESIGN_MAX_GENERATIONS = 100
+MIX_DESIGN_TIME_LIMIT_SECONDS = 10
+#rows per chunk read to record the input ranges of the training data with a model
+TRAINING_RANGE_CHUNK_ROWS = 100000
+
+#sensitivity surfaces, computed when a model is exported and saved next to it
+SENSITIVITY_FILE_NAME = "sensitivity.npz"
+SENSITIVITY_GRID_POINTS = 20
+SENSITIVITY_INTERACTION_GRID_POINTS = 15
+SENSITIVITY_BACKGROUND_ROWS = 200
+SENSITIVITY_ICE_ROWS = 50
+#inclusive percentiles of the background spanned by the grid of an input without domain values
+SENSITIVITY_GRID_PERCENTILES = (5, 95)
+#rows predicted per call
+SENSITIVITY_MAX_BATCH_ROWS = 500000
+
+#fraction of true strengths prediction intervals are calibrated to contain
+PREDICTION_INTERVAL_COVERAGE = 0.9
\ No newline at end of file
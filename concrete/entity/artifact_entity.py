@@ -5,7 +5,8 @@ DataIngestionArtifact = namedtuple('DataIngestionArtifact',
                                     "test_file_path",
                                     "previous_train_file_path",
                                     "is_ingested",
-                                    "message"])
+                                    "message",
+                                    "processing_mode"])
 
 DataValidationArtifact = namedtuple('DataValidationArtifact',
                                     ["schema_file_path",
@@ -13,14 +14,18 @@ DataValidationArtifact = namedtuple('DataValidationArtifact',
                                     "report_file_path",
                                     "report_page_file_path",
                                     "is_validated",
-                                    "message"])
+                                    "message",
+                                    "processing_mode"])
 
 DataTransformationArtifact = namedtuple('DataTransformationArtifact',
                                         ["transformed_train_file_path",
                                         "transformed_test_file_path",
                                         "preprocessed_object_file_path",
+                                        "preprocessing_object",
+                                        "preprocessor_key",
                                         "is_transformed",
-                                        "message"])
+                                        "message",
+                                        "processing_mode"])
 
 
 ModelTrainerArtifact = namedtuple("ModelTrainerArtifact", ["is_trained",
@@ -30,9 +35,11 @@ ModelTrainerArtifact = namedtuple("ModelTrainerArtifact", ["is_trained",
                                                            "test_rmse",
                                                            "train_accuracy",
                                                            "test_accuracy",
-                                                           "model_accuracy"])
+                                                           "model_accuracy",
+                                                           "retrain_strategy",
+                                                           "new_row_count"])
 
 ModelEvaluationArtifact = namedtuple("ModelEvaluationArtifact",["is_model_accepted",
                                                                 "evaluated_model_path"])
 
-ModelPusherArtifact = namedtuple("ModelPusherArtifact", ["is_model_pusher", "export_model_file_path"])
\ No newline at end of file
+ModelPusherArtifact = namedtuple("ModelPusherArtifact", ["is_model_pusher", "export_model_file_path", "sensitivity_file_path"])
\ No newline at end of file
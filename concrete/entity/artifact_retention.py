@@ -0,0 +1,203 @@
+import os
+import re
+import sys
+import time
+import shutil
+import tarfile
+import tempfile
+import threading
+from concrete.entity.config_entity import RetentionConfig
+from concrete.entity.blob_store import get_blob_store
+from concrete.entity.model_registry import ModelRegistry, VERSIONS_KEY, SOURCE_MODEL_PATH_KEY
+from concrete.entity.preprocessor_store import PreprocessorStore
+from concrete.exception import ConcreteException
+from concrete.logger import logging
+from concrete.util.util import read_yaml_file, save_gzip_copy, get_open_file_paths
+from concrete.constants import RUN_TIME_STAMP_PATTERN, MODEL_ARCHIVE_FILE_EXTENSION, LOG_COMPRESS_IDLE_SECONDS, \
+    BEST_MODEL_KEY, HISTORY_KEY, LATEST_POINTER_FILE_NAME
+
+
+class ArtifactRetention:
+    """
+    Keeps the artifact and log directories from growing without bound.
+    A run is the set of time stamp folders sharing the same name across the stage folders of
+    the artifact directory. The last keep_last_runs runs are kept, as are the runs pinned by the
+    best and history entries of the model evaluation file, the latest pointers of the stage
+    folders and the source models of the model registry, which covers every accepted model.
+    Older runs are archived into one tar.gz bundle per run and removed, the preprocessor store
+    entries referring to them are dropped and the blobs no artifact links to are collected.
+    Idle log files are gzip compressed and log files older than log_retention_days are removed.
+    """
+    #one retention pass at a time per process
+    lock = threading.Lock()
+
+    def __init__(self, retention_config: RetentionConfig) -> None:
+        try:
+            self.retention_config = retention_config
+            self.run_time_stamp_regex = re.compile(RUN_TIME_STAMP_PATTERN)
+        except Exception as e:
+            raise ConcreteException(e, sys) from e
+
+    def get_run_dirs(self) -> dict:
+        """
+        Returns time stamp -> list of the folders of that run.
+        """
+        try:
+            run_dirs = dict()
+            artifact_dir = self.retention_config.artifact_dir
+            if not os.path.isdir(artifact_dir):
+                return run_dirs
+            for stage_dir_name in os.listdir(artifact_dir):
+                stage_dir = os.path.join(artifact_dir, stage_dir_name)
+                if not os.path.isdir(stage_dir) or stage_dir == self.retention_config.archive_dir:
+                    continue
+                for dir_name in os.listdir(stage_dir):
+                    dir_path = os.path.join(stage_dir, dir_name)
+                    if self.run_time_stamp_regex.match(dir_name) and os.path.isdir(dir_path):
+                        run_dirs.setdefault(dir_name, []).append(dir_path)
+            return run_dirs
+        except Exception as e:
+            raise ConcreteException(e, sys) from e
+
+    def get_path_time_stamps(self, file_paths: list) -> set:
+        """
+        Time stamps of the run folders in file_paths.
+        """
+        return {part for file_path in file_paths if isinstance(file_path, str)
+                for part in os.path.normpath(file_path).split(os.sep) if self.run_time_stamp_regex.match(part)}
+
+    def get_pinned_time_stamps(self) -> set:
+        """
+        Time stamps of the runs the model evaluation entries, latest pointers and model registry refer to.
+        """
+        try:
+            file_paths = []
+            model_evaluation_file_path = self.retention_config.model_evaluation_file_path
+            if os.path.exists(model_evaluation_file_path):
+                model_eval_content = read_yaml_file(file_path=model_evaluation_file_path) or dict()
+                entries = [model_eval_content.get(BEST_MODEL_KEY) or dict()] + \
+                    list((model_eval_content.get(HISTORY_KEY) or dict()).values())
+                file_paths.extend(file_path for entry in entries for file_path in entry.values())
+            artifact_dir = self.retention_config.artifact_dir
+            for stage_dir_name in os.listdir(artifact_dir):
+                latest_pointer_file_path = os.path.join(artifact_dir, stage_dir_name, LATEST_POINTER_FILE_NAME)
+                if os.path.isfile(latest_pointer_file_path):
+                    file_paths.extend((read_yaml_file(file_path=latest_pointer_file_path) or dict()).values())
+            registry = ModelRegistry(model_dir=self.retention_config.model_dir).read_registry()
+            file_paths.extend(version_info.get(SOURCE_MODEL_PATH_KEY) for version_info in registry[VERSIONS_KEY].values())
+            return self.get_path_time_stamps(file_paths)
+        except Exception as e:
+            raise ConcreteException(e, sys) from e
+
+    def prune_preprocessor_store(self, time_stamps: list):
+        """
+        Removes the preprocessor store entries whose preprocessing object was saved in one of the runs.
+        """
+        try:
+            preprocessor_store = PreprocessorStore(store_dir=self.retention_config.preprocessor_store_dir)
+            time_stamps = set(time_stamps)
+            preprocessor_store.remove([key for key, object_file_path in preprocessor_store.read_index().items()
+                                       if self.get_path_time_stamps([object_file_path]) & time_stamps])
+        except Exception as e:
+            raise ConcreteException(e, sys) from e
+
+    def archive_run(self, time_stamp: str, run_dirs: list) -> str:
+        """
+        Writes the run folders into one tar.gz bundle and removes them. Returns the bundle path.
+        """
+        try:
+            archive_file_path = None
+            if self.retention_config.archive_expired_runs:
+                archive_dir = self.retention_config.archive_dir
+                os.makedirs(archive_dir, exist_ok=True)
+                archive_file_path = os.path.join(archive_dir, f"{time_stamp}{MODEL_ARCHIVE_FILE_EXTENSION}")
+                temp_fd, temp_file_path = tempfile.mkstemp(dir=archive_dir, prefix=".", suffix=MODEL_ARCHIVE_FILE_EXTENSION)
+                try:
+                    with os.fdopen(temp_fd, "wb") as temp_file, tarfile.open(fileobj=temp_file, mode="w:gz") as archive:
+                        for run_dir in run_dirs:
+                            archive.add(run_dir, arcname=os.path.relpath(run_dir, self.retention_config.artifact_dir))
+                    os.replace(temp_file_path, archive_file_path)
+                except BaseException:
+                    if os.path.exists(temp_file_path):
+                        os.remove(temp_file_path)
+                    raise
+            for run_dir in run_dirs:
+                shutil.rmtree(run_dir, ignore_errors=True)
+            logging.info(f"Run [{time_stamp}] removed from the artifact directory, archive: [{archive_file_path}]")
+            return archive_file_path
+        except Exception as e:
+            raise ConcreteException(e, sys) from e
+
+    def apply_run_retention(self) -> list:
+        """
+        Archives the expired runs and returns their time stamps.
+        """
+        try:
+            run_dirs = self.get_run_dirs()
+            time_stamps = sorted(run_dirs)
+            keep_last_runs = max(int(self.retention_config.keep_last_runs), 1)
+            pinned_time_stamps = self.get_pinned_time_stamps()
+            expired_time_stamps = [time_stamp for time_stamp in time_stamps[:-keep_last_runs]
+                                   if time_stamp not in pinned_time_stamps]
+            for time_stamp in expired_time_stamps:
+                self.archive_run(time_stamp=time_stamp, run_dirs=run_dirs[time_stamp])
+            self.prune_preprocessor_store(expired_time_stamps)
+            return expired_time_stamps
+        except Exception as e:
+            raise ConcreteException(e, sys) from e
+
+    def apply_log_retention(self):
+        """
+        Compresses the log files no process has written to for a day and removes the expired ones.
+        Files still held open by a live process are left alone, a process that logs rarely would
+        otherwise keep writing to a removed file. Without /proc only the log files of this process
+        are known to be open.
+        """
+        try:
+            log_dir = self.retention_config.log_dir
+            if not os.path.isdir(log_dir):
+                return
+            now = time.time()
+            expiry_time = now - self.retention_config.log_retention_days * 24 * 60 * 60
+            open_file_paths = get_open_file_paths()
+            if open_file_paths is None:
+                open_file_paths = {os.path.realpath(handler.baseFilename) for handler in logging.getLogger().handlers
+                                   if hasattr(handler, "baseFilename")}
+            for file_name in os.listdir(log_dir):
+                file_path = os.path.join(log_dir, file_name)
+                if not os.path.isfile(file_path) or os.path.realpath(file_path) in open_file_paths:
+                    continue
+                modified_time = os.path.getmtime(file_path)
+                if modified_time < expiry_time:
+                    os.remove(file_path)
+                elif file_name.endswith(".log") and modified_time < now - LOG_COMPRESS_IDLE_SECONDS:
+                    save_gzip_copy(file_path=file_path)
+                    os.remove(file_path)
+        except Exception as e:
+            raise ConcreteException(e, sys) from e
+
+    def run(self):
+        if not ArtifactRetention.lock.acquire(blocking=False):
+            logging.info("Retention is already running.")
+            return
+        try:
+            expired_time_stamps = self.apply_run_retention()
+            get_blob_store(self.retention_config.artifact_dir).collect_garbage()
+            self.apply_log_retention()
+            logging.info(f"Retention done, {len(expired_time_stamps)} runs archived.")
+        except Exception as e:
+            #retention failures must not fail training
+            logging.error(f"Retention failed: {e}")
+        finally:
+            ArtifactRetention.lock.release()
+
+    def start(self) -> threading.Thread:
+        """
+        Runs the retention on a background thread.
+        """
+        try:
+            retention_thread = threading.Thread(target=self.run, name="artifact_retention")
+            retention_thread.start()
+            return retention_thread
+        except Exception as e:
+            raise ConcreteException(e, sys) from e
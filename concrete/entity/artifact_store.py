@@ -0,0 +1,107 @@
+import sys
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from concrete.exception import ConcreteException
+from concrete.logger import logging
+
+
+class ArtifactStore:
+    """
+    Holds the outputs of the pipeline stages of the current run in memory, keyed by the
+    file path they are persisted to. A stage puts its output together with the function
+    that writes it; the write runs on a background thread while later stages get the
+    in-memory object. Objects handed out by the store are shared, callers must not
+    modify them in place.
+    persist_in_background: when False every write is done synchronously inside put()
+    blob_store: BlobStore the artifacts are written through, writers then get it as keyword argument
+    """
+
+    def __init__(self, persist_in_background: bool = True, blob_store=None) -> None:
+        try:
+            self.persist_in_background = persist_in_background
+            self.blob_store = blob_store
+            self.artifacts = dict()
+            self.pending_writes = dict()
+            self.lock = threading.Lock()
+            self.executor = None
+            if persist_in_background:
+                self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="artifact_writer")
+        except Exception as e:
+            raise ConcreteException(e, sys) from e
+
+    def put(self, file_path: str, obj, writer=None):
+        """
+        file_path: location the artifact is (or will be) persisted to
+        obj: artifact object
+        writer: function called as writer(file_path, obj) to persist the artifact,
+                None when the artifact already exists on disk
+        """
+        try:
+            with self.lock:
+                self.artifacts[file_path] = obj
+            if writer is None:
+                return
+            if self.blob_store is not None:
+                writer = functools.partial(writer, blob_store=self.blob_store)
+            if not self.persist_in_background:
+                writer(file_path, obj)
+                return
+            logging.info(f"Scheduling background write of artifact: [{file_path}]")
+            with self.lock:
+                self.pending_writes[file_path] = self.executor.submit(writer, file_path, obj)
+        except Exception as e:
+            raise ConcreteException(e, sys) from e
+
+    def get(self, file_path: str, loader):
+        """
+        Returns the artifact kept for file_path, loading it with loader(file_path) on a miss.
+        """
+        try:
+            with self.lock:
+                if file_path in self.artifacts:
+                    return self.artifacts[file_path]
+            obj = loader(file_path)
+            with self.lock:
+                self.artifacts[file_path] = obj
+            return obj
+        except Exception as e:
+            raise ConcreteException(e, sys) from e
+
+    def wait_for(self, file_path: str):
+        """
+        Blocks until the pending write of file_path, if any, is on disk.
+        """
+        try:
+            with self.lock:
+                pending_write = self.pending_writes.pop(file_path, None)
+            if pending_write is not None:
+                pending_write.result()
+        except Exception as e:
+            raise ConcreteException(e, sys) from e
+
+    def flush(self):
+        """
+        Blocks until every pending write is on disk.
+        """
+        try:
+            with self.lock:
+                pending_file_paths = list(self.pending_writes.keys())
+            for file_path in pending_file_paths:
+                self.wait_for(file_path)
+            logging.info(f"Persisted {len(pending_file_paths)} artifacts written in background.")
+        except Exception as e:
+            raise ConcreteException(e, sys) from e
+
+    def close(self):
+        """
+        Flushes pending writes and releases the in-memory artifacts.
+        """
+        try:
+            self.flush()
+            with self.lock:
+                self.artifacts.clear()
+            if self.executor is not None:
+                self.executor.shutdown(wait=True)
+        except Exception as e:
+            raise ConcreteException(e, sys) from e
@@ -0,0 +1,73 @@
+import sys
+import numpy as np
+from collections import namedtuple
+from concrete.exception import ConcreteException
+from concrete.entity.tree_arrays import TreeArrays, BAGGING_ESTIMATORS, TREE_ENSEMBLE_ESTIMATORS
+
+#bias: array (rows,), contributions: array (rows, columns), bias + contributions summed over columns = prediction
+Attribution = namedtuple("Attribution", ["columns", "bias", "contributions"])
+
+
+class AttributionEngine:
+    """
+    Exact additive attributions of predictions to the model inputs, read from the structure of
+    the fitted estimator instead of perturbing inputs:
+    linear estimators: coefficient x (transformed input - its training mean), the bias is the
+                       prediction at the training means
+    tree ensembles: path attributions over the flattened trees, the bias is the mean of the
+                    root values (bagging) or the initial prediction plus the scaled root values
+                    (gradient boosting)
+    Contributions of transformed features are summed per input column, inputs the preprocessing
+    drops contribute 0.
+    feature_columns: input column of each transformed feature
+    feature_means: training means of the transformed features, zeros when not known
+    """
+
+    def __init__(self, estimator, columns: list, feature_columns: list, feature_means: np.ndarray = None,
+                 tree_arrays: TreeArrays = None) -> None:
+        try:
+            self.estimator = estimator
+            self.columns = columns
+            self.column_matrix = np.zeros((len(feature_columns), len(columns)))
+            self.column_matrix[np.arange(len(feature_columns)), [columns.index(column) for column in feature_columns]] = 1.0
+            self.feature_means = np.zeros(len(feature_columns)) if feature_means is None else np.asarray(feature_means)
+            self.tree_arrays = tree_arrays
+            if isinstance(estimator, TREE_ENSEMBLE_ESTIMATORS) and tree_arrays is None:
+                self.tree_arrays = TreeArrays.from_estimator(estimator)
+        except Exception as e:
+            raise ConcreteException(e, sys) from e
+
+    @staticmethod
+    def is_supported(estimator) -> bool:
+        return isinstance(estimator, TREE_ENSEMBLE_ESTIMATORS) or \
+            (hasattr(estimator, "coef_") and np.size(estimator.coef_) == np.shape(estimator.coef_)[-1])
+
+    def get_feature_contributions(self, transformed_feature: np.ndarray) -> tuple:
+        """
+        Returns the bias and the contributions of the transformed features.
+        """
+        try:
+            transformed_feature = np.asarray(transformed_feature, dtype=np.float64)
+            if self.tree_arrays is None:
+                coefficients = np.ravel(self.estimator.coef_)
+                bias = float(np.ravel(self.estimator.intercept_)[0]) + coefficients @ self.feature_means
+                return np.full(len(transformed_feature), bias), (transformed_feature - self.feature_means) * coefficients
+            contributions = self.tree_arrays.predict_contributions(transformed_feature)
+            root_value_sum = self.tree_arrays.value[self.tree_arrays.roots].sum()
+            if isinstance(self.estimator, BAGGING_ESTIMATORS):
+                tree_count = len(self.tree_arrays.roots)
+                return np.full(len(transformed_feature), root_value_sum / tree_count), contributions / tree_count
+            learning_rate = self.estimator.learning_rate
+            init = self.estimator.init_
+            initial_prediction = np.zeros(len(transformed_feature)) if isinstance(init, str) and init == "zero" \
+                else np.ravel(init.predict(transformed_feature)).astype(np.float64)
+            return initial_prediction + learning_rate * root_value_sum, contributions * learning_rate
+        except Exception as e:
+            raise ConcreteException(e, sys) from e
+
+    def attribute(self, transformed_feature: np.ndarray) -> Attribution:
+        try:
+            bias, feature_contributions = self.get_feature_contributions(transformed_feature)
+            return Attribution(columns=self.columns, bias=bias, contributions=feature_contributions @ self.column_matrix)
+        except Exception as e:
+            raise ConcreteException(e, sys) from e
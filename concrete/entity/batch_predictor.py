@@ -0,0 +1,31 @@
+import sys
+import numpy as np
+from concrete.exception import ConcreteException
+
+
+class BatchPredictor:
+    """
+    Predicts large batches of input rows, given as 2-D arrays in the order of columns, with an
+    EstimatorModel, through the copy of its preprocessing object that keeps every row.
+    """
+
+    def __init__(self, model, columns: list) -> None:
+        try:
+            self.columns = columns
+            self.preprocessing_object = model.get_inference_preprocessor()
+            self.estimator = model.trained_model_object
+        except Exception as e:
+            raise ConcreteException(e, sys) from e
+
+    def transform(self, X: np.ndarray) -> np.ndarray:
+        try:
+            import pandas as pd
+            return self.preprocessing_object.transform(pd.DataFrame(X, columns=self.columns))
+        except Exception as e:
+            raise ConcreteException(e, sys) from e
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        try:
+            return np.ravel(self.estimator.predict(self.transform(X)))
+        except Exception as e:
+            raise ConcreteException(e, sys) from e
@@ -0,0 +1,145 @@
+import os
+import sys
+import time
+import shutil
+import hashlib
+import io
+import tempfile
+from contextlib import contextmanager
+from concrete.exception import ConcreteException
+from concrete.logger import logging
+from concrete.constants import BLOB_STORE_DIR_NAME, BLOB_GC_GRACE_SECONDS
+
+
+class HashingFile:
+    """
+    Binary file wrapper computing the sha256 digest of everything written through it.
+    """
+
+    def __init__(self, file_obj) -> None:
+        self.file_obj = file_obj
+        self.file_hash = hashlib.sha256()
+
+    def write(self, data) -> int:
+        self.file_hash.update(data)
+        return self.file_obj.write(data)
+
+    def flush(self):
+        self.file_obj.flush()
+
+    def read(self, size: int = -1):
+        #writers such as np.savez tell file objects from paths by a read attribute
+        raise io.UnsupportedOperation("read")
+
+    def hexdigest(self) -> str:
+        return self.file_hash.hexdigest()
+
+
+class BlobStore:
+    """
+    Content addressed store of artifact files. A file is stored once under the sha256 of its
+    content and every artifact path holding that content is a hard link to the stored blob,
+    so identical outputs of consecutive runs take the disk space of one file. Content is
+    hashed while it is written. Blobs are read-only: artifact files are replaced, never
+    modified in place. Blobs no artifact path links to any more are removed by collect_garbage.
+    Where hard links are not supported the artifact file is a copy of the blob.
+    """
+
+    def __init__(self, blob_dir: str) -> None:
+        try:
+            self.blob_dir = blob_dir
+            os.makedirs(blob_dir, exist_ok=True)
+        except Exception as e:
+            raise ConcreteException(e, sys) from e
+
+    def get_blob_path(self, digest: str) -> str:
+        return os.path.join(self.blob_dir, digest[:2], digest)
+
+    def commit(self, temp_file_path: str, digest: str, file_path: str):
+        """
+        Moves the written temp file into the store, unless the content is stored already,
+        and links file_path to the blob.
+        """
+        try:
+            blob_path = self.get_blob_path(digest)
+            os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+            is_duplicate = os.path.exists(blob_path)
+            if is_duplicate:
+                os.remove(temp_file_path)
+            else:
+                os.chmod(temp_file_path, 0o444)
+                os.replace(temp_file_path, blob_path)
+            os.makedirs(os.path.dirname(file_path) or ".", exist_ok=True)
+            #link under a temp name and rename, file_path is replaced and never written through
+            link_path = os.path.join(os.path.dirname(file_path) or ".", f".{os.path.basename(file_path)}.{digest[:16]}")
+            try:
+                os.link(blob_path, link_path)
+            except FileNotFoundError:
+                #removed by a concurrent garbage collection between the check and the link
+                raise Exception(f"Blob [{blob_path}] was removed while linking [{file_path}]")
+            except OSError:
+                shutil.copyfile(blob_path, link_path)
+            os.replace(link_path, file_path)
+            logging.info(f"Artifact [{file_path}] stored as blob [{digest}]"
+                         f"{', deduplicated' if is_duplicate else ''}.")
+        except Exception as e:
+            raise ConcreteException(e, sys) from e
+
+    @contextmanager
+    def open(self, file_path: str):
+        """
+        Yields a binary file to write the content of file_path to. On exit the content is
+        stored in the blob store and file_path links to it.
+        """
+        temp_fd, temp_file_path = tempfile.mkstemp(dir=self.blob_dir, prefix=".")
+        try:
+            with os.fdopen(temp_fd, "wb") as temp_file:
+                hashing_file = HashingFile(temp_file)
+                yield hashing_file
+            digest = hashing_file.hexdigest()
+        except BaseException:
+            if os.path.exists(temp_file_path):
+                os.remove(temp_file_path)
+            raise
+        self.commit(temp_file_path=temp_file_path, digest=digest, file_path=file_path)
+
+    def put_file(self, file_path: str, block_size: int = 1024*1024):
+        """
+        Stores a file written outside the blob store and replaces it with a link to the blob.
+        """
+        try:
+            with self.open(file_path) as blob_file, open(file_path, "rb") as file_obj:
+                for block in iter(lambda: file_obj.read(block_size), b""):
+                    blob_file.write(block)
+        except Exception as e:
+            raise ConcreteException(e, sys) from e
+
+    def collect_garbage(self) -> int:
+        """
+        Removes the blobs no artifact file links to. Blobs changed within the grace period are
+        kept, they may be about to be linked. Returns the number of removed blobs.
+        """
+        try:
+            removed_blobs = 0
+            oldest_change_time = time.time() - BLOB_GC_GRACE_SECONDS
+            for prefix_dir_name in os.listdir(self.blob_dir):
+                prefix_dir = os.path.join(self.blob_dir, prefix_dir_name)
+                if not os.path.isdir(prefix_dir):
+                    continue
+                for blob_name in os.listdir(prefix_dir):
+                    blob_path = os.path.join(prefix_dir, blob_name)
+                    blob_stat = os.stat(blob_path)
+                    if blob_stat.st_nlink <= 1 and blob_stat.st_ctime < oldest_change_time:
+                        os.remove(blob_path)
+                        removed_blobs += 1
+            logging.info(f"Removed {removed_blobs} unreferenced blobs from [{self.blob_dir}]")
+            return removed_blobs
+        except Exception as e:
+            raise ConcreteException(e, sys) from e
+
+
+def get_blob_store(artifact_dir: str) -> BlobStore:
+    try:
+        return BlobStore(blob_dir=os.path.join(artifact_dir, BLOB_STORE_DIR_NAME))
+    except Exception as e:
+        raise ConcreteException(e, sys) from e
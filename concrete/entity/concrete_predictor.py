@@ -1,8 +1,9 @@
 import os
 import sys
 from concrete.exception import ConcreteException
-from concrete.util.util import load_object
-import pandas as pd, numpy as np
+from concrete.util.util import load_split_object
+from concrete.entity.model_registry import ModelRegistry
+import numpy as np
 
 
 class ConcreteData:
@@ -34,6 +35,7 @@ class ConcreteData:
     def get_concrete_input_data_frame(self):
 
         try:
+            import pandas as pd
             concrete_input_dict = self.get_concrete_data_as_dict()
             return pd.DataFrame(concrete_input_dict)
         except Exception as e:
@@ -57,6 +59,8 @@ class ConcreteData:
 
 
 class ConcretePredictor:
+    #loaded models keyed by file path, exported model files are never modified
+    loaded_models: dict = {}
 
     def __init__(self, model_dir: str):
         try:
@@ -66,19 +70,47 @@ class ConcretePredictor:
 
     def get_latest_model_path(self):
         try:
-            folder_name = list(map(int, os.listdir(self.model_dir)))
-            latest_model_dir = os.path.join(self.model_dir, f"{max(folder_name)}")
-            file_name = os.listdir(latest_model_dir)[0]
-            latest_model_path = os.path.join(latest_model_dir, file_name)
-            return latest_model_path
+            return ModelRegistry(model_dir=self.model_dir).get_latest_model_path()
+        except Exception as e:
+            raise ConcreteException(e, sys) from e
+
+    @staticmethod
+    def load_model(model_path: str):
+        try:
+            model = ConcretePredictor.loaded_models.get(model_path)
+            if model is None:
+                model = load_split_object(file_path=model_path)
+                ConcretePredictor.loaded_models[model_path] = model
+            return model
+        except Exception as e:
+            raise ConcreteException(e, sys) from e
+
+    @staticmethod
+    def unload_models(keep_model_paths: list):
+        """
+        Drops the loaded models other than keep_model_paths.
+        """
+        try:
+            for model_path in list(ConcretePredictor.loaded_models):
+                if model_path not in keep_model_paths:
+                    del ConcretePredictor.loaded_models[model_path]
         except Exception as e:
             raise ConcreteException(e, sys) from e
 
     def predict(self, X):
         try:
-            model_path = self.get_latest_model_path()
-            model = load_object(file_path=model_path)
+            model = ConcretePredictor.load_model(model_path=self.get_latest_model_path())
             concrete_compressive_strength = model.predict(X)
             return concrete_compressive_strength
+        except Exception as e:
+            raise ConcreteException(e, sys) from e
+
+    def predict_with_interval(self, X):
+        """
+        Returns a PredictionInterval of the latest model: predictions, interval bounds and coverage.
+        """
+        try:
+            model = ConcretePredictor.load_model(model_path=self.get_latest_model_path())
+            return model.predict_with_interval(X)
         except Exception as e:
             raise ConcreteException(e, sys) from e
\ No newline at end of file
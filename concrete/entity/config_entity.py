@@ -5,26 +5,54 @@ DataInjestionConfig = namedtuple('DataIngestionConfig',
                                 ['dataset_download_url',
                                 'raw_data_dir',
                                 'ingested_train_dir', 
-                                'ingested_test_dir'])
+                                'ingested_test_dir',
+                                'split_chunk_size',
+                                'test_size',
+                                'split_random_state',
+                                'memory_budget_mb'])
 
 DataValidationConfig = namedtuple('DataValidationConfig',
                                     ['schema_file_path',
                                     'report_file_path',
-                                    'report_page_file_path'])
+                                    'report_page_file_path',
+                                    'memory_budget_mb'])
 
 DataTransformationConfig = namedtuple('DataTransformationConfig',
                                     ['transformed_train_dir',
                                     'transformed_test_dir',
-                                    'preprocessed_object_file_path']) #pickle file path
+                                    'preprocessed_object_file_path', #pickle file path
+                                    'preprocessor_store_dir',
+                                    'memory_budget_mb'])
 
 ModelTrainerConfig = namedtuple('ModelTrainerConfig',
                             ['trained_model_file_path', #pickle file path
                             'base_accuracy',
-                            'model_config_file_path'])
+                            'model_config_file_path',
+                            'retrain_mode', #full or incremental
+                            'warm_start_n_estimators',
+                            'model_evaluation_file_path'])
 
 ModelEvaluationConfig = namedtuple('ModelEvaluationConfig',
-                                ['model_evaluation_file_path', 'time_stamp'])
-
-ModelPusherConfig = namedtuple('ModelPusherConfig',['export_dir_path'])
-
-TrainingPipelineConfig = namedtuple("TrainingPipelineConfig", ["artifact_dir"])
\ No newline at end of file
+                                ['model_evaluation_file_path', 'time_stamp',
+                                'bootstrap_resamples', 'confidence_level'])
+
+ModelPusherConfig = namedtuple('ModelPusherConfig',['export_dir_path', 'archive_model'])
+
+ModelServingConfig = namedtuple('ModelServingConfig', ['model_dir',
+                                                       'champion_version', #None serves the latest registered model
+                                                       'challenger_version',
+                                                       'challenger_traffic_fraction',
+                                                       'shadow_scoring',
+                                                       'shadow_max_workers'])
+
+TrainingPipelineConfig = namedtuple("TrainingPipelineConfig", ["artifact_dir", "max_workers", "training_worker_niceness",
+                                                               "training_job_poll_interval",
+                                                               "profile", #sample the pipeline stages with the profiler
+                                                               "profile_sample_interval"])
+
+RetentionConfig = namedtuple("RetentionConfig", ["artifact_dir", "archive_dir",
+                                                 "keep_last_runs", #runs of accepted models are kept as well
+                                                 "archive_expired_runs", #false deletes expired runs without archiving
+                                                 "log_dir", "log_retention_days",
+                                                 #index files whose entries pin runs, or refer to their files
+                                                 "model_evaluation_file_path", "preprocessor_store_dir", "model_dir"])
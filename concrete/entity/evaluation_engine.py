@@ -0,0 +1,104 @@
+from concrete.exception import ConcreteException
+from concrete.logger import logging
+from collections import namedtuple
+import numpy as np
+import sys
+
+#upper bound on the number of elements of a resampled prediction matrix held at once
+MAX_RESAMPLE_BATCH_ELEMENTS = 10_000_000
+
+ConfidenceInterval = namedtuple("ConfidenceInterval", ["mean", "lower", "upper"])
+
+BootstrapMetricInfo = namedtuple("BootstrapMetricInfo", ["r2", "rmse", "mae"])
+
+
+class BootstrapEvaluator:
+    """
+    Computes regression metrics with confidence intervals over bootstrap resamples of a dataset.
+    Resample indices are drawn batch by batch from a generator seeded with random_state and the
+    batch number, so only one batch of indices is held at a time and every model scored with the
+    evaluator is compared on the same resamples (paired bootstrap).
+    Metrics are computed from prediction vectors, models are never asked to predict again.
+    """
+
+    def __init__(self, y_true: np.ndarray, n_resamples: int = 1000, confidence_level: float = 0.95,
+                 random_state: int = 13) -> None:
+        try:
+            self.y_true = np.ravel(y_true).astype(np.float64)
+            self.n_resamples = n_resamples
+            self.confidence_level = confidence_level
+            self.random_state = random_state
+            n_samples = len(self.y_true)
+            self.index_dtype = np.int32 if n_samples < np.iinfo(np.int32).max else np.int64
+            self.batch_size = max(1, MAX_RESAMPLE_BATCH_ELEMENTS // max(n_samples, 1))
+        except Exception as e:
+            raise ConcreteException(e, sys) from e
+
+    def get_resample_indices(self, start: int) -> np.ndarray:
+        """
+        Row indices of the batch of resamples starting at start, the same on every call.
+        """
+        try:
+            n_samples = len(self.y_true)
+            random_generator = np.random.default_rng([self.random_state, start // self.batch_size])
+            return random_generator.integers(0, n_samples, size=(min(self.batch_size, self.n_resamples - start), n_samples),
+                                             dtype=self.index_dtype)
+        except Exception as e:
+            raise ConcreteException(e, sys) from e
+
+    def get_resampled_metrics(self, y_pred: np.ndarray) -> tuple:
+        """
+        Returns arrays of r2, rmse and mae with one value per bootstrap resample.
+        """
+        try:
+            y_pred = np.ravel(y_pred).astype(np.float64)
+            r2, rmse, mae = (np.empty(self.n_resamples) for _ in range(3))
+            for start in range(0, self.n_resamples, self.batch_size):
+                batch = slice(start, start + self.batch_size)
+                indices = self.get_resample_indices(start)
+                y_true_sample = self.y_true[indices]
+                error = y_pred[indices] - y_true_sample
+                squared_error_sum = np.einsum('ij,ij->i', error, error)
+                centered_y_true = y_true_sample - y_true_sample.mean(axis=1, keepdims=True)
+                total_sum_of_squares = np.einsum('ij,ij->i', centered_y_true, centered_y_true)
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    r2[batch] = 1 - squared_error_sum / total_sum_of_squares
+                rmse[batch] = np.sqrt(squared_error_sum / indices.shape[1])
+                mae[batch] = np.abs(error).mean(axis=1)
+            return r2, rmse, mae
+        except Exception as e:
+            raise ConcreteException(e, sys) from e
+
+    def get_confidence_interval(self, values: np.ndarray) -> ConfidenceInterval:
+        try:
+            alpha = (1 - self.confidence_level) / 2
+            lower, upper = np.nanquantile(values, [alpha, 1 - alpha])
+            return ConfidenceInterval(mean=float(np.nanmean(values)), lower=float(lower), upper=float(upper))
+        except Exception as e:
+            raise ConcreteException(e, sys) from e
+
+    def evaluate(self, y_pred: np.ndarray) -> BootstrapMetricInfo:
+        try:
+            r2, rmse, mae = self.get_resampled_metrics(y_pred)
+            return BootstrapMetricInfo(r2=self.get_confidence_interval(r2),
+                                       rmse=self.get_confidence_interval(rmse),
+                                       mae=self.get_confidence_interval(mae))
+        except Exception as e:
+            raise ConcreteException(e, sys) from e
+
+    def compare(self, baseline_y_pred: np.ndarray, candidate_y_pred: np.ndarray) -> BootstrapMetricInfo:
+        """
+        Returns confidence intervals of the candidate minus baseline difference of each metric,
+        computed resample by resample.
+        """
+        try:
+            baseline_metrics = self.get_resampled_metrics(baseline_y_pred)
+            candidate_metrics = self.get_resampled_metrics(candidate_y_pred)
+            r2, rmse, mae = (candidate - baseline for baseline, candidate in zip(baseline_metrics, candidate_metrics))
+            metric_difference = BootstrapMetricInfo(r2=self.get_confidence_interval(r2),
+                                                    rmse=self.get_confidence_interval(rmse),
+                                                    mae=self.get_confidence_interval(mae))
+            logging.info(f"Bootstrap difference of candidate over baseline: {metric_difference}")
+            return metric_difference
+        except Exception as e:
+            raise ConcreteException(e, sys) from e
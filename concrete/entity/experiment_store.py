@@ -0,0 +1,196 @@
+import os
+import sys
+import sqlite3
+from datetime import datetime
+import pandas as pd
+import numpy as np
+from contextlib import contextmanager
+from concrete.exception import ConcreteException
+from concrete.logger import logging
+
+EXPERIMENT_COLUMNS = ["experiment_id", "initialization_timestamp", "artifact_time_stamp", "running_status",
+                      "start_time", "stop_time", "execution_time", "message", "experiment_file_path",
+                      "accuracy", "is_model_accepted", "created_time_stamp"]
+
+CSV_IMPORTED_KEY = "csv_imported"
+
+CREATE_TABLE_STATEMENTS = [
+    """CREATE TABLE IF NOT EXISTS experiment (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        experiment_id TEXT NOT NULL UNIQUE,
+        initialization_timestamp TEXT,
+        artifact_time_stamp TEXT,
+        running_status INTEGER,
+        start_time TEXT,
+        stop_time TEXT,
+        execution_time TEXT,
+        message TEXT,
+        experiment_file_path TEXT,
+        accuracy REAL,
+        is_model_accepted INTEGER,
+        created_time_stamp TEXT)""",
+    "CREATE INDEX IF NOT EXISTS experiment_start_time_index ON experiment (start_time)",
+    """CREATE TABLE IF NOT EXISTS stage_timing (
+        experiment_id TEXT NOT NULL,
+        stage_name TEXT NOT NULL,
+        start_time TEXT,
+        stop_time TEXT,
+        execution_time REAL,
+        PRIMARY KEY (experiment_id, stage_name))""",
+    """CREATE TABLE IF NOT EXISTS metric (
+        experiment_id TEXT NOT NULL,
+        metric_name TEXT NOT NULL,
+        metric_value REAL,
+        PRIMARY KEY (experiment_id, metric_name))""",
+    "CREATE TABLE IF NOT EXISTS store_info (key TEXT PRIMARY KEY, value TEXT)",
+]
+
+
+class ExperimentStore:
+    """
+    SQLite backed store of pipeline experiments, their stage timings and metrics.
+    The database runs in WAL mode so that several web workers can read while the
+    training pipeline writes. The experiment history kept in the legacy experiment
+    csv file is imported the first time the store is opened.
+    """
+
+    def __init__(self, db_file_path: str, legacy_csv_file_path: str = None) -> None:
+        try:
+            self.db_file_path = db_file_path
+            self.legacy_csv_file_path = legacy_csv_file_path
+            os.makedirs(os.path.dirname(db_file_path), exist_ok=True)
+            with self.get_connection() as connection:
+                connection.execute("PRAGMA journal_mode=WAL")
+                for statement in CREATE_TABLE_STATEMENTS:
+                    connection.execute(statement)
+            self.import_legacy_csv()
+        except Exception as e:
+            raise ConcreteException(e, sys) from e
+
+    @contextmanager
+    def get_connection(self):
+        """
+        Yields a connection committing on success, rolling back on error, and closes it.
+        """
+        connection = sqlite3.connect(self.db_file_path, timeout=30)
+        try:
+            connection.execute("PRAGMA busy_timeout=30000")
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    @staticmethod
+    def to_db_value(value):
+        if isinstance(value, (bool, np.bool_)):
+            return int(value)
+        if value is None or isinstance(value, (int, float, str)):
+            return value
+        if pd.isna(value):
+            return None
+        return str(value)
+
+    def import_legacy_csv(self):
+        try:
+            with self.get_connection() as connection:
+                #write lock so that only one worker imports the csv
+                connection.execute("BEGIN IMMEDIATE")
+                row = connection.execute("SELECT value FROM store_info WHERE key = ?", (CSV_IMPORTED_KEY,)).fetchone()
+                if row is not None:
+                    return
+                imported_rows = 0
+                if self.legacy_csv_file_path is not None and os.path.exists(self.legacy_csv_file_path):
+                    experiment_df = pd.read_csv(self.legacy_csv_file_path)
+                    experiment_df = experiment_df.reindex(columns=EXPERIMENT_COLUMNS)
+                    #the csv holds one row per save, the last one of an experiment is its final state
+                    experiment_df = experiment_df.drop_duplicates(subset=["experiment_id"], keep="last")
+                    for record in experiment_df.to_dict(orient="records"):
+                        self.upsert_experiment(connection, record)
+                    imported_rows = len(experiment_df)
+                connection.execute("INSERT INTO store_info (key, value) VALUES (?, ?)",
+                                   (CSV_IMPORTED_KEY, str(datetime.now())))
+            logging.info(f"Imported {imported_rows} experiments from [{self.legacy_csv_file_path}] "
+                         f"into [{self.db_file_path}]")
+        except Exception as e:
+            raise ConcreteException(e, sys) from e
+
+    def upsert_experiment(self, connection: sqlite3.Connection, record: dict):
+        values = [ExperimentStore.to_db_value(record.get(column)) for column in EXPERIMENT_COLUMNS]
+        update_clause = ", ".join(f"{column} = excluded.{column}" for column in EXPERIMENT_COLUMNS[1:])
+        connection.execute(f"INSERT INTO experiment ({', '.join(EXPERIMENT_COLUMNS)}) "
+                           f"VALUES ({', '.join(['?'] * len(EXPERIMENT_COLUMNS))}) "
+                           f"ON CONFLICT (experiment_id) DO UPDATE SET {update_clause}", values)
+
+    def save_experiment(self, experiment_record: dict):
+        """
+        Inserts the experiment or updates it if it has already been saved.
+        """
+        try:
+            experiment_record = dict(experiment_record)
+            experiment_record.setdefault("created_time_stamp", datetime.now())
+            with self.get_connection() as connection:
+                self.upsert_experiment(connection, experiment_record)
+        except Exception as e:
+            raise ConcreteException(e, sys) from e
+
+    def save_stage_timings(self, experiment_id: str, stage_runs: list):
+        """
+        stage_runs: list of StageRun of the experiment
+        """
+        try:
+            rows = [(experiment_id, stage_run.name, str(stage_run.start_time), str(stage_run.stop_time),
+                     stage_run.execution_time) for stage_run in stage_runs]
+            with self.get_connection() as connection:
+                connection.executemany("INSERT OR REPLACE INTO stage_timing "
+                                       "(experiment_id, stage_name, start_time, stop_time, execution_time) "
+                                       "VALUES (?, ?, ?, ?, ?)", rows)
+        except Exception as e:
+            raise ConcreteException(e, sys) from e
+
+    def save_metrics(self, experiment_id: str, metrics: dict):
+        try:
+            rows = [(experiment_id, metric_name, None if metric_value is None else float(metric_value))
+                    for metric_name, metric_value in metrics.items()]
+            with self.get_connection() as connection:
+                connection.executemany("INSERT OR REPLACE INTO metric (experiment_id, metric_name, metric_value) "
+                                       "VALUES (?, ?, ?)", rows)
+        except Exception as e:
+            raise ConcreteException(e, sys) from e
+
+    def get_experiments(self, limit: int = 5, page: int = 1) -> pd.DataFrame:
+        """
+        Returns a page of experiments, most recent first.
+        """
+        try:
+            offset = (max(int(page), 1) - 1) * int(limit)
+            with self.get_connection() as connection:
+                return pd.read_sql_query(f"SELECT {', '.join(EXPERIMENT_COLUMNS)} FROM experiment "
+                                         "ORDER BY id DESC LIMIT ? OFFSET ?",
+                                         connection, params=(int(limit), offset))
+        except Exception as e:
+            raise ConcreteException(e, sys) from e
+
+    def get_experiment_count(self) -> int:
+        try:
+            with self.get_connection() as connection:
+                return connection.execute("SELECT COUNT(*) FROM experiment").fetchone()[0]
+        except Exception as e:
+            raise ConcreteException(e, sys) from e
+
+    def get_stage_timings(self, experiment_id: str) -> pd.DataFrame:
+        try:
+            with self.get_connection() as connection:
+                return pd.read_sql_query("SELECT stage_name, start_time, stop_time, execution_time FROM stage_timing "
+                                         "WHERE experiment_id = ? ORDER BY start_time",
+                                         connection, params=(experiment_id,))
+        except Exception as e:
+            raise ConcreteException(e, sys) from e
+
+    def get_metrics(self, experiment_id: str) -> dict:
+        try:
+            with self.get_connection() as connection:
+                rows = connection.execute("SELECT metric_name, metric_value FROM metric WHERE experiment_id = ?",
+                                          (experiment_id,)).fetchall()
+            return dict(rows)
+        except Exception as e:
+            raise ConcreteException(e, sys) from e
@@ -0,0 +1,129 @@
+import os
+import sys
+import math
+import numpy as np
+import pandas as pd
+from concrete.exception import ConcreteException
+from concrete.logger import logging
+from concrete.constants import (PROCESSING_MODE_IN_MEMORY, PROCESSING_MODE_CHUNKED, MEMORY_ESTIMATE_SAMPLE_BYTES,
+                                MEMORY_OBJECT_VALUE_BYTES, MEMORY_MIN_CHUNK_ROWS)
+
+
+class MemoryBudget:
+    """
+    Memory a pipeline stage may use for its data. The footprint of a csv file is estimated
+    before it is loaded: the row count from the file size and the length of its first lines,
+    the bytes per row from the column dtypes of the schema. A stage whose estimate exceeds the
+    budget processes its files in chunks instead of loading them.
+    budget_mb: None disables the budget, every file is then processed in memory
+    working_set_factor (of the methods below): copies of the data a stage holds at the same
+                                              time, e.g. a data frame and its transformed array
+    """
+
+    def __init__(self, stage_name: str, budget_mb: float = None) -> None:
+        try:
+            self.stage_name = stage_name
+            self.budget_bytes = None if budget_mb is None else int(budget_mb * 1024 * 1024)
+        except Exception as e:
+            raise ConcreteException(e, sys) from e
+
+    @staticmethod
+    def estimate_row_count(file_path: str) -> int:
+        """
+        Exact for files smaller than the sample read, else the file size divided by the
+        mean length of the sampled lines.
+        """
+        try:
+            file_size = os.path.getsize(file_path)
+            with open(file_path, "rb") as file_obj:
+                sample = file_obj.read(MEMORY_ESTIMATE_SAMPLE_BYTES)
+            header_end = sample.find(b"\n") + 1
+            if header_end == 0:
+                return 0
+            body = sample[header_end:]
+            if len(sample) == file_size:
+                return body.count(b"\n") + int(len(body) > 0 and not body.endswith(b"\n"))
+            sampled_lines = body.count(b"\n")
+            if sampled_lines == 0:
+                return 1
+            mean_line_bytes = (body.rfind(b"\n") + 1) / sampled_lines
+            return math.ceil((file_size - header_end) / mean_line_bytes)
+        except Exception as e:
+            raise ConcreteException(e, sys) from e
+
+    @staticmethod
+    def get_row_bytes(schema_columns: dict) -> int:
+        """
+        Bytes of one row of a data frame with the columns and dtypes of schema_columns.
+        """
+        try:
+            row_bytes = 0
+            for dtype in schema_columns.values():
+                try:
+                    dtype = np.dtype(dtype)
+                    row_bytes += MEMORY_OBJECT_VALUE_BYTES if dtype.kind in "OSU" else dtype.itemsize
+                except TypeError:
+                    row_bytes += MEMORY_OBJECT_VALUE_BYTES
+            return max(row_bytes, 1)
+        except Exception as e:
+            raise ConcreteException(e, sys) from e
+
+    @staticmethod
+    def get_header_columns(file_path: str) -> dict:
+        """
+        Columns of a csv file without a schema, as the 64 bit values pandas parses numbers to.
+        """
+        try:
+            return {column: "float64" for column in pd.read_csv(file_path, nrows=0).columns}
+        except Exception as e:
+            raise ConcreteException(e, sys) from e
+
+    def estimate_csv_bytes(self, file_path: str, schema_columns: dict) -> int:
+        try:
+            row_count = MemoryBudget.estimate_row_count(file_path)
+            row_bytes = MemoryBudget.get_row_bytes(schema_columns)
+            logging.info(f"[{self.stage_name}] estimated [{file_path}] at {row_count} rows of {row_bytes} bytes.")
+            return row_count * row_bytes
+        except Exception as e:
+            raise ConcreteException(e, sys) from e
+
+    def choose_processing_mode(self, estimated_bytes: int, working_set_factor: float = 1) -> str:
+        try:
+            working_set_bytes = int(estimated_bytes * working_set_factor)
+            if self.budget_bytes is None or working_set_bytes <= self.budget_bytes:
+                processing_mode = PROCESSING_MODE_IN_MEMORY
+            else:
+                processing_mode = PROCESSING_MODE_CHUNKED
+            logging.info(f"[{self.stage_name}] estimated working set: {working_set_bytes} bytes, "
+                         f"memory budget: {self.budget_bytes} bytes, processing mode: [{processing_mode}]")
+            return processing_mode
+        except Exception as e:
+            raise ConcreteException(e, sys) from e
+
+    def get_chunk_rows(self, row_bytes: int, working_set_factor: float = 1) -> int:
+        """
+        Rows of a chunk that fits the budget, at least MEMORY_MIN_CHUNK_ROWS.
+        """
+        try:
+            if self.budget_bytes is None:
+                return sys.maxsize
+            return max(MEMORY_MIN_CHUNK_ROWS, int(self.budget_bytes / (row_bytes * working_set_factor)))
+        except Exception as e:
+            raise ConcreteException(e, sys) from e
+
+    @staticmethod
+    def read_csv_sample(file_path: str, max_rows: int, chunk_rows: int) -> pd.DataFrame:
+        """
+        Every k-th row of a csv file, k chosen so that at most about max_rows rows are kept.
+        The file is read chunk by chunk, only the sample is held in memory.
+        """
+        try:
+            step = max(1, math.ceil(MemoryBudget.estimate_row_count(file_path) / max_rows))
+            samples, position = [], 0
+            for chunk in pd.read_csv(file_path, chunksize=chunk_rows):
+                samples.append(chunk.iloc[(-position) % step::step])
+                position += len(chunk)
+            logging.info(f"Sampled every {step} rows of [{file_path}]")
+            return pd.concat(samples, ignore_index=True)
+        except Exception as e:
+            raise ConcreteException(e, sys) from e
@@ -0,0 +1,181 @@
+import sys
+import time
+import numpy as np
+from collections import namedtuple
+from concrete.exception import ConcreteException
+from concrete.logger import logging
+from concrete.entity.prediction_input_validator import PredictionInputValidator
+from concrete.entity.batch_predictor import BatchPredictor
+from concrete.constants import MIX_DESIGN_POPULATION_SIZE, MIX_DESIGN_GENERATIONS, MIX_DESIGN_ELITE_FRACTION, \
+    MIX_DESIGN_MAX_POPULATION_SIZE, MIX_DESIGN_MAX_GENERATIONS, MIX_DESIGN_TIME_LIMIT_SECONDS
+
+AGE_COLUMN_NAME = "age"
+#smallest standard deviation of an ingredient's sampling distribution, as a fraction of its bounds' width
+MIN_STD_FRACTION = 1e-3
+
+#mass_bounds: (min, max) kg/m3 of the ingredients summed, None when the model did not record it
+MixDesignRequest = namedtuple("MixDesignRequest", ["target_strength", "age", "unit_costs", "lower_bounds", "upper_bounds",
+                                                   "mass_bounds", "population_size", "generations", "random_state"])
+
+#extrapolated_inputs: inputs of the mix, and "mass", outside the ranges of the model's training data
+MixDesign = namedtuple("MixDesign", ["mix", "predicted_strength", "cost", "mass", "is_feasible", "extrapolated_inputs",
+                                     "evaluated_candidates", "generations", "execution_time"])
+
+
+class MixDesignOptimizer:
+    """
+    Searches the cheapest mix reaching a target compressive strength at a given age with the
+    cross entropy method. Every generation samples a population of candidate mixes, clipped to
+    the ingredient bounds, predicts the whole population in one vectorized call and refits a
+    normal distribution per ingredient to the best candidates (the elite). The first generation
+    is sampled uniformly within the bounds.
+    Candidates are ranked by cost plus a shortfall penalty under which a mix missing the target
+    by 1 MPa, or outside the mass bounds by 1 kg, ranks after the most expensive mix meeting them.
+    The ingredient bounds default to the ranges of the training data recorded with the model,
+    within the schema bounds, and the mass bounds to the range of the training mixes' mass, so
+    mixes stay buildable and within the data the model was fitted on. Requested bounds may reach
+    the schema bounds, a mix outside the training ranges is reported as extrapolated.
+    Ingredient amounts are in kg/m3, costs per kg, age in days.
+    """
+
+    def __init__(self, model, input_validator: PredictionInputValidator) -> None:
+        try:
+            self.input_validator = input_validator
+            self.columns = input_validator.columns
+            self.age_index = self.columns.index(AGE_COLUMN_NAME)
+            self.ingredient_indices = [index for index, column in enumerate(self.columns) if column != AGE_COLUMN_NAME]
+            self.ingredients = [self.columns[index] for index in self.ingredient_indices]
+            self.batch_predictor = BatchPredictor(model=model, columns=self.columns)
+            input_ranges = model.input_ranges or dict()
+            self.training_lower_bounds = np.array([input_ranges.get(column, (-np.inf, np.inf))[0] for column in self.columns])
+            self.training_upper_bounds = np.array([input_ranges.get(column, (-np.inf, np.inf))[1] for column in self.columns])
+            self.mass_range = model.mass_range
+        except Exception as e:
+            raise ConcreteException(e, sys) from e
+
+    def validate_request(self, payload) -> tuple:
+        """
+        payload: dict with target_strength, age, costs (ingredient: cost per kg, every ingredient),
+                 optionally bounds (ingredient: [min, max] within the schema bounds),
+                 population_size, generations and random_state
+        Returns a MixDesignRequest and None, or None and an error message.
+        """
+        try:
+            if not isinstance(payload, dict):
+                return None, "Request body must be a JSON object."
+            try:
+                target_strength = float(payload["target_strength"])
+                age = float(payload["age"])
+            except (KeyError, TypeError, ValueError):
+                return None, "target_strength and age must be numbers."
+            age_bounds = (self.input_validator.lower_bounds[self.age_index], self.input_validator.upper_bounds[self.age_index])
+            if not np.isfinite(target_strength) or not age_bounds[0] <= age <= age_bounds[1]:
+                return None, f"target_strength must be finite and age within [{age_bounds[0]}, {age_bounds[1]}]."
+            costs = payload.get("costs")
+            costs_message = f"costs must give the cost per kg of each ingredient: {self.ingredients}"
+            if not isinstance(costs, dict) or set(costs) != set(self.ingredients):
+                return None, costs_message
+            try:
+                unit_costs = np.array([costs[ingredient] for ingredient in self.ingredients], dtype=np.float64)
+            except (TypeError, ValueError):
+                return None, costs_message
+            if not np.isfinite(unit_costs).all() or (unit_costs < 0).any():
+                return None, "Costs must be finite and not negative."
+            schema_lower_bounds = self.input_validator.lower_bounds[self.ingredient_indices]
+            schema_upper_bounds = self.input_validator.upper_bounds[self.ingredient_indices]
+            lower_bounds = np.maximum(schema_lower_bounds, self.training_lower_bounds[self.ingredient_indices])
+            upper_bounds = np.minimum(schema_upper_bounds, self.training_upper_bounds[self.ingredient_indices])
+            bounds = payload.get("bounds") or dict()
+            if not isinstance(bounds, dict) or not set(bounds) <= set(self.ingredients):
+                return None, f"bounds must map ingredients to [min, max]: {self.ingredients}"
+            for ingredient, ingredient_bounds in bounds.items():
+                index = self.ingredients.index(ingredient)
+                try:
+                    lower_bound, upper_bound = (float(value) for value in ingredient_bounds)
+                except (TypeError, ValueError):
+                    return None, f"Bounds of {ingredient} must be [min, max]."
+                if not schema_lower_bounds[index] <= lower_bound <= upper_bound <= schema_upper_bounds[index]:
+                    return None, (f"Bounds of {ingredient} must be ordered and within "
+                                  f"[{schema_lower_bounds[index]}, {schema_upper_bounds[index]}].")
+                lower_bounds[index], upper_bounds[index] = lower_bound, upper_bound
+            if not (np.isfinite(lower_bounds).all() and np.isfinite(upper_bounds).all()):
+                return None, f"Every ingredient needs finite bounds: {self.ingredients}"
+            try:
+                population_size = int(payload.get("population_size", MIX_DESIGN_POPULATION_SIZE))
+                generations = int(payload.get("generations", MIX_DESIGN_GENERATIONS))
+                random_state = payload.get("random_state")
+                random_state = None if random_state is None else int(random_state)
+            except (TypeError, ValueError):
+                return None, "population_size, generations and random_state must be integers."
+            if not 1 <= population_size <= MIX_DESIGN_MAX_POPULATION_SIZE or not 1 <= generations <= MIX_DESIGN_MAX_GENERATIONS:
+                return None, (f"population_size must be within [1, {MIX_DESIGN_MAX_POPULATION_SIZE}] "
+                              f"and generations within [1, {MIX_DESIGN_MAX_GENERATIONS}].")
+            return MixDesignRequest(target_strength=target_strength, age=age, unit_costs=unit_costs,
+                                    lower_bounds=lower_bounds, upper_bounds=upper_bounds,
+                                    mass_bounds=None if self.mass_range is None else tuple(self.mass_range),
+                                    population_size=population_size, generations=generations,
+                                    random_state=random_state), None
+        except Exception as e:
+            raise ConcreteException(e, sys) from e
+
+    def optimize(self, mix_design_request: MixDesignRequest) -> MixDesign:
+        try:
+            start_time = time.perf_counter()
+            random_generator = np.random.default_rng(mix_design_request.random_state)
+            lower_bounds, upper_bounds = mix_design_request.lower_bounds, mix_design_request.upper_bounds
+            unit_costs = mix_design_request.unit_costs
+            population_size = mix_design_request.population_size
+            min_std = (upper_bounds - lower_bounds) * MIN_STD_FRACTION
+            elite_count = max(1, int(population_size * MIX_DESIGN_ELITE_FRACTION))
+            shortfall_penalty = max(float(unit_costs @ upper_bounds), 1.0)
+            mass_lower, mass_upper = mix_design_request.mass_bounds or (-np.inf, np.inf)
+            X = np.empty((population_size, len(self.columns)))
+            X[:, self.age_index] = mix_design_request.age
+            mean, std = None, None
+            best_score, best_mix, best_strength, best_cost, best_mass = np.inf, None, None, None, None
+            generation = 0
+            while generation < mix_design_request.generations:
+                if mean is None:
+                    candidates = random_generator.uniform(lower_bounds, upper_bounds, size=(population_size, len(unit_costs)))
+                else:
+                    candidates = random_generator.normal(mean, std, size=(population_size, len(unit_costs)))
+                    np.clip(candidates, lower_bounds, upper_bounds, out=candidates)
+                X[:, self.ingredient_indices] = candidates
+                strength = self.batch_predictor.predict(X)
+                cost = candidates @ unit_costs
+                mass = candidates.sum(axis=1)
+                shortfall = np.maximum(mix_design_request.target_strength - strength, 0.0) + \
+                    np.maximum(mass_lower - mass, 0.0) + np.maximum(mass - mass_upper, 0.0)
+                score = cost + shortfall_penalty * shortfall
+                elite = np.argpartition(score, elite_count - 1)[:elite_count]
+                best_index = elite[np.argmin(score[elite])]
+                if score[best_index] < best_score:
+                    best_score, best_mix = score[best_index], X[best_index].copy()
+                    best_strength, best_cost, best_mass = strength[best_index], cost[best_index], mass[best_index]
+                mean = candidates[elite].mean(axis=0)
+                std = np.maximum(candidates[elite].std(axis=0), min_std)
+                generation += 1
+                if time.perf_counter() - start_time > MIX_DESIGN_TIME_LIMIT_SECONDS:
+                    logging.info(f"Mix design search stopped at the time limit after {generation} generations.")
+                    break
+                if (std <= min_std).all():
+                    break
+            extrapolated_inputs = [column for column, value, lower, upper in
+                                   zip(self.columns, best_mix, self.training_lower_bounds, self.training_upper_bounds)
+                                   if not lower <= value <= upper]
+            if self.mass_range is not None and not self.mass_range[0] <= best_mass <= self.mass_range[1]:
+                extrapolated_inputs.append("mass")
+            mix_design = MixDesign(mix={column: float(value) for column, value in zip(self.columns, best_mix)},
+                                   predicted_strength=float(best_strength),
+                                   cost=float(best_cost),
+                                   mass=float(best_mass),
+                                   is_feasible=bool(best_strength >= mix_design_request.target_strength
+                                                    and mass_lower <= best_mass <= mass_upper),
+                                   extrapolated_inputs=extrapolated_inputs,
+                                   evaluated_candidates=generation * population_size,
+                                   generations=generation,
+                                   execution_time=time.perf_counter() - start_time)
+            logging.info(f"Mix design for {mix_design_request.target_strength} MPa at {mix_design_request.age} days: {mix_design}")
+            return mix_design
+        except Exception as e:
+            raise ConcreteException(e, sys) from e
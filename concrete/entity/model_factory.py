@@ -3,7 +3,8 @@ from collections import namedtuple
 from concrete.logger import logging
 from typing import List
 import os,sys
-import yaml
+from concrete.config.config_loader import load_config_file
+from concrete.util.profiler import label as profiler_label
 import importlib
 import numpy as np
 from sklearn.metrics import r2_score, mean_squared_error
@@ -72,14 +73,39 @@ def evaluate_regression_model(model_list: list,
                                 ["model_name", "model_object", "train_rmse", "test_rmse", "train_accuracy",
                                  "test_accuracy", "model_accuracy", "index_number"])
     """
+    try:
+        prediction_list = [(model.predict(X_train), model.predict(X_test)) for model in model_list]
+        return evaluate_regression_predictions(model_list=model_list,
+                                               prediction_list=prediction_list,
+                                               y_train=y_train,
+                                               y_test=y_test,
+                                               base_accuracy=base_accuracy)
+    except Exception as e:
+        raise ConcreteException(e, sys) from e
+
+
+def evaluate_regression_predictions(model_list: list,
+                                    prediction_list: list,
+                                    y_train:np.ndarray,
+                                    y_test:np.ndarray,
+                                    base_accuracy:float=0.6) -> MetricInfoArtifact:
+    """
+    Description:
+    Same comparison as evaluate_regression_model on predictions already computed,
+    so that a model is never asked to predict the same dataset twice
+    Params:
+    model_list: List of model, or of model names for models that are not loaded
+    prediction_list: List of (train prediction, test prediction) tuple of each model
+    y_train: Training dataset target feature
+    y_test: Testing dataset target feature
+    """
     try:
         index_number = 0
         metric_info_artifact = None
-        for model in model_list:
+        y_train, y_test = np.ravel(y_train), np.ravel(y_test)
+        for model, (y_train_pred, y_test_pred) in zip(model_list, prediction_list):
             model_name = str(model)  #getting model name based on model object
-            logging.info(f"{'>>'*30}Started evaluating model: [{type(model).__name__}] {'<<'*30}")
-            y_train_pred = model.predict(X_train)
-            y_test_pred = model.predict(X_test)
+            logging.info(f"{'>>'*30}Started evaluating model: [{model_name}] {'<<'*30}")
             train_acc = r2_score(y_train, y_train_pred)
             test_acc = r2_score(y_test, y_test_pred)
             train_rmse = np.sqrt(mean_squared_error(y_train, y_train_pred))
@@ -128,8 +154,7 @@ class ModelFactory:
     @staticmethod
     def read_params(config_path: str) -> dict:
         try:
-            with open(config_path) as yaml_file:
-                config:dict = yaml.safe_load(yaml_file)
+            config:dict = load_config_file(config_path, required_keys=[GRID_SEARCH_KEY, MODEL_SELECTION_KEY])
             return config
         except Exception as e:
             raise ConcreteException(e, sys) from e
@@ -218,7 +243,8 @@ class ModelFactory:
             
             message = f'{">>"* 30} f"Training {type(initialized_model.model).__name__} Started." {"<<"*30}'
             logging.info(message)
-            grid_search_cv.fit(input_feature, output_feature)
+            with profiler_label(f"grid_search:{type(initialized_model.model).__name__}"):
+                grid_search_cv.fit(input_feature, output_feature)
             message = f'{">>"* 30} f"Training {type(initialized_model.model).__name__}" completed {"<<"*30}'
             grid_searched_best_model = GridSearchedBestModel(model_serial_number=initialized_model.model_serial_number,
                                                              model=initialized_model.model,
@@ -0,0 +1,99 @@
+import os
+import sys
+from datetime import datetime
+from concrete.exception import ConcreteException
+from concrete.logger import logging
+from concrete.util.util import read_yaml_file, write_yaml_file_atomic
+from concrete.constants import MODEL_REGISTRY_FILE_NAME, LATEST_POINTER_FILE_NAME, MODEL_PATH_KEY
+
+VERSIONS_KEY = "versions"
+LATEST_KEY = "latest"
+VERSION_KEY = "version"
+SOURCE_MODEL_PATH_KEY = "source_model_path"
+
+
+class ModelRegistry:
+    """
+    Manifest of the models exported to the model directory. registry.yaml records every
+    version with its model path and metrics, latest.yaml points to the latest version so
+    that serving reads one small file instead of scanning the model directory.
+    Both files are replaced atomically, readers never see a partially written file.
+    """
+
+    def __init__(self, model_dir: str) -> None:
+        try:
+            self.model_dir = model_dir
+            self.registry_file_path = os.path.join(model_dir, MODEL_REGISTRY_FILE_NAME)
+            self.latest_pointer_file_path = os.path.join(model_dir, LATEST_POINTER_FILE_NAME)
+        except Exception as e:
+            raise ConcreteException(e, sys) from e
+
+    def read_registry(self) -> dict:
+        try:
+            if not os.path.exists(self.registry_file_path):
+                return {VERSIONS_KEY: dict(), LATEST_KEY: None}
+            return read_yaml_file(file_path=self.registry_file_path)
+        except Exception as e:
+            raise ConcreteException(e, sys) from e
+
+    def register(self, version: str, model_path: str, metrics: dict = None, source_model_path: str = None) -> dict:
+        """
+        Records an exported model and makes it the latest version.
+        source_model_path: the trained model file in the artifact directory the model was exported from
+        """
+        try:
+            registry = self.read_registry()
+            version_info = {
+                MODEL_PATH_KEY: model_path,
+                "created_time_stamp": str(datetime.now()),
+                "metrics": {name: None if value is None else float(value) for name, value in (metrics or dict()).items()},
+                SOURCE_MODEL_PATH_KEY: source_model_path
+            }
+            registry[VERSIONS_KEY][version] = version_info
+            registry[LATEST_KEY] = version
+            write_yaml_file_atomic(file_path=self.registry_file_path, data=registry)
+            write_yaml_file_atomic(file_path=self.latest_pointer_file_path,
+                                   data={VERSION_KEY: version, MODEL_PATH_KEY: model_path})
+            logging.info(f"Registered model version [{version}]: {version_info}")
+            return version_info
+        except Exception as e:
+            raise ConcreteException(e, sys) from e
+
+    def get_latest_version(self) -> dict:
+        """
+        Returns the latest pointer, a dict with version and model_path, None if no model is registered.
+        """
+        try:
+            if not os.path.exists(self.latest_pointer_file_path):
+                return None
+            return read_yaml_file(file_path=self.latest_pointer_file_path)
+        except Exception as e:
+            raise ConcreteException(e, sys) from e
+
+    def get_model_path(self, version: str) -> str:
+        """
+        Path of a registered model version, None if the version is not registered.
+        """
+        try:
+            version_info = self.read_registry()[VERSIONS_KEY].get(str(version))
+            return None if version_info is None else version_info[MODEL_PATH_KEY]
+        except Exception as e:
+            raise ConcreteException(e, sys) from e
+
+    def get_latest_model_path(self) -> str:
+        """
+        Path of the latest model. Model directories exported before the registry existed are
+        found by taking the highest numeric folder name.
+        """
+        try:
+            latest_version = self.get_latest_version()
+            if latest_version is not None:
+                return latest_version[MODEL_PATH_KEY]
+            versions = [folder_name for folder_name in os.listdir(self.model_dir) if folder_name.isdigit()]
+            if not versions:
+                return None
+            latest_model_dir = os.path.join(self.model_dir, max(versions, key=int))
+            file_name = sorted(file_name for file_name in os.listdir(latest_model_dir) if file_name.endswith(".pkl"))[0]
+            return os.path.join(latest_model_dir, file_name)
+        except Exception as e:
+            raise ConcreteException(e, sys) from e
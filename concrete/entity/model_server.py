@@ -0,0 +1,244 @@
+import os
+import sys
+import time
+import random
+import threading
+import numpy as np
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from concrete.entity.config_entity import ModelServingConfig
+from concrete.entity.model_registry import ModelRegistry
+from concrete.entity.concrete_predictor import ConcretePredictor
+from concrete.exception import ConcreteException
+from concrete.logger import logging
+from concrete.util.profiler import label as profiler_label
+from concrete.constants import SHADOW_MAX_PENDING_PER_WORKER
+
+CHAMPION_ROLE = "champion"
+CHALLENGER_ROLE = "challenger"
+
+#lower, upper: prediction interval bounds, None when the served model has no calibrated intervals
+#attributions: Attribution of the inputs when requested and supported by the served model, else None
+ServedPrediction = namedtuple("ServedPrediction", ["prediction", "version", "role", "lower", "upper", "coverage",
+                                                   "attributions"])
+
+
+class ModelServer:
+    """
+    Serves the champion model and, when configured, a challenger version of the model registry.
+    A fraction of the requests is routed to the challenger. With shadow scoring enabled the
+    model that did not answer a request scores it on a background thread pool, so comparison
+    metrics accumulate without delaying the response. At most SHADOW_MAX_PENDING_PER_WORKER
+    requests per shadow worker wait or run, requests arriving when they are all taken are not
+    shadow scored and are counted as dropped. The champion follows the registry's
+    latest pointer unless a champion version is configured.
+    reload_callback: optional function called as reload_callback(latest_pointer_mtime) when a new
+                     model has been pushed, instead of reloading the models in this process
+    """
+
+    def __init__(self, model_serving_config: ModelServingConfig, reload_callback=None) -> None:
+        try:
+            self.model_serving_config = model_serving_config
+            self.reload_callback = reload_callback
+            self.model_registry = ModelRegistry(model_dir=model_serving_config.model_dir)
+            self.lock = threading.Lock()
+            self.shadow_executor = None
+            self.shadow_slots = None
+            if model_serving_config.shadow_scoring:
+                self.shadow_executor = ThreadPoolExecutor(max_workers=model_serving_config.shadow_max_workers,
+                                                          thread_name_prefix="shadow_scoring")
+                self.shadow_slots = threading.BoundedSemaphore(model_serving_config.shadow_max_workers *
+                                                               SHADOW_MAX_PENDING_PER_WORKER)
+            self.shadow_dropped = 0
+            self.versions = dict()
+            self.latest_pointer_mtime = None
+            self.stats = dict()
+            self.shadow_stats = dict()
+            self.load_models()
+        except Exception as e:
+            raise ConcreteException(e, sys) from e
+
+    def get_model_path(self, version: str) -> str:
+        try:
+            model_path = self.model_registry.get_model_path(version)
+            if model_path is None:
+                raise Exception(f"Model version [{version}] is not registered in [{self.model_registry.registry_file_path}]")
+            return model_path
+        except Exception as e:
+            raise ConcreteException(e, sys) from e
+
+    def get_challenger_model_path(self) -> str:
+        try:
+            challenger_version = self.model_serving_config.challenger_version
+            return None if challenger_version is None else self.model_registry.get_model_path(challenger_version)
+        except Exception as e:
+            raise ConcreteException(e, sys) from e
+
+    def load_models(self):
+        """
+        Loads the champion and challenger models, keyed by role, as (version, model) tuples.
+        """
+        try:
+            latest_pointer_file_path = self.model_registry.latest_pointer_file_path
+            self.latest_pointer_mtime = os.path.getmtime(latest_pointer_file_path) \
+                if os.path.exists(latest_pointer_file_path) else None
+            versions = dict()
+            champion_version = self.model_serving_config.champion_version
+            if champion_version is None:
+                latest_version = self.model_registry.get_latest_version()
+                champion_version = None if latest_version is None else str(latest_version["version"])
+                champion_model_path = self.model_registry.get_latest_model_path()
+            else:
+                champion_model_path = self.get_model_path(champion_version)
+            if champion_model_path is not None:
+                versions[CHAMPION_ROLE] = (champion_version, ConcretePredictor.load_model(model_path=champion_model_path))
+            challenger_version = self.model_serving_config.challenger_version
+            if challenger_version is not None and challenger_version != champion_version:
+                versions[CHALLENGER_ROLE] = (challenger_version,
+                                             ConcretePredictor.load_model(model_path=self.get_model_path(challenger_version)))
+            with self.lock:
+                self.versions = versions
+            ConcretePredictor.unload_models(keep_model_paths=[model_path for model_path in
+                                                              [champion_model_path, self.get_challenger_model_path()]
+                                                              if model_path is not None])
+            logging.info(f"Serving model versions: { {role: version for role, (version, _) in versions.items()} }")
+        except Exception as e:
+            raise ConcreteException(e, sys) from e
+
+    def refresh(self):
+        """
+        Reloads the models when a new model has been pushed since they were loaded.
+        """
+        try:
+            latest_pointer_file_path = self.model_registry.latest_pointer_file_path
+            if not os.path.exists(latest_pointer_file_path):
+                return
+            latest_pointer_mtime = os.path.getmtime(latest_pointer_file_path)
+            if latest_pointer_mtime == self.latest_pointer_mtime:
+                return
+            if self.reload_callback is not None:
+                self.reload_callback(latest_pointer_mtime)
+                #requested once per pushed model, this process is replaced by a worker with the new models
+                self.latest_pointer_mtime = latest_pointer_mtime
+            else:
+                self.load_models()
+        except Exception as e:
+            raise ConcreteException(e, sys) from e
+
+    def record_prediction(self, version: str, role: str, n_rows: int, latency: float):
+        with self.lock:
+            version_stats = self.stats.setdefault(version, {"role": role, "requests": 0, "rows": 0, "total_latency": 0.0})
+            version_stats["role"] = role
+            version_stats["requests"] += 1
+            version_stats["rows"] += n_rows
+            version_stats["total_latency"] += latency
+
+    def shadow_score(self, X, primary_prediction: np.ndarray, primary_version: str, shadow_version: str, shadow_model):
+        """
+        Scores X with the shadow model and accumulates its differences to the primary prediction.
+        """
+        try:
+            start_time = time.perf_counter()
+            shadow_prediction = np.ravel(shadow_model.predict(X))
+            latency = time.perf_counter() - start_time
+            difference = shadow_prediction - np.ravel(primary_prediction)
+            with self.lock:
+                pair_stats = self.shadow_stats.setdefault(f"{shadow_version} vs {primary_version}",
+                                                          {"requests": 0, "rows": 0, "total_latency": 0.0,
+                                                           "sum_difference": 0.0, "sum_absolute_difference": 0.0,
+                                                           "sum_squared_difference": 0.0, "max_absolute_difference": 0.0})
+                pair_stats["requests"] += 1
+                pair_stats["rows"] += len(difference)
+                pair_stats["total_latency"] += latency
+                pair_stats["sum_difference"] += float(difference.sum())
+                pair_stats["sum_absolute_difference"] += float(np.abs(difference).sum())
+                pair_stats["sum_squared_difference"] += float(np.square(difference).sum())
+                pair_stats["max_absolute_difference"] = max(pair_stats["max_absolute_difference"],
+                                                            float(np.abs(difference).max(initial=0.0)))
+        except Exception as e:
+            logging.error(f"Shadow scoring with model version [{shadow_version}] failed: {e}")
+        finally:
+            self.shadow_slots.release()
+
+    def predict(self, X, with_attributions: bool = False) -> ServedPrediction:
+        """
+        with_attributions: also attribute the predictions to the inputs, with the model that made them
+        """
+        try:
+            self.refresh()
+            with self.lock:
+                versions = self.versions
+            if CHAMPION_ROLE not in versions:
+                raise Exception(f"No model is registered in [{self.model_serving_config.model_dir}]")
+            role = CHAMPION_ROLE
+            if CHALLENGER_ROLE in versions and random.random() < self.model_serving_config.challenger_traffic_fraction:
+                role = CHALLENGER_ROLE
+            version, model = versions[role]
+            start_time = time.perf_counter()
+            with profiler_label(f"predict:{version}"):
+                prediction_interval = model.predict_with_interval(X)
+            prediction = prediction_interval.prediction
+            self.record_prediction(version=version, role=role, n_rows=len(X), latency=time.perf_counter() - start_time)
+            attributions = None
+            if with_attributions:
+                with profiler_label(f"attribute:{version}"):
+                    attributions = model.attribute(X)
+            shadow_role = CHALLENGER_ROLE if role == CHAMPION_ROLE else CHAMPION_ROLE
+            if self.shadow_executor is not None and shadow_role in versions:
+                shadow_version, shadow_model = versions[shadow_role]
+                if self.shadow_slots.acquire(blocking=False):
+                    self.shadow_executor.submit(self.shadow_score, X, prediction, version, shadow_version, shadow_model)
+                else:
+                    with self.lock:
+                        self.shadow_dropped += 1
+            return ServedPrediction(prediction=prediction, version=version, role=role,
+                                    lower=prediction_interval.lower, upper=prediction_interval.upper,
+                                    coverage=prediction_interval.coverage, attributions=attributions)
+        except Exception as e:
+            raise ConcreteException(e, sys) from e
+
+    def get_champion_model(self) -> tuple:
+        """
+        Returns the (version, model) tuple of the champion, for uses other than routed predictions.
+        """
+        try:
+            self.refresh()
+            with self.lock:
+                versions = self.versions
+            if CHAMPION_ROLE not in versions:
+                raise Exception(f"No model is registered in [{self.model_serving_config.model_dir}]")
+            return versions[CHAMPION_ROLE]
+        except Exception as e:
+            raise ConcreteException(e, sys) from e
+
+    def get_stats(self) -> dict:
+        """
+        Serving and shadow scoring statistics of this process only. Under gunicorn every worker
+        keeps its own, a request gets the statistics of the worker answering it, labelled with
+        its worker_pid; the totals of a deployment are the sum over its workers.
+        """
+        try:
+            with self.lock:
+                versions = {role: version for role, (version, _) in self.versions.items()}
+                served = {version: dict(version_stats) for version, version_stats in self.stats.items()}
+                shadow = {pair: dict(pair_stats) for pair, pair_stats in self.shadow_stats.items()}
+                shadow_dropped = self.shadow_dropped
+            for version_stats in served.values():
+                version_stats["mean_latency"] = version_stats.pop("total_latency") / max(version_stats["requests"], 1)
+            for pair_stats in shadow.values():
+                rows = max(pair_stats["rows"], 1)
+                pair_stats["mean_latency"] = pair_stats.pop("total_latency") / max(pair_stats["requests"], 1)
+                pair_stats["mean_difference"] = pair_stats.pop("sum_difference") / rows
+                pair_stats["mean_absolute_difference"] = pair_stats.pop("sum_absolute_difference") / rows
+                pair_stats["root_mean_squared_difference"] = float(np.sqrt(pair_stats.pop("sum_squared_difference") / rows))
+            return {
+                "worker_pid": os.getpid(),
+                "versions": versions,
+                "challenger_traffic_fraction": self.model_serving_config.challenger_traffic_fraction,
+                "shadow_scoring": self.model_serving_config.shadow_scoring,
+                "served": served,
+                "shadow": shadow,
+                "shadow_dropped": shadow_dropped
+            }
+        except Exception as e:
+            raise ConcreteException(e, sys) from e
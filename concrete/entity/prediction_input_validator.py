@@ -0,0 +1,57 @@
+import sys
+import numpy as np
+from concrete.exception import ConcreteException
+from concrete.config.config_loader import load_config_file, SCHEMA_REQUIRED_KEYS
+from concrete.constants import SCHEMA_COLUMNS_KEY, SCHEMA_TARGET_COLUMN_KEY, SCHEMA_BOUNDS_KEY
+
+
+class PredictionInputValidator:
+    """
+    Validates prediction api inputs against the schema file. The input column order and the
+    bounds are read once into arrays, so validating a request is a few vectorized comparisons.
+    Inputs are rows of values in the schema column order, the target column excluded.
+    """
+
+    def __init__(self, schema_file_path: str) -> None:
+        try:
+            schema = load_config_file(schema_file_path, required_keys=SCHEMA_REQUIRED_KEYS)
+            target_columns = schema[SCHEMA_TARGET_COLUMN_KEY]
+            self.columns = [column for column in schema[SCHEMA_COLUMNS_KEY] if column not in target_columns]
+            bounds = schema.get(SCHEMA_BOUNDS_KEY, dict())
+            self.lower_bounds = np.array([bounds.get(column, [-np.inf, np.inf])[0] for column in self.columns],
+                                         dtype=np.float64)
+            self.upper_bounds = np.array([bounds.get(column, [-np.inf, np.inf])[1] for column in self.columns],
+                                         dtype=np.float64)
+        except Exception as e:
+            raise ConcreteException(e, sys) from e
+
+    def validate(self, rows) -> tuple:
+        """
+        rows: one row or a list of rows of input values
+        Returns the rows as a 2-D float array and None, or None and an error message.
+        """
+        try:
+            try:
+                X = np.asarray(rows, dtype=np.float64)
+            except (TypeError, ValueError):
+                return None, f"Input must be a row or a list of rows of {len(self.columns)} numbers: {self.columns}"
+            if X.ndim == 1:
+                X = X.reshape(1, -1)
+            if X.ndim != 2 or X.shape[0] == 0 or X.shape[1] != len(self.columns):
+                return None, f"Input must be a row or a list of rows of {len(self.columns)} numbers: {self.columns}"
+            invalid = ~np.isfinite(X) | (X < self.lower_bounds) | (X > self.upper_bounds)
+            if invalid.any():
+                row_index, column_index = np.argwhere(invalid)[0]
+                column = self.columns[column_index]
+                return None, (f"Row {row_index}: {column} = {X[row_index, column_index]} is outside "
+                              f"[{self.lower_bounds[column_index]}, {self.upper_bounds[column_index]}]")
+            return X, None
+        except Exception as e:
+            raise ConcreteException(e, sys) from e
+
+    def to_data_frame(self, X: np.ndarray):
+        try:
+            import pandas as pd
+            return pd.DataFrame(X, columns=self.columns)
+        except Exception as e:
+            raise ConcreteException(e, sys) from e
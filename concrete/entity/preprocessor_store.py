@@ -0,0 +1,100 @@
+import os
+import sys
+import json
+import hashlib
+from concrete.exception import ConcreteException
+from concrete.logger import logging
+from concrete.util.util import read_yaml_file, write_yaml_file, load_object, get_file_hash
+
+PREPROCESSOR_STORE_INDEX_FILE_NAME = "preprocessor_store.yaml"
+
+
+class PreprocessorStore:
+    """
+    Index of fitted preprocessing objects keyed by schema, droppable columns and
+    training data hash. Objects fitted in the current process are kept in memory,
+    objects fitted by earlier runs are loaded from the pickle file recorded in the index.
+    """
+    fitted_objects: dict = {}
+
+    def __init__(self, store_dir: str) -> None:
+        try:
+            self.store_dir = store_dir
+            self.index_file_path = os.path.join(store_dir, PREPROCESSOR_STORE_INDEX_FILE_NAME)
+        except Exception as e:
+            raise ConcreteException(e, sys) from e
+
+    @staticmethod
+    def get_key(schema_file_path: str, droppable_columns: list, train_file_path: str) -> str:
+        try:
+            key_content = {
+                "schema": get_file_hash(schema_file_path),
+                "droppable_columns": sorted(droppable_columns),
+                "train_data": get_file_hash(train_file_path)
+            }
+            return hashlib.sha256(json.dumps(key_content, sort_keys=True).encode()).hexdigest()
+        except Exception as e:
+            raise ConcreteException(e, sys) from e
+
+    def read_index(self) -> dict:
+        try:
+            if not os.path.exists(self.index_file_path):
+                return dict()
+            index = read_yaml_file(file_path=self.index_file_path)
+            return dict() if index is None else index
+        except Exception as e:
+            raise ConcreteException(e, sys) from e
+
+    def get(self, key: str):
+        """
+        Returns the fitted preprocessing object stored under key, None if there is none.
+        """
+        try:
+            if key in PreprocessorStore.fitted_objects:
+                logging.info(f"Reusing in-memory fitted preprocessing object: [{key}]")
+                return PreprocessorStore.fitted_objects[key]
+            object_file_path = self.read_index().get(key)
+            if object_file_path is None or not os.path.exists(object_file_path):
+                return None
+            logging.info(f"Reusing fitted preprocessing object from: [{object_file_path}]")
+            preprocessing_obj = load_object(file_path=object_file_path)
+            PreprocessorStore.fitted_objects[key] = preprocessing_obj
+            return preprocessing_obj
+        except Exception as e:
+            raise ConcreteException(e, sys) from e
+
+    def get_file_path(self, key: str):
+        try:
+            return self.read_index().get(key)
+        except Exception as e:
+            raise ConcreteException(e, sys) from e
+
+    def remove(self, keys: list):
+        """
+        Removes entries from the index, e.g. when the files they refer to have been archived.
+        """
+        try:
+            index = self.read_index()
+            keys = [key for key in keys if key in index]
+            if len(keys) == 0:
+                return
+            for key in keys:
+                index.pop(key)
+                PreprocessorStore.fitted_objects.pop(key, None)
+            write_yaml_file(file_path=self.index_file_path, data=index)
+            logging.info(f"Removed [{len(keys)}] entries from the preprocessor store index")
+        except Exception as e:
+            raise ConcreteException(e, sys) from e
+
+    def put(self, key: str, preprocessing_obj, object_file_path: str):
+        """
+        Registers a fitted preprocessing object already saved at object_file_path.
+        """
+        try:
+            PreprocessorStore.fitted_objects[key] = preprocessing_obj
+            index = self.read_index()
+            index[key] = object_file_path
+            write_yaml_file(file_path=self.index_file_path, data=index)
+            logging.info(f"Registered fitted preprocessing object [{object_file_path}] under key: [{key}]")
+        except Exception as e:
+            raise ConcreteException(e, sys) from e
@@ -0,0 +1,69 @@
+import sys
+import numpy as np
+from sklearn.linear_model import Ridge, LinearRegression
+from concrete.exception import ConcreteException
+
+
+class RidgeStatistics:
+    """
+    Sufficient statistics of a ridge regression (row count, feature and target sums, XᵀX and Xᵀy)
+    accumulated over the transformed training rows. New rows are added to the statistics and the
+    ridge system is solved again from them, which gives the coefficients of a refit on all rows
+    seen so far without reading the previous rows. Matrices are of size features², independent
+    of the row count.
+    """
+
+    def __init__(self, feature_count: int) -> None:
+        try:
+            self.row_count = 0
+            self.feature_sum = np.zeros(feature_count)
+            self.target_sum = 0.0
+            self.gram = np.zeros((feature_count, feature_count))
+            self.moment = np.zeros(feature_count)
+        except Exception as e:
+            raise ConcreteException(e, sys) from e
+
+    @staticmethod
+    def is_supported(estimator) -> bool:
+        """
+        Ridge and LinearRegression fitted without sample weights or positivity constraints.
+        """
+        params = estimator.get_params()
+        return isinstance(estimator, (Ridge, LinearRegression)) and not params.get("positive", False) \
+            and np.ndim(params.get("alpha", 0.0)) == 0
+
+    def update(self, X: np.ndarray, y: np.ndarray) -> "RidgeStatistics":
+        try:
+            X = np.asarray(X, dtype=np.float64)
+            y = np.ravel(y).astype(np.float64)
+            self.row_count += len(y)
+            self.feature_sum += X.sum(axis=0)
+            self.target_sum += float(y.sum())
+            self.gram += X.T @ X
+            self.moment += X.T @ y
+            return self
+        except Exception as e:
+            raise ConcreteException(e, sys) from e
+
+    def solve(self, estimator):
+        """
+        Sets coef_ and intercept_ of a fitted Ridge or LinearRegression to the solution of the
+        ridge system over the accumulated rows, centered when the estimator fits an intercept.
+        """
+        try:
+            gram, moment, intercept = self.gram, self.moment, 0.0
+            if estimator.fit_intercept:
+                feature_mean = self.feature_sum / self.row_count
+                target_mean = self.target_sum / self.row_count
+                gram = gram - self.row_count * np.outer(feature_mean, feature_mean)
+                moment = moment - self.row_count * feature_mean * target_mean
+            alpha = float(estimator.get_params().get("alpha", 0.0))
+            coef = np.linalg.lstsq(gram + alpha * np.eye(len(moment)), moment, rcond=None)[0]
+            if estimator.fit_intercept:
+                intercept = target_mean - feature_mean @ coef
+            estimator.coef_ = coef.reshape(np.shape(estimator.coef_))
+            estimator.intercept_ = np.reshape(intercept, np.shape(estimator.intercept_)) if np.ndim(estimator.intercept_) \
+                else float(intercept)
+            return estimator
+        except Exception as e:
+            raise ConcreteException(e, sys) from e
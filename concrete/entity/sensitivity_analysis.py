@@ -0,0 +1,179 @@
+import os
+import sys
+import itertools
+import numpy as np
+from concrete.exception import ConcreteException
+from concrete.logger import logging
+from concrete.config.config_loader import load_config_file, SCHEMA_REQUIRED_KEYS
+from concrete.entity.prediction_input_validator import PredictionInputValidator
+from concrete.entity.batch_predictor import BatchPredictor
+from concrete.util.util import open_artifact_file
+from concrete.constants import SCHEMA_DOMAIN_VALUE_KEY, SENSITIVITY_FILE_NAME, SENSITIVITY_GRID_POINTS, \
+    SENSITIVITY_INTERACTION_GRID_POINTS, SENSITIVITY_ICE_ROWS, SENSITIVITY_GRID_PERCENTILES, SENSITIVITY_MAX_BATCH_ROWS
+
+COLUMNS_KEY = "columns"
+BACKGROUND_ROWS_KEY = "background_rows"
+ICE_ROWS_KEY = "ice_rows"
+GRID_KEY = "grid"
+PARTIAL_DEPENDENCE_KEY = "partial_dependence"
+ICE_KEY = "ice"
+INTERACTION_GRID_KEY = "interaction_grid"
+INTERACTION_KEY = "interaction"
+
+
+class SensitivityAnalysis:
+    """
+    Partial dependence and ICE curves of every input and 2-D partial dependence grids of every
+    pair of inputs for an EstimatorModel. Every row of a background sample of the training data
+    is predicted with one input, or a pair of inputs, set to each grid point: the partial
+    dependence is the mean over the background, the ICE curves are the predictions of a subset
+    of the background rows. The rows of all surfaces are predicted together in a few batched calls.
+    Grids are the domain values of an input when the schema lists them, else evenly spaced
+    between percentiles of the background.
+    Surfaces are dicts of float32 arrays keyed as "grid/<input>", "partial_dependence/<input>",
+    "ice/<input>", "interaction_grid/<input>" and "interaction/<input>/<input>".
+    """
+
+    def __init__(self, model, schema_file_path: str) -> None:
+        try:
+            schema = load_config_file(schema_file_path, required_keys=SCHEMA_REQUIRED_KEYS)
+            self.input_validator = PredictionInputValidator(schema_file_path=schema_file_path)
+            self.columns = self.input_validator.columns
+            self.domain_values = schema.get(SCHEMA_DOMAIN_VALUE_KEY) or dict()
+            self.batch_predictor = BatchPredictor(model=model, columns=self.columns)
+        except Exception as e:
+            raise ConcreteException(e, sys) from e
+
+    def get_grid(self, column_index: int, background: np.ndarray, grid_points: int) -> np.ndarray:
+        """
+        At most grid_points sorted values of an input.
+        """
+        try:
+            column = self.columns[column_index]
+            if column in self.domain_values:
+                grid = np.unique(np.asarray(self.domain_values[column], dtype=np.float64))
+                return grid[np.unique(np.linspace(0, len(grid) - 1, min(grid_points, len(grid))).round().astype(int))]
+            low, high = np.percentile(background[:, column_index], SENSITIVITY_GRID_PERCENTILES)
+            return np.unique(np.linspace(low, high, grid_points))
+        except Exception as e:
+            raise ConcreteException(e, sys) from e
+
+    def predict_blocks(self, background: np.ndarray, blocks: list) -> list:
+        """
+        blocks: list of (column_indices, values), values a 2-D array with a row of values of
+                the inputs column_indices for each grid point
+        Returns for every block the predictions of the background rows at its grid points, an
+        array of shape (grid points, background rows). Rows of all blocks are predicted together,
+        at most SENSITIVITY_MAX_BATCH_ROWS per call.
+        """
+        try:
+            row_count = len(background)
+            points = [(column_indices, point_values) for column_indices, values in blocks for point_values in values]
+            points_per_batch = max(1, SENSITIVITY_MAX_BATCH_ROWS // row_count)
+            predictions = np.empty((len(points), row_count))
+            for start in range(0, len(points), points_per_batch):
+                batch = points[start:start + points_per_batch]
+                X = np.tile(background, (len(batch), 1))
+                for offset, (column_indices, point_values) in enumerate(batch):
+                    X[offset * row_count:(offset + 1) * row_count, column_indices] = point_values
+                predictions[start:start + len(batch)] = self.batch_predictor.predict(X).reshape(len(batch), row_count)
+            logging.info(f"Predicted {len(points) * row_count} rows for {len(points)} grid points "
+                         f"in {-(-len(points) // points_per_batch)} batches")
+            return np.split(predictions, np.cumsum([len(values) for _, values in blocks])[:-1])
+        except Exception as e:
+            raise ConcreteException(e, sys) from e
+
+    def compute_surfaces(self, background: "pd.DataFrame") -> dict:
+        """
+        background: sample of the training data, with at least the input columns
+        """
+        try:
+            background = background[self.columns].dropna().to_numpy(dtype=np.float64)
+            if len(background) == 0:
+                raise Exception("Sensitivity analysis needs at least one complete background row")
+            ice_indices = np.unique(np.linspace(0, len(background) - 1, min(SENSITIVITY_ICE_ROWS, len(background))).round().astype(int))
+            column_indices = range(len(self.columns))
+            grids = [self.get_grid(index, background, SENSITIVITY_GRID_POINTS) for index in column_indices]
+            interaction_grids = [self.get_grid(index, background, SENSITIVITY_INTERACTION_GRID_POINTS) for index in column_indices]
+            pairs = list(itertools.combinations(column_indices, 2))
+            blocks = [([index], grid.reshape(-1, 1)) for index, grid in enumerate(grids)]
+            for first_index, second_index in pairs:
+                first_values, second_values = np.meshgrid(interaction_grids[first_index], interaction_grids[second_index], indexing="ij")
+                blocks.append(([first_index, second_index], np.column_stack([first_values.ravel(), second_values.ravel()])))
+            predictions = self.predict_blocks(background=background, blocks=blocks)
+            surfaces = {COLUMNS_KEY: np.array(self.columns),
+                        BACKGROUND_ROWS_KEY: np.array(len(background)),
+                        ICE_ROWS_KEY: background[ice_indices].astype(np.float32)}
+            for index, column in enumerate(self.columns):
+                surfaces[f"{GRID_KEY}/{column}"] = grids[index].astype(np.float32)
+                surfaces[f"{PARTIAL_DEPENDENCE_KEY}/{column}"] = predictions[index].mean(axis=1).astype(np.float32)
+                surfaces[f"{ICE_KEY}/{column}"] = predictions[index][:, ice_indices].T.astype(np.float32)
+                surfaces[f"{INTERACTION_GRID_KEY}/{column}"] = interaction_grids[index].astype(np.float32)
+            for (first_index, second_index), pair_predictions in zip(pairs, predictions[len(self.columns):]):
+                surfaces[f"{INTERACTION_KEY}/{self.columns[first_index]}/{self.columns[second_index]}"] = \
+                    pair_predictions.mean(axis=1).reshape(len(interaction_grids[first_index]),
+                                                          len(interaction_grids[second_index])).astype(np.float32)
+            return surfaces
+        except Exception as e:
+            raise ConcreteException(e, sys) from e
+
+    def compute_mix_curves(self, mix: np.ndarray, surfaces: dict, columns: list = None) -> dict:
+        """
+        ICE curves of one mix, a row of input values, on the grids of surfaces, in one prediction call.
+        Returns {input: predictions at its grid points}.
+        """
+        try:
+            columns = self.columns if columns is None else columns
+            blocks = [([self.columns.index(column)], surfaces[f"{GRID_KEY}/{column}"].astype(np.float64).reshape(-1, 1))
+                      for column in columns]
+            predictions = self.predict_blocks(background=np.asarray(mix, dtype=np.float64).reshape(1, -1), blocks=blocks)
+            return {column: column_predictions.ravel() for column, column_predictions in zip(columns, predictions)}
+        except Exception as e:
+            raise ConcreteException(e, sys) from e
+
+    @staticmethod
+    def get_surfaces_file_path(model_path: str) -> str:
+        return os.path.join(os.path.dirname(model_path), SENSITIVITY_FILE_NAME)
+
+    @staticmethod
+    def save_surfaces(file_path: str, surfaces: dict, blob_store=None):
+        try:
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            with open_artifact_file(file_path, blob_store) as file_obj:
+                np.savez(file_obj, **surfaces)
+            logging.info(f"Sensitivity surfaces saved at: [{file_path}]")
+        except Exception as e:
+            raise ConcreteException(e, sys) from e
+
+    @staticmethod
+    def load_surfaces(file_path: str) -> dict:
+        try:
+            with np.load(file_path) as surfaces:
+                return {key: surfaces[key] for key in surfaces.files}
+        except Exception as e:
+            raise ConcreteException(e, sys) from e
+
+    @staticmethod
+    def surfaces_to_dict(surfaces: dict, columns: list = None, decimals: int = 3) -> dict:
+        """
+        Surfaces of the inputs columns, and of their pairs, as rounded lists for json responses.
+        ice_rows holds the input values of the background rows of the ICE curves, in the order of columns.
+        """
+        try:
+            all_columns = [str(column) for column in surfaces[COLUMNS_KEY]]
+            columns = all_columns if columns is None else columns
+            to_list = lambda array: np.round(array.astype(np.float64), decimals).tolist()
+            return {
+                COLUMNS_KEY: all_columns,
+                BACKGROUND_ROWS_KEY: int(surfaces[BACKGROUND_ROWS_KEY]),
+                ICE_ROWS_KEY: to_list(surfaces[ICE_ROWS_KEY]),
+                PARTIAL_DEPENDENCE_KEY: {column: {GRID_KEY: to_list(surfaces[f"{GRID_KEY}/{column}"]),
+                                                  PARTIAL_DEPENDENCE_KEY: to_list(surfaces[f"{PARTIAL_DEPENDENCE_KEY}/{column}"]),
+                                                  ICE_KEY: to_list(surfaces[f"{ICE_KEY}/{column}"])}
+                                         for column in columns},
+                INTERACTION_GRID_KEY: {column: to_list(surfaces[f"{INTERACTION_GRID_KEY}/{column}"]) for column in columns},
+                INTERACTION_KEY: {key.split("/", 1)[1]: to_list(array) for key, array in surfaces.items()
+                                  if key.startswith(f"{INTERACTION_KEY}/") and all(column in columns for column in key.split("/")[1:])}
+            }
+        except Exception as e:
+            raise ConcreteException(e, sys) from e
@@ -0,0 +1,167 @@
+import os
+import sys
+import sqlite3
+import uuid
+from collections import namedtuple
+from contextlib import contextmanager
+from datetime import datetime
+from concrete.exception import ConcreteException
+from concrete.logger import logging
+from concrete.constants import EXPERIMENT_DIR_NAME, TRAINING_JOB_DB_FILE_NAME
+
+JOB_STATUS_QUEUED = "queued"
+JOB_STATUS_RUNNING = "running"
+JOB_STATUS_DONE = "done"
+JOB_STATUS_FAILED = "failed"
+
+TrainingJob = namedtuple("TrainingJob", ["job_id", "status", "created_time", "start_time", "stop_time",
+                                         "worker_pid", "current_stage", "completed_stages", "total_stages",
+                                         "experiment_id", "message"])
+
+CREATE_TABLE_STATEMENTS = [
+    """CREATE TABLE IF NOT EXISTS training_job (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        job_id TEXT NOT NULL UNIQUE,
+        status TEXT NOT NULL,
+        created_time TEXT,
+        start_time TEXT,
+        stop_time TEXT,
+        worker_pid INTEGER,
+        current_stage TEXT,
+        completed_stages INTEGER,
+        total_stages INTEGER,
+        experiment_id TEXT,
+        message TEXT)""",
+    "CREATE INDEX IF NOT EXISTS training_job_status_index ON training_job (status)",
+]
+
+
+class TrainingJobQueue:
+    """
+    SQLite backed queue of training jobs shared by every web worker and the training worker.
+    At most one job is queued or running at any time: submitting while a job is pending
+    returns the pending job instead of creating a new one. State changes are done inside
+    immediate transactions so that concurrent processes see a consistent queue.
+    """
+
+    def __init__(self, db_file_path: str) -> None:
+        try:
+            self.db_file_path = db_file_path
+            os.makedirs(os.path.dirname(db_file_path), exist_ok=True)
+            with self.get_connection() as connection:
+                connection.execute("PRAGMA journal_mode=WAL")
+                for statement in CREATE_TABLE_STATEMENTS:
+                    connection.execute(statement)
+        except Exception as e:
+            raise ConcreteException(e, sys) from e
+
+    @contextmanager
+    def get_connection(self):
+        connection = sqlite3.connect(self.db_file_path, timeout=30)
+        try:
+            connection.execute("PRAGMA busy_timeout=30000")
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    @staticmethod
+    def to_training_job(row) -> TrainingJob:
+        if row is None:
+            return None
+        return TrainingJob(*row)
+
+    def select_jobs(self, connection: sqlite3.Connection, where_clause: str, params: tuple = (), limit: int = 1) -> list:
+        rows = connection.execute(f"SELECT {', '.join(TrainingJob._fields)} FROM training_job "
+                                  f"WHERE {where_clause} ORDER BY id DESC LIMIT ?", params + (limit,)).fetchall()
+        return [TrainingJobQueue.to_training_job(row) for row in rows]
+
+    def submit_job(self) -> tuple:
+        """
+        Returns the pending job and False if there is one, else queues a new job and returns it and True.
+        """
+        try:
+            with self.get_connection() as connection:
+                connection.execute("BEGIN IMMEDIATE")
+                pending_jobs = self.select_jobs(connection, "status IN (?, ?)", (JOB_STATUS_QUEUED, JOB_STATUS_RUNNING))
+                if pending_jobs:
+                    return pending_jobs[0], False
+                job_id = str(uuid.uuid4())
+                connection.execute("INSERT INTO training_job (job_id, status, created_time, completed_stages, message) "
+                                   "VALUES (?, ?, ?, 0, ?)",
+                                   (job_id, JOB_STATUS_QUEUED, str(datetime.now()), "Training job is queued."))
+                job = self.select_jobs(connection, "job_id = ?", (job_id,))[0]
+            logging.info(f"Training job queued: {job}")
+            return job, True
+        except Exception as e:
+            raise ConcreteException(e, sys) from e
+
+    def claim_next_job(self, worker_pid: int) -> TrainingJob:
+        """
+        Marks the oldest queued job as running by worker_pid and returns it, None if nothing is queued.
+        """
+        try:
+            with self.get_connection() as connection:
+                connection.execute("BEGIN IMMEDIATE")
+                row = connection.execute("SELECT job_id FROM training_job WHERE status = ? ORDER BY id LIMIT 1",
+                                         (JOB_STATUS_QUEUED,)).fetchone()
+                if row is None:
+                    return None
+                connection.execute("UPDATE training_job SET status = ?, start_time = ?, worker_pid = ?, message = ? "
+                                   "WHERE job_id = ?",
+                                   (JOB_STATUS_RUNNING, str(datetime.now()), worker_pid,
+                                    "Training is in progress.", row[0]))
+                return self.select_jobs(connection, "job_id = ?", (row[0],))[0]
+        except Exception as e:
+            raise ConcreteException(e, sys) from e
+
+    def update_progress(self, job_id: str, current_stage: str, completed_stages: int, total_stages: int):
+        try:
+            with self.get_connection() as connection:
+                connection.execute("UPDATE training_job SET current_stage = ?, completed_stages = ?, total_stages = ? "
+                                   "WHERE job_id = ?", (current_stage, completed_stages, total_stages, job_id))
+        except Exception as e:
+            raise ConcreteException(e, sys) from e
+
+    def finish_job(self, job_id: str, status: str, message: str, experiment_id: str = None):
+        try:
+            with self.get_connection() as connection:
+                connection.execute("UPDATE training_job SET status = ?, stop_time = ?, message = ?, experiment_id = ? "
+                                   "WHERE job_id = ?", (status, str(datetime.now()), message, experiment_id, job_id))
+            logging.info(f"Training job [{job_id}] finished with status [{status}]: {message}")
+        except Exception as e:
+            raise ConcreteException(e, sys) from e
+
+    def fail_interrupted_jobs(self, message: str = "Training worker stopped before the job finished."):
+        """
+        Marks jobs left running by a training worker that is no longer alive as failed.
+        """
+        try:
+            with self.get_connection() as connection:
+                connection.execute("UPDATE training_job SET status = ?, stop_time = ?, message = ? WHERE status = ?",
+                                   (JOB_STATUS_FAILED, str(datetime.now()), message, JOB_STATUS_RUNNING))
+        except Exception as e:
+            raise ConcreteException(e, sys) from e
+
+    def get_job(self, job_id: str) -> TrainingJob:
+        try:
+            with self.get_connection() as connection:
+                jobs = self.select_jobs(connection, "job_id = ?", (job_id,))
+            return jobs[0] if jobs else None
+        except Exception as e:
+            raise ConcreteException(e, sys) from e
+
+    def get_latest_job(self) -> TrainingJob:
+        try:
+            with self.get_connection() as connection:
+                jobs = self.select_jobs(connection, "1 = 1")
+            return jobs[0] if jobs else None
+        except Exception as e:
+            raise ConcreteException(e, sys) from e
+
+
+def get_training_job_queue(artifact_dir: str) -> TrainingJobQueue:
+    try:
+        return TrainingJobQueue(db_file_path=os.path.join(artifact_dir, EXPERIMENT_DIR_NAME, TRAINING_JOB_DB_FILE_NAME))
+    except Exception as e:
+        raise ConcreteException(e, sys) from e
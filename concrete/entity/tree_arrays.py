@@ -0,0 +1,103 @@
+import sys
+import numpy as np
+from sklearn.ensemble import RandomForestRegressor, ExtraTreesRegressor, GradientBoostingRegressor
+from concrete.exception import ConcreteException
+
+#ensembles whose trees are fitted independently, the spread of their tree predictions measures uncertainty
+BAGGING_ESTIMATORS = (RandomForestRegressor, ExtraTreesRegressor)
+TREE_ENSEMBLE_ESTIMATORS = BAGGING_ESTIMATORS + (GradientBoostingRegressor,)
+
+
+class TreeArrays:
+    """
+    Nodes of all trees of a fitted tree ensemble flattened into one set of arrays, so every row
+    of a batch goes down every tree at once: each step moves all (row, tree) pairs one level
+    down with a few vectorized gathers, a batch takes as many steps as the deepest tree.
+    Node indices are global, roots holds the index of the root of each tree. The children of
+    node i are children[2 * i] (right) and children[2 * i + 1] (left), so the next node is one
+    gather indexed by the split outcome. Leaves are their own children, pairs reaching a leaf
+    early stay in place.
+    """
+
+    def __init__(self, trees: list) -> None:
+        """
+        trees: fitted sklearn Tree objects (the tree_ attribute of a decision tree)
+        """
+        try:
+            offsets = np.cumsum([0] + [tree.node_count for tree in trees])
+            self.roots = offsets[:-1]
+            children = []
+            for offset, tree in zip(offsets, trees):
+                nodes = np.arange(tree.node_count)
+                is_leaf = tree.children_left == -1
+                children.append(np.column_stack([np.where(is_leaf, nodes, tree.children_right),
+                                                 np.where(is_leaf, nodes, tree.children_left)]).ravel() + offset)
+            self.children = np.concatenate(children)
+            self.feature = np.concatenate([np.maximum(tree.feature, 0) for tree in trees]).astype(np.int64)
+            self.threshold = np.concatenate([tree.threshold for tree in trees])
+            self.value = np.concatenate([tree.value[:, 0, 0] for tree in trees])
+            self.max_depth = max(tree.max_depth for tree in trees)
+        except Exception as e:
+            raise ConcreteException(e, sys) from e
+
+    @staticmethod
+    def from_estimator(estimator) -> "TreeArrays":
+        """
+        Returns the tree arrays of a fitted RandomForest, ExtraTrees or GradientBoosting regressor,
+        None for other estimators.
+        """
+        try:
+            if not isinstance(estimator, TREE_ENSEMBLE_ESTIMATORS):
+                return None
+            return TreeArrays(trees=[tree.tree_ for tree in np.ravel(estimator.estimators_)])
+        except Exception as e:
+            raise ConcreteException(e, sys) from e
+
+    def apply(self, X: np.ndarray) -> np.ndarray:
+        """
+        Leaf of every row in every tree, an array of global node indices of shape (rows, trees).
+        """
+        try:
+            #trees compare float32 inputs to their thresholds
+            X = np.ascontiguousarray(X, dtype=np.float32)
+            nodes = np.repeat(self.roots[np.newaxis, :], len(X), axis=0)
+            row_offsets = (np.arange(len(X)) * X.shape[1])[:, np.newaxis]
+            X = X.ravel()
+            for _ in range(self.max_depth):
+                go_left = X[row_offsets + self.feature[nodes]] <= self.threshold[nodes]
+                nodes = self.children[2 * nodes + go_left]
+            return nodes
+        except Exception as e:
+            raise ConcreteException(e, sys) from e
+
+    def predict_trees(self, X: np.ndarray) -> np.ndarray:
+        """
+        Prediction of every tree for every row, an array of shape (rows, trees).
+        """
+        try:
+            return self.value[self.apply(X)]
+        except Exception as e:
+            raise ConcreteException(e, sys) from e
+
+    def predict_contributions(self, X: np.ndarray) -> np.ndarray:
+        """
+        Path attributions of every row summed over the trees, an array of shape (rows, features):
+        going down a tree, each split adds the change of the node value to its split feature.
+        A row's prediction of a tree is the root value plus its contributions from the tree.
+        """
+        try:
+            X = np.ascontiguousarray(X, dtype=np.float32)
+            row_count, feature_count = X.shape
+            nodes = np.repeat(self.roots[np.newaxis, :], row_count, axis=0)
+            row_offsets = (np.arange(row_count) * feature_count)[:, np.newaxis]
+            X = X.ravel()
+            contributions = np.zeros(row_count * feature_count)
+            for _ in range(self.max_depth):
+                feature_offsets = row_offsets + self.feature[nodes]
+                next_nodes = self.children[2 * nodes + (X[feature_offsets] <= self.threshold[nodes])]
+                contributions += np.bincount(feature_offsets.ravel(), weights=(self.value[next_nodes] - self.value[nodes]).ravel(),
+                                             minlength=len(contributions))
+                nodes = next_nodes
+            return contributions.reshape(row_count, feature_count)
+        except Exception as e:
+            raise ConcreteException(e, sys) from e
@@ -1,12 +1,17 @@
 import logging
+from logging.handlers import RotatingFileHandler
 from datetime import datetime
 import os
-import pandas as pd
-from concrete.constants import get_current_time_stamp 
+import gzip
+import shutil
+from concrete.constants import get_current_time_stamp, LOG_MAX_BYTES, LOG_BACKUP_COUNT, GZIP_FILE_EXTENSION
 LOG_DIR="logs"
 
-def get_log_file_name():
-    return f"log_{get_current_time_stamp()}.log"
+def get_log_file_name(pid: int = None):
+    """
+    pid: set for the log files of forked processes, which must not share the file of their parent
+    """
+    return f"log_{get_current_time_stamp()}.log" if pid is None else f"log_{get_current_time_stamp()}_{pid}.log"
 
 LOG_FILE_NAME=get_log_file_name()
 
@@ -15,16 +20,50 @@ os.makedirs(LOG_DIR,exist_ok=True)
 LOG_FILE_PATH = os.path.join(LOG_DIR,LOG_FILE_NAME)
 
 
+def compress_rotated_log_file(source, dest):
+    with open(source, "rb") as source_file, gzip.open(dest, "wb") as dest_file:
+        shutil.copyfileobj(source_file, dest_file)
+    os.remove(source)
 
-logging.basicConfig(filename=LOG_FILE_PATH,
-filemode="w",
-format='[%(asctime)s]^;%(levelname)s^;%(lineno)d^;%(filename)s^;%(funcName)s()^;%(message)s',
+
+LOG_FORMAT = '[%(asctime)s]^;%(levelname)s^;%(lineno)d^;%(filename)s^;%(funcName)s()^;%(message)s'
+
+
+def get_log_file_handler(log_file_path):
+    log_file_handler = RotatingFileHandler(log_file_path, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT)
+    log_file_handler.namer = lambda name: f"{name}{GZIP_FILE_EXTENSION}"
+    log_file_handler.rotator = compress_rotated_log_file
+    return log_file_handler
+
+
+log_file_handler = get_log_file_handler(LOG_FILE_PATH)
+
+logging.basicConfig(handlers=[log_file_handler],
+format=LOG_FORMAT,
 level=logging.INFO
 )
 
+
+def open_process_log_file():
+    """
+    Replaces the log file handler inherited from the parent by one writing to a file of this
+    process. Called after a fork: a handler shared by several processes would be rotated by
+    each of them, renaming the file under the others.
+    """
+    global log_file_handler, LOG_FILE_PATH
+    root_logger = logging.getLogger()
+    root_logger.removeHandler(log_file_handler)
+    log_file_handler.close()
+    LOG_FILE_PATH = os.path.join(LOG_DIR, get_log_file_name(pid=os.getpid()))
+    log_file_handler = get_log_file_handler(LOG_FILE_PATH)
+    log_file_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    root_logger.addHandler(log_file_handler)
+
 def get_log_dataframe(file_path):
+    import pandas as pd
     data=[]
-    with open(file_path) as log_file:
+    open_log_file = gzip.open if file_path.endswith(GZIP_FILE_EXTENSION) else open
+    with open_log_file(file_path, "rt") as log_file:
         for line in log_file.readlines():
             data.append(line.split("^;"))
 
@@ -7,7 +7,14 @@ from concrete.component.model_evaluation import ModelEvaluation
 from concrete.component.model_pusher import ModelPusher
 from concrete.component.model_trainer import ModelTrainer
 from concrete.config.configuration import Configuration
-from concrete.constants import EXPERIMENT_DIR_NAME, EXPERIMENT_FILE_NAME
+from concrete.entity.artifact_store import ArtifactStore
+from concrete.entity.experiment_store import ExperimentStore
+from concrete.entity.artifact_retention import ArtifactRetention
+from concrete.entity.blob_store import get_blob_store
+from concrete.constants import EXPERIMENT_DIR_NAME, EXPERIMENT_FILE_NAME, EXPERIMENT_DB_FILE_NAME, PIPELINE_REPORT_DIR_NAME, CRITICAL_PATH_REPORT_FILE_NAME, \
+    PROFILE_DIR_NAME
+from concrete.pipeline.stage_dag import Stage, StageDag
+from concrete.util.profiler import SamplingProfiler
 from concrete.logger import logging
 from concrete.exception import ConcreteException
 from concrete.entity.artifact_entity import DataIngestionArtifact, DataTransformationArtifact, DataValidationArtifact, ModelEvaluationArtifact, ModelTrainerArtifact
@@ -16,6 +23,8 @@ import os, sys
 from datetime import datetime
 import pandas as pd
 import uuid
+import json
+from typing import List
 
 
 Experiment = namedtuple("Experiment", ["experiment_id", "initialization_timestamp", "artifact_time_stamp",
@@ -26,21 +35,32 @@ Experiment = namedtuple("Experiment", ["experiment_id", "initialization_timestam
 
 
 class Pipeline(Thread):
-    experiment: Experiment = Experiment(*([None] * 11))
     experiment_file_path = None
+    experiment_store: ExperimentStore = None
 
-    def __init__(self, config: Configuration)-> None:
+    def __init__(self, config: Configuration, progress_callback=None)-> None:
+        """
+        progress_callback: optional function called as
+                           progress_callback(stage_name, completed_stages, total_stages)
+        """
         try:
             os.makedirs(config.training_pipeline_config.artifact_dir, exist_ok=True)
             Pipeline.experiment_file_path=os.path.join(config.training_pipeline_config.artifact_dir,EXPERIMENT_DIR_NAME, EXPERIMENT_FILE_NAME)
+            Pipeline.experiment_store = Pipeline.get_experiment_store(config.training_pipeline_config.artifact_dir)
             super().__init__(daemon=False, name="pipeline")
             self.config = config
+            self.progress_callback = progress_callback
+            self.experiment = Experiment(*([None] * 11))
+            self.artifact_store = None
+            self.blob_store = get_blob_store(config.training_pipeline_config.artifact_dir)
+            self.stage_dag = None
         except Exception as e:
             raise ConcreteException(e,sys) from e
     
     def start_data_ingestion(self)-> DataIngestionArtifact:
         try:
-            data_ingestion = DataIngestion(data_ingestion_config= self.config.get_data_ingestion_config())
+            data_ingestion = DataIngestion(data_ingestion_config= self.config.get_data_ingestion_config(),
+                                           blob_store=self.blob_store)
             return data_ingestion.initiate_data_ingestion()
         except Exception as e:
             raise ConcreteException(e,sys) from e
@@ -48,7 +68,8 @@ class Pipeline(Thread):
     def start_data_validation(self, data_ingestion_artifact: DataIngestionArtifact)-> DataValidationArtifact:
         try:
             data_validation = DataValidation(data_validation_config= self.config.get_data_validation_config(),
-                                             data_ingestion_artifact= data_ingestion_artifact)
+                                             data_ingestion_artifact= data_ingestion_artifact,
+                                             artifact_store=self.artifact_store)
             return  data_validation.initiate_data_validation()
         except Exception as e:
             raise ConcreteException(e,sys) from e
@@ -59,58 +80,205 @@ class Pipeline(Thread):
         try:
             data_transformation = DataTransformation(data_transformation_config=self.config.get_data_transformation_config(),
                                                       data_ingestion_artifact=data_ingestion_artifact,
-                                                      data_validation_artifact=data_validation_artifact)
+                                                      data_validation_artifact=data_validation_artifact,
+                                                      artifact_store=self.artifact_store)
             return data_transformation.initiate_data_transformation()
         except Exception as e:
             raise ConcreteException(e,sys) from e
 
     def start_model_trainer(self,
-                            data_transformation_artifact:DataTransformationArtifact):
+                            data_transformation_artifact:DataTransformationArtifact,
+                            data_ingestion_artifact:DataIngestionArtifact = None,
+                            data_validation_artifact:DataValidationArtifact = None):
         try:
             model_trainer = ModelTrainer(model_trainer_config=self.config.get_model_trainer_config(),
-                                         data_transformation_artifact=data_transformation_artifact)
+                                         data_transformation_artifact=data_transformation_artifact,
+                                         artifact_store=self.artifact_store,
+                                         data_ingestion_artifact=data_ingestion_artifact,
+                                         data_validation_artifact=data_validation_artifact)
             return model_trainer.initiate_model_trainer()
         except Exception as e:
             raise ConcreteException(e,sys) from e
 
+    def start_best_model_scoring(self, data_ingestion_artifact: DataIngestionArtifact,
+                                 data_validation_artifact: DataValidationArtifact,
+                                 data_transformation_artifact: DataTransformationArtifact):
+        try:
+            model_evaluation = ModelEvaluation(model_evaluation_config=self.config.get_model_evaluation_config(),
+                                               data_ingestion_artifact=data_ingestion_artifact,
+                                               data_validation_artifact=data_validation_artifact,
+                                               model_trainer_artifact=None,
+                                               artifact_store=self.artifact_store,
+                                               data_transformation_artifact=data_transformation_artifact)
+            return model_evaluation.get_best_model_predictions()
+        except Exception as e:
+            raise ConcreteException(e,sys) from e
+
     def start_model_evaluation(self,data_ingestion_artifact: DataIngestionArtifact,
                                data_validation_artifact: DataValidationArtifact,
-                               model_trainer_artifact: ModelTrainerArtifact):
+                               model_trainer_artifact: ModelTrainerArtifact,
+                               data_transformation_artifact: DataTransformationArtifact = None,
+                               best_model_predictions=None):
         try:
             model_evaluation = ModelEvaluation(model_evaluation_config=self.config.get_model_evaluation_config(),
                                                data_ingestion_artifact=data_ingestion_artifact,
                                                data_validation_artifact=data_validation_artifact,
-                                               model_trainer_artifact=model_trainer_artifact)
-            return model_evaluation.initiate_model_evaluation()
+                                               model_trainer_artifact=model_trainer_artifact,
+                                               artifact_store=self.artifact_store,
+                                               data_transformation_artifact=data_transformation_artifact)
+            return model_evaluation.initiate_model_evaluation(best_model_predictions=best_model_predictions)
         except Exception as e:
             raise ConcreteException(e,sys) from e
 
-    def start_model_pusher(self, model_evaluation_artifact: ModelEvaluationArtifact):
+    def start_model_pusher(self, model_evaluation_artifact: ModelEvaluationArtifact,
+                           model_trainer_artifact: ModelTrainerArtifact = None,
+                           data_ingestion_artifact: DataIngestionArtifact = None,
+                           data_validation_artifact: DataValidationArtifact = None):
         try:
             model_pusher = ModelPusher(model_pusher_config=self.config.get_model_pusher_config(),
-                                       model_evaluation_artifact=model_evaluation_artifact)
+                                       model_evaluation_artifact=model_evaluation_artifact,
+                                       artifact_store=self.artifact_store,
+                                       model_trainer_artifact=model_trainer_artifact,
+                                       data_ingestion_artifact=data_ingestion_artifact,
+                                       data_validation_artifact=data_validation_artifact)
             return model_pusher.initiate_model_pusher()
         except Exception as e:
             raise ConcreteException(e,sys) from e
 
-    def save_experiment(self):
+    def start_model_pusher_if_accepted(self, model_evaluation_artifact: ModelEvaluationArtifact,
+                                       model_trainer_artifact: ModelTrainerArtifact = None,
+                                       data_ingestion_artifact: DataIngestionArtifact = None,
+                                       data_validation_artifact: DataValidationArtifact = None):
+        try:
+            if not model_evaluation_artifact.is_model_accepted:
+                logging.info("Trained model rejected.")
+                return None
+            model_pusher_artifact = self.start_model_pusher(model_evaluation_artifact=model_evaluation_artifact,
+                                                            model_trainer_artifact=model_trainer_artifact,
+                                                            data_ingestion_artifact=data_ingestion_artifact,
+                                                            data_validation_artifact=data_validation_artifact)
+            logging.info(f'Model pusher artifact: {model_pusher_artifact}')
+            return model_pusher_artifact
+        except Exception as e:
+            raise ConcreteException(e,sys) from e
+
+    def get_stages(self) -> List[Stage]:
+        """
+        Pipeline expressed as a dag of stages. Data validation checks, drift reporting,
+        scoring of the currently accepted model and model training run concurrently
+        wherever they do not depend on each other.
+        """
         try:
-            if Pipeline.experiment.experiment_id is not None:
-                experiment = Pipeline.experiment
-                experiment_dict = experiment._asdict()
-                experiment_dict: dict = {key: [value] for key, value in experiment_dict.items()}
+            data_validation_config = self.config.get_data_validation_config()
+            create_data_validation = lambda data_ingestion: DataValidation(data_validation_config=data_validation_config,
+                                                                           data_ingestion_artifact=data_ingestion,
+                                                                           artifact_store=self.artifact_store)
+            validate_schema = lambda data_loading: data_loading.do_train_test_files_exist() and data_loading.validate_dataset_schema()
+            get_data_validation_artifact = lambda data_loading, schema_validation, data_drift_report, correlation_analysis: \
+                data_loading.get_data_validation_artifact(validation_status=schema_validation,
+                                                          droppable_columns=correlation_analysis)
+            return [
+                Stage("data_ingestion", self.start_data_ingestion, []),
+                Stage("data_loading", create_data_validation, ["data_ingestion"]),
+                Stage("schema_validation", validate_schema, ["data_loading"]),
+                Stage("data_drift_report", lambda data_loading: data_loading.get_and_save_data_drift_report(), ["data_loading"]),
+                Stage("data_drift_report_page", lambda data_loading: data_loading.save_data_drift_report_page(), ["data_loading"]),
+                Stage("correlation_analysis", lambda data_loading: data_loading.check_for_correlation(), ["data_loading"]),
+                Stage("data_validation", get_data_validation_artifact,
+                      ["data_loading", "schema_validation", "data_drift_report", "correlation_analysis"]),
+                Stage("data_transformation",
+                      lambda data_ingestion, data_validation: self.start_data_transformation(data_ingestion_artifact=data_ingestion,
+                                                                                             data_validation_artifact=data_validation),
+                      ["data_ingestion", "data_validation"]),
+                Stage("model_trainer",
+                      lambda data_ingestion, data_validation, data_transformation: \
+                          self.start_model_trainer(data_transformation_artifact=data_transformation,
+                                                   data_ingestion_artifact=data_ingestion,
+                                                   data_validation_artifact=data_validation),
+                      ["data_ingestion", "data_validation", "data_transformation"]),
+                Stage("best_model_scoring",
+                      lambda data_ingestion, data_validation, data_transformation: \
+                          self.start_best_model_scoring(data_ingestion_artifact=data_ingestion,
+                                                        data_validation_artifact=data_validation,
+                                                        data_transformation_artifact=data_transformation),
+                      ["data_ingestion", "data_validation", "data_transformation"]),
+                Stage("model_evaluation",
+                      lambda data_ingestion, data_validation, data_transformation, model_trainer, best_model_scoring: \
+                          self.start_model_evaluation(data_ingestion_artifact=data_ingestion,
+                                                      data_validation_artifact=data_validation,
+                                                      model_trainer_artifact=model_trainer,
+                                                      data_transformation_artifact=data_transformation,
+                                                      best_model_predictions=best_model_scoring),
+                      ["data_ingestion", "data_validation", "data_transformation", "model_trainer", "best_model_scoring"]),
+                Stage("model_pusher",
+                      lambda data_ingestion, data_validation, model_trainer, model_evaluation: \
+                          self.start_model_pusher_if_accepted(model_evaluation_artifact=model_evaluation,
+                                                              model_trainer_artifact=model_trainer,
+                                                              data_ingestion_artifact=data_ingestion,
+                                                              data_validation_artifact=data_validation),
+                      ["data_ingestion", "data_validation", "model_trainer", "model_evaluation"]),
+            ]
+        except Exception as e:
+            raise ConcreteException(e,sys) from e
 
-                experiment_dict.update({
-                    "created_time_stamp": [datetime.now()],
-                    "experiment_file_path": [os.path.basename(Pipeline.experiment.experiment_file_path)]})
+    def start_profiler(self) -> SamplingProfiler:
+        """
+        Starts sampling the pipeline stages when profiling is enabled in the config, the profile
+        is written to the profiles folder of the run. Returns None when profiling is disabled.
+        """
+        try:
+            training_pipeline_config = self.config.training_pipeline_config
+            if not training_pipeline_config.profile:
+                return None
+            profile_dir = os.path.join(training_pipeline_config.artifact_dir, PROFILE_DIR_NAME, self.config.time_stamp)
+            return SamplingProfiler(output_dir=profile_dir, name="pipeline",
+                                    interval=training_pipeline_config.profile_sample_interval).start()
+        except Exception as e:
+            raise ConcreteException(e, sys) from e
 
-                experiment_report = pd.DataFrame(experiment_dict)
+    def save_critical_path_report(self):
+        try:
+            report = self.stage_dag.get_critical_path_report()
+            report["processing_modes"] = {stage_name: result.processing_mode for stage_name, result in self.stage_dag.results.items()
+                                          if hasattr(result, "processing_mode")}
+            logging.info(f"Pipeline wall time: [{report['wall_time']}] seconds, sum of stage times: "
+                         f"[{report['sum_of_stage_times']}] seconds.")
+            logging.info(f"Critical path: {report['critical_path']} took [{report['critical_path_time']}] seconds.")
+            logging.info(f"Processing modes: {report['processing_modes']}")
+            report_file_path = os.path.join(self.config.training_pipeline_config.artifact_dir,
+                                            PIPELINE_REPORT_DIR_NAME,
+                                            self.config.time_stamp,
+                                            CRITICAL_PATH_REPORT_FILE_NAME)
+            os.makedirs(os.path.dirname(report_file_path), exist_ok=True)
+            with open(report_file_path, "w") as report_file:
+                json.dump(report, report_file, indent=4)
+            return report
+        except Exception as e:
+            raise ConcreteException(e, sys) from e
 
-                os.makedirs(os.path.dirname(Pipeline.experiment_file_path), exist_ok=True)
-                if os.path.exists(Pipeline.experiment_file_path):
-                    experiment_report.to_csv(Pipeline.experiment_file_path, index=False, header=False, mode="a")
-                else:
-                    experiment_report.to_csv(Pipeline.experiment_file_path, mode="w", index=False, header=True)
+    @staticmethod
+    def get_experiment_store(artifact_dir: str) -> ExperimentStore:
+        """
+        Experiment store of the artifact directory, the legacy experiment csv is imported into it on first use.
+        """
+        try:
+            experiment_dir = os.path.join(artifact_dir, EXPERIMENT_DIR_NAME)
+            db_file_path = os.path.join(experiment_dir, EXPERIMENT_DB_FILE_NAME)
+            if Pipeline.experiment_store is not None and Pipeline.experiment_store.db_file_path == db_file_path:
+                return Pipeline.experiment_store
+            return ExperimentStore(db_file_path=db_file_path,
+                                   legacy_csv_file_path=os.path.join(experiment_dir, EXPERIMENT_FILE_NAME))
+        except Exception as e:
+            raise ConcreteException(e, sys) from e
+
+    def save_experiment(self):
+        try:
+            if self.experiment.experiment_id is not None:
+                experiment_dict = self.experiment._asdict()
+                experiment_dict.update({
+                    "created_time_stamp": datetime.now(),
+                    "experiment_file_path": os.path.basename(self.experiment.experiment_file_path)})
+                Pipeline.experiment_store.save_experiment(experiment_dict)
             else:
                 print("First start experiment")
         except Exception as e:
@@ -119,57 +287,74 @@ class Pipeline(Thread):
 
     def run_pipeline(self):
         try:
-            if Pipeline.experiment.running_status:
+            if self.experiment.running_status:
                 logging.info("Pipeline is already running")
-                return Pipeline.experiment
+                return self.experiment
             logging.info("Pipeline starting.")
             experiment_id = str(uuid.uuid4())
-            Pipeline.experiment = Experiment(experiment_id=experiment_id,
-                                             initialization_timestamp=self.config.time_stamp,
-                                             artifact_time_stamp=self.config.time_stamp,
-                                             running_status=True,
-                                             start_time=datetime.now(),
-                                             stop_time=None,
-                                             execution_time=None,
-                                             experiment_file_path=Pipeline.experiment_file_path,
-                                             is_model_accepted=None,
-                                             message="Pipeline has been started.",
-                                             accuracy=None,
-                                             )
-            logging.info(f"Pipeline experiment: {Pipeline.experiment}")
+            self.experiment = Experiment(experiment_id=experiment_id,
+                                         initialization_timestamp=self.config.time_stamp,
+                                         artifact_time_stamp=self.config.time_stamp,
+                                         running_status=True,
+                                         start_time=datetime.now(),
+                                         stop_time=None,
+                                         execution_time=None,
+                                         experiment_file_path=Pipeline.experiment_file_path,
+                                         is_model_accepted=None,
+                                         message="Pipeline has been started.",
+                                         accuracy=None,
+                                         )
+            logging.info(f"Pipeline experiment: {self.experiment}")
             self.save_experiment()
-            data_ingestion_artifact = self.start_data_ingestion()
-            data_validation_artifact = self.start_data_validation(data_ingestion_artifact=data_ingestion_artifact)
-            data_transformation_artifact = self.start_data_transformation(data_ingestion_artifact=data_ingestion_artifact,
-                                                                          data_validation_artifact=data_validation_artifact)
-            model_trainer_artifact = self.start_model_trainer(data_transformation_artifact=data_transformation_artifact)
-            model_evaluation_artifact = self.start_model_evaluation(data_ingestion_artifact=data_ingestion_artifact,
-                                                                    data_validation_artifact=data_validation_artifact,
-                                                                    model_trainer_artifact=model_trainer_artifact)
-            if model_evaluation_artifact.is_model_accepted:
-                model_pusher_artifact = self.start_model_pusher(model_evaluation_artifact=model_evaluation_artifact)
-                logging.info(f'Model pusher artifact: {model_pusher_artifact}')
-            else:
-                logging.info("Trained model rejected.")
+            self.artifact_store = ArtifactStore(blob_store=self.blob_store)
+            self.stage_dag = StageDag(stages=self.get_stages(),
+                                      max_workers=self.config.training_pipeline_config.max_workers,
+                                      stage_completed_callback=self.progress_callback)
+            profiler = self.start_profiler()
+            try:
+                stage_results = self.stage_dag.run()
+            finally:
+                if profiler is not None:
+                    profiler.stop()
+                #failed runs release the cached artifacts and the writer thread as well
+                self.artifact_store.close()
+            model_trainer_artifact = stage_results["model_trainer"]
+            model_evaluation_artifact = stage_results["model_evaluation"]
+            self.save_critical_path_report()
             logging.info("Pipeline completed.")
             stop_time = datetime.now()
-            Pipeline.experiment = Experiment(experiment_id=Pipeline.experiment.experiment_id,
-                                             initialization_timestamp=self.config.time_stamp,
-                                             artifact_time_stamp=self.config.time_stamp,
-                                             running_status=False,
-                                             start_time=Pipeline.experiment.start_time,
-                                             stop_time=stop_time,
-                                             execution_time=stop_time - Pipeline.experiment.start_time,
-                                             message="Pipeline has been completed.",
-                                             experiment_file_path=Pipeline.experiment_file_path,
-                                             is_model_accepted=model_evaluation_artifact.is_model_accepted,
-                                             accuracy=model_trainer_artifact.model_accuracy
-                                             )
-            logging.info(f"Pipeline experiment: {Pipeline.experiment}")
+            self.experiment = Experiment(experiment_id=self.experiment.experiment_id,
+                                         initialization_timestamp=self.config.time_stamp,
+                                         artifact_time_stamp=self.config.time_stamp,
+                                         running_status=False,
+                                         start_time=self.experiment.start_time,
+                                         stop_time=stop_time,
+                                         execution_time=stop_time - self.experiment.start_time,
+                                         message="Pipeline has been completed.",
+                                         experiment_file_path=Pipeline.experiment_file_path,
+                                         is_model_accepted=model_evaluation_artifact.is_model_accepted,
+                                         accuracy=model_trainer_artifact.model_accuracy
+                                         )
+            logging.info(f"Pipeline experiment: {self.experiment}")
             self.save_experiment()
+            self.save_experiment_details(model_trainer_artifact=model_trainer_artifact)
+            #archiving old runs happens in the background, the experiment result is not delayed
+            ArtifactRetention(retention_config=self.config.get_retention_config()).start()
+            return self.experiment
         except Exception as e:
             raise ConcreteException(e,sys) from e
 
+    def save_experiment_details(self, model_trainer_artifact: ModelTrainerArtifact):
+        try:
+            experiment_id = self.experiment.experiment_id
+            Pipeline.experiment_store.save_stage_timings(experiment_id=experiment_id,
+                                                         stage_runs=list(self.stage_dag.stage_runs.values()))
+            metrics = {metric_name: getattr(model_trainer_artifact, metric_name)
+                       for metric_name in ["train_rmse", "test_rmse", "train_accuracy", "test_accuracy", "model_accuracy"]}
+            Pipeline.experiment_store.save_metrics(experiment_id=experiment_id, metrics=metrics)
+        except Exception as e:
+            raise ConcreteException(e, sys) from e
+
 
     def run(self):
         try:
@@ -178,13 +363,16 @@ class Pipeline(Thread):
             raise ConcreteException(e,sys) from e
 
     @classmethod
-    def get_experiments_status(cls, limit: int = 5) -> pd.DataFrame:
+    def get_experiments_status(cls, limit: int = 5, page: int = 1) -> pd.DataFrame:
+        """
+        Returns a page of experiments, most recent first.
+        """
         try:
-            if os.path.exists(Pipeline.experiment_file_path):
-                df = pd.read_csv(Pipeline.experiment_file_path)
-                limit = -1 * int(limit)
-                return df[limit:].drop(columns=["experiment_file_path", "initialization_timestamp"], axis=1)
-            else:
-                return pd.DataFrame()
+            experiment_store = cls.experiment_store
+            if experiment_store is None:
+                experiment_store = cls.get_experiment_store(Configuration().training_pipeline_config.artifact_dir)
+                cls.experiment_store = experiment_store
+            df = experiment_store.get_experiments(limit=limit, page=page)
+            return df.drop(columns=["experiment_file_path", "initialization_timestamp"])
         except Exception as e:
             raise ConcreteException(e, sys) from e
\ No newline at end of file
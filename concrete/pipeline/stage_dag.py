@@ -0,0 +1,151 @@
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from datetime import datetime
+from typing import List
+from concrete.exception import ConcreteException
+from concrete.logger import logging
+from concrete.util.profiler import label as profiler_label
+import sys
+import threading
+
+
+Stage = namedtuple("Stage", ["name", "function", "dependencies"])
+
+StageRun = namedtuple("StageRun", ["name", "dependencies", "start_time", "stop_time", "execution_time", "thread_name"])
+
+
+class StageDag:
+    """
+    Runs pipeline stages on a worker pool as soon as the stages they depend on are done.
+    Each stage function is called with the results of its dependencies as keyword arguments
+    named after the dependency stages.
+    stage_completed_callback: optional function called as
+                              callback(stage_name, completed_stages, total_stages) after each stage
+    """
+
+    def __init__(self, stages: List[Stage], max_workers: int = 4, stage_completed_callback=None) -> None:
+        try:
+            self.stages = {stage.name: stage for stage in stages}
+            self.max_workers = max_workers
+            self.stage_completed_callback = stage_completed_callback
+            self.results = dict()
+            self.stage_runs = dict()
+            self.validate()
+        except Exception as e:
+            raise ConcreteException(e, sys) from e
+
+    def validate(self):
+        """
+        Checks that every dependency is a known stage and that the stages do not form a cycle.
+        """
+        try:
+            for stage in self.stages.values():
+                for dependency in stage.dependencies:
+                    if dependency not in self.stages:
+                        raise Exception(f"Stage [{stage.name}] depends on unknown stage [{dependency}]")
+            visited, in_progress = set(), set()
+
+            def visit(stage_name):
+                if stage_name in in_progress:
+                    raise Exception(f"Stage [{stage_name}] is part of a dependency cycle")
+                if stage_name in visited:
+                    return
+                in_progress.add(stage_name)
+                for dependency in self.stages[stage_name].dependencies:
+                    visit(dependency)
+                in_progress.remove(stage_name)
+                visited.add(stage_name)
+
+            for stage_name in self.stages:
+                visit(stage_name)
+        except Exception as e:
+            raise ConcreteException(e, sys) from e
+
+    def run_stage(self, stage: Stage, dependency_results: dict):
+        start_time = datetime.now()
+        logging.info(f"Stage [{stage.name}] started.")
+        with profiler_label(f"stage:{stage.name}"):
+            result = stage.function(**dependency_results)
+        stop_time = datetime.now()
+        self.stage_runs[stage.name] = StageRun(name=stage.name,
+                                               dependencies=list(stage.dependencies),
+                                               start_time=start_time,
+                                               stop_time=stop_time,
+                                               execution_time=(stop_time - start_time).total_seconds(),
+                                               thread_name=threading.current_thread().name)
+        logging.info(f"Stage [{stage.name}] completed in {self.stage_runs[stage.name].execution_time} seconds.")
+        return result
+
+    def run(self) -> dict:
+        """
+        Runs every stage and returns a dictionary of stage name to stage result.
+        The first failing stage stops the scheduling of new stages and its error is raised
+        once the stages already running are done.
+        """
+        try:
+            pending_stages = dict(self.stages)
+            running = dict()
+            with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="pipeline_stage") as executor:
+                while pending_stages or running:
+                    ready_stages = [stage for stage in pending_stages.values()
+                                    if all(dependency in self.results for dependency in stage.dependencies)]
+                    for stage in ready_stages:
+                        del pending_stages[stage.name]
+                        dependency_results = {dependency: self.results[dependency] for dependency in stage.dependencies}
+                        running[executor.submit(self.run_stage, stage, dependency_results)] = stage.name
+                    done, _ = wait(running.keys(), return_when=FIRST_COMPLETED)
+                    for future in done:
+                        stage_name = running.pop(future)
+                        error = future.exception()
+                        if error is not None:
+                            logging.info(f"Stage [{stage_name}] failed, waiting for running stages to finish.")
+                            wait(running.keys())
+                            raise error
+                        self.results[stage_name] = future.result()
+                        if self.stage_completed_callback is not None:
+                            self.stage_completed_callback(stage_name, len(self.results), len(self.stages))
+            return self.results
+        except Exception as e:
+            raise ConcreteException(e, sys) from e
+
+    def get_critical_path(self) -> List[StageRun]:
+        """
+        Returns the chain of dependent stages with the largest summed execution time,
+        which bounds the end to end execution time of the dag.
+        """
+        try:
+            longest_chain = dict()
+            for stage_name in sorted(self.stage_runs, key=lambda name: self.stage_runs[name].stop_time):
+                stage_run = self.stage_runs[stage_name]
+                previous_chains = [longest_chain[dependency] for dependency in stage_run.dependencies]
+                previous_chain = max(previous_chains, key=lambda chain: chain[0], default=(0.0, []))
+                longest_chain[stage_name] = (previous_chain[0] + stage_run.execution_time,
+                                             previous_chain[1] + [stage_run])
+            if not longest_chain:
+                return []
+            return max(longest_chain.values(), key=lambda chain: chain[0])[1]
+        except Exception as e:
+            raise ConcreteException(e, sys) from e
+
+    def get_critical_path_report(self) -> dict:
+        try:
+            critical_path = self.get_critical_path()
+            stage_runs = sorted(self.stage_runs.values(), key=lambda stage_run: stage_run.start_time)
+            wall_time = 0.0
+            if stage_runs:
+                wall_time = (max(run.stop_time for run in stage_runs) - stage_runs[0].start_time).total_seconds()
+            report = {
+                "wall_time": wall_time,
+                "sum_of_stage_times": sum(stage_run.execution_time for stage_run in stage_runs),
+                "critical_path_time": sum(stage_run.execution_time for stage_run in critical_path),
+                "critical_path": [stage_run.name for stage_run in critical_path],
+                "stages": {stage_run.name: {"dependencies": stage_run.dependencies,
+                                            "start_time": str(stage_run.start_time),
+                                            "stop_time": str(stage_run.stop_time),
+                                            "execution_time": stage_run.execution_time,
+                                            "thread_name": stage_run.thread_name}
+                           for stage_run in stage_runs}
+            }
+            return report
+        except Exception as e:
+            raise ConcreteException(e, sys) from e
@@ -0,0 +1,116 @@
+import os
+import sys
+import time
+from datetime import datetime
+from concrete.config.configuration import Configuration
+from concrete.constants import CONFIG_FILE_PATH, EXPERIMENT_DIR_NAME, TRAINING_WORKER_LOCK_FILE_NAME, get_current_time_stamp
+from concrete.entity.training_job_queue import TrainingJob, JOB_STATUS_DONE, JOB_STATUS_FAILED, get_training_job_queue
+from concrete.pipeline.pipeline import Pipeline
+from concrete.exception import ConcreteException
+from concrete.logger import logging
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+class TrainingWorker:
+    """
+    Process that runs the queued training jobs one at a time. It is the only process that
+    trains models: web workers only submit jobs and poll their progress. The worker runs
+    with a lowered scheduling priority so that prediction requests keep their cores.
+    Only one worker can run per artifact directory, a second one exits on start.
+    """
+
+    def __init__(self, config_file_path: str = CONFIG_FILE_PATH) -> None:
+        try:
+            self.config_file_path = config_file_path
+            self.training_pipeline_config = Configuration(config_file_path=config_file_path).training_pipeline_config
+            self.job_queue = get_training_job_queue(self.training_pipeline_config.artifact_dir)
+            self.lock_file = None
+        except Exception as e:
+            raise ConcreteException(e, sys) from e
+
+    def acquire_worker_lock(self) -> bool:
+        try:
+            if fcntl is None:
+                logging.info("fcntl is not available, training worker lock is not used.")
+                return True
+            lock_file_path = os.path.join(self.training_pipeline_config.artifact_dir, EXPERIMENT_DIR_NAME,
+                                          TRAINING_WORKER_LOCK_FILE_NAME)
+            self.lock_file = open(lock_file_path, "w")
+            try:
+                fcntl.flock(self.lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                self.lock_file.close()
+                self.lock_file = None
+                return False
+            return True
+        except Exception as e:
+            raise ConcreteException(e, sys) from e
+
+    def run_job(self, job: TrainingJob):
+        try:
+            logging.info(f"Training job [{job.job_id}] started.")
+            progress_callback = lambda stage_name, completed_stages, total_stages: \
+                self.job_queue.update_progress(job_id=job.job_id,
+                                               current_stage=stage_name,
+                                               completed_stages=completed_stages,
+                                               total_stages=total_stages)
+            pipeline = Pipeline(config=Configuration(config_file_path=self.config_file_path,
+                                                     current_time_stamp=get_current_time_stamp()),
+                                progress_callback=progress_callback)
+            try:
+                experiment = pipeline.run_pipeline()
+            except Exception as e:
+                logging.error(f"Training job [{job.job_id}] failed: {e}")
+                if pipeline.experiment.experiment_id is not None:
+                    pipeline.experiment = pipeline.experiment._replace(running_status=False,
+                                                                       stop_time=datetime.now(),
+                                                                       message="Pipeline has failed.")
+                    pipeline.save_experiment()
+                self.job_queue.finish_job(job_id=job.job_id, status=JOB_STATUS_FAILED,
+                                          message=str(e), experiment_id=pipeline.experiment.experiment_id)
+                return
+            self.job_queue.finish_job(job_id=job.job_id, status=JOB_STATUS_DONE,
+                                      message=experiment.message, experiment_id=experiment.experiment_id)
+        except Exception as e:
+            raise ConcreteException(e, sys) from e
+
+    def fail_job(self, job: TrainingJob, message: str):
+        """
+        Marks a job failed after an error outside the pipeline, the worker then keeps polling.
+        """
+        try:
+            self.job_queue.finish_job(job_id=job.job_id, status=JOB_STATUS_FAILED, message=message)
+        except Exception as e:
+            logging.error(f"Training job [{job.job_id}] could not be marked failed: {e}")
+
+    def run(self):
+        try:
+            if not self.acquire_worker_lock():
+                logging.info("Another training worker is running, exiting.")
+                return
+            if hasattr(os, "nice"):
+                os.nice(self.training_pipeline_config.training_worker_niceness)
+            self.job_queue.fail_interrupted_jobs()
+            logging.info(f"Training worker [{os.getpid()}] waiting for jobs.")
+            while True:
+                job = None
+                try:
+                    job = self.job_queue.claim_next_job(worker_pid=os.getpid())
+                    if job is not None:
+                        self.run_job(job)
+                        continue
+                except Exception as e:
+                    logging.error(f"Training worker error{'' if job is None else f' on job [{job.job_id}]'}: {e}")
+                    if job is not None:
+                        self.fail_job(job=job, message=str(e))
+                time.sleep(self.training_pipeline_config.training_job_poll_interval)
+        except Exception as e:
+            raise ConcreteException(e, sys) from e
+
+
+if __name__ == "__main__":
+    TrainingWorker().run()
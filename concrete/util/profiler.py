@@ -0,0 +1,202 @@
+import os
+import sys
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from xml.sax.saxutils import escape
+from concrete.exception import ConcreteException
+from concrete.logger import logging
+from concrete.constants import PROFILE_COLLAPSED_FILE_EXTENSION, PROFILE_FLAME_GRAPH_FILE_EXTENSION
+
+#profilers currently sampling, label() marks the calling thread in each of them
+active_profilers: list = []
+active_profilers_lock = threading.Lock()
+
+
+@contextmanager
+def label(name: str):
+    """
+    Marks the stacks the calling thread records while in the block with name, e.g. a pipeline
+    stage or a grid search. Does nothing when no profiler is active.
+    """
+    if not active_profilers:
+        yield
+        return
+    thread_id = threading.get_ident()
+    with active_profilers_lock:
+        profilers = list(active_profilers)
+    for profiler in profilers:
+        profiler.thread_labels.setdefault(thread_id, []).append(name)
+    try:
+        yield
+    finally:
+        for profiler in profilers:
+            labels = profiler.thread_labels.get(thread_id)
+            if labels:
+                labels.pop()
+
+
+class SamplingProfiler:
+    """
+    Statistical profiler: a background thread takes the stacks of the profiled threads from
+    sys._current_frames() every interval seconds and counts them. The profiled code runs
+    unchanged, the cost is one stack walk per thread and sample.
+    On stop the counts are written in collapsed stack format, one "frame;frame;... count" line
+    per distinct stack, and as an SVG flame graph.
+    thread_ids: threads to sample, None samples the threads marked with label() and the thread
+                that started the profiler
+    """
+
+    def __init__(self, output_dir: str, name: str, interval: float = 0.005, thread_ids: set = None) -> None:
+        try:
+            self.output_dir = output_dir
+            self.name = name
+            self.interval = interval
+            self.thread_ids = thread_ids
+            self.thread_labels = dict()
+            self.stacks = Counter()
+            self.sample_count = 0
+            self.stop_event = threading.Event()
+            self.sampler_thread = None
+            self.owner_thread_id = None
+        except Exception as e:
+            raise ConcreteException(e, sys) from e
+
+    @staticmethod
+    def get_frame_name(frame) -> str:
+        code = frame.f_code
+        return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})".replace(";", ",")
+
+    def take_sample(self):
+        thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == self.sampler_thread.ident:
+                continue
+            labels = self.thread_labels.get(thread_id)
+            if self.thread_ids is not None:
+                if thread_id not in self.thread_ids:
+                    continue
+            elif not labels and thread_id != self.owner_thread_id:
+                continue
+            frame_names = []
+            while frame is not None:
+                frame_names.append(SamplingProfiler.get_frame_name(frame))
+                frame = frame.f_back
+            root = [thread_names.get(thread_id, str(thread_id))] + list(labels or [])
+            self.stacks[";".join(root + frame_names[::-1])] += 1
+        self.sample_count += 1
+
+    def sample(self):
+        while not self.stop_event.wait(self.interval):
+            try:
+                self.take_sample()
+            except Exception as e:
+                logging.error(f"Profiler [{self.name}] sample failed: {e}")
+
+    def start(self):
+        try:
+            self.owner_thread_id = threading.get_ident()
+            self.sampler_thread = threading.Thread(target=self.sample, name=f"profiler_{self.name}", daemon=True)
+            with active_profilers_lock:
+                active_profilers.append(self)
+            self.sampler_thread.start()
+            return self
+        except Exception as e:
+            raise ConcreteException(e, sys) from e
+
+    def stop(self) -> str:
+        """
+        Stops sampling and writes the profile. Returns the flame graph file path.
+        """
+        try:
+            self.stop_event.set()
+            self.sampler_thread.join()
+            with active_profilers_lock:
+                active_profilers.remove(self)
+            return self.save()
+        except Exception as e:
+            raise ConcreteException(e, sys) from e
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def save(self) -> str:
+        try:
+            os.makedirs(self.output_dir, exist_ok=True)
+            collapsed_file_path = os.path.join(self.output_dir, f"{self.name}{PROFILE_COLLAPSED_FILE_EXTENSION}")
+            with open(collapsed_file_path, "w") as collapsed_file:
+                for stack, count in sorted(self.stacks.items()):
+                    collapsed_file.write(f"{stack} {count}\n")
+            flame_graph_file_path = os.path.join(self.output_dir, f"{self.name}{PROFILE_FLAME_GRAPH_FILE_EXTENSION}")
+            with open(flame_graph_file_path, "w") as flame_graph_file:
+                flame_graph_file.write(get_flame_graph_svg(self.stacks, title=f"{self.name}: {self.sample_count} samples "
+                                                                             f"every {self.interval * 1000:g} ms"))
+            logging.info(f"Profile [{self.name}] saved: [{flame_graph_file_path}]")
+            return flame_graph_file_path
+        except Exception as e:
+            raise ConcreteException(e, sys) from e
+
+
+def prune_profiles(profile_dir: str, max_profiles: int):
+    """
+    Removes the oldest profiles of profile_dir beyond the newest max_profiles.
+    Profile names start with a time stamp, so they sort oldest first.
+    """
+    try:
+        profile_names = sorted({file_name[:-len(PROFILE_FLAME_GRAPH_FILE_EXTENSION)] for file_name in os.listdir(profile_dir)
+                                if file_name.endswith(PROFILE_FLAME_GRAPH_FILE_EXTENSION)})
+        for profile_name in profile_names[:-max_profiles]:
+            for extension in [PROFILE_COLLAPSED_FILE_EXTENSION, PROFILE_FLAME_GRAPH_FILE_EXTENSION]:
+                file_path = os.path.join(profile_dir, f"{profile_name}{extension}")
+                if os.path.exists(file_path):
+                    os.remove(file_path)
+    except Exception as e:
+        raise ConcreteException(e, sys) from e
+
+
+def get_flame_graph_svg(stacks: Counter, title: str, width: int = 1200, frame_height: int = 16) -> str:
+    """
+    Renders collapsed stacks as a flame graph: one box per frame, as wide as the samples it
+    was on the stack for, stacked on its caller. Hovering a box shows its frame and samples.
+    """
+    try:
+        #frame tree as nested dicts: name -> [count, children]
+        root = [0, dict()]
+        for stack, count in stacks.items():
+            node = root
+            node[0] += count
+            for frame_name in stack.split(";"):
+                node = node[1].setdefault(frame_name, [0, dict()])
+                node[0] += count
+        boxes = []
+
+        def layout(children: dict, x: float, depth: int, scale: float):
+            for frame_name, (count, grandchildren) in sorted(children.items()):
+                box_width = count * scale
+                if box_width >= 0.5:
+                    boxes.append((x, depth, box_width, frame_name, count))
+                    layout(grandchildren, x, depth + 1, scale)
+                x += box_width
+
+        total_samples = max(root[0], 1)
+        layout(root[1], 0.0, 0, width / total_samples)
+        max_depth = max([depth for _, depth, _, _, _ in boxes], default=0) + 1
+        height = (max_depth + 2) * frame_height
+        lines = [f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" font-family="monospace" font-size="11">',
+                 f'<text x="4" y="{frame_height - 4}">{escape(title)}</text>']
+        for x, depth, box_width, frame_name, count in boxes:
+            y = height - (depth + 1) * frame_height
+            #warm colours varying with the frame name, as in the classic flame graph
+            hue = sum(frame_name.encode()) % 60
+            label_text = frame_name[:int(box_width / 7)]
+            lines.append(f'<g><title>{escape(frame_name)}: {count} samples ({100 * count / total_samples:.1f}%)</title>'
+                         f'<rect x="{x:.1f}" y="{y}" width="{box_width:.1f}" height="{frame_height - 1}" '
+                         f'fill="hsl({hue},90%,60%)"/>'
+                         f'<text x="{x + 2:.1f}" y="{y + frame_height - 4}">{escape(label_text)}</text></g>')
+        lines.append("</svg>")
+        return "\n".join(lines)
+    except Exception as e:
+        raise ConcreteException(e, sys) from e
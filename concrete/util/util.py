@@ -1,10 +1,14 @@
 import yaml
 from concrete.exception import ConcreteException
 import os,sys
-import pandas as pd
 from concrete.constants import *
+from concrete.config.config_loader import load_config_file, SCHEMA_REQUIRED_KEYS
 import numpy as np
 import dill
+import hashlib
+import tempfile
+import gzip
+import shutil
 
 
 def write_yaml_file(file_path:str,data:dict=None):
@@ -21,6 +25,29 @@ def write_yaml_file(file_path:str,data:dict=None):
     except Exception as e:
         raise ConcreteException(e,sys)
 
+def write_yaml_file_atomic(file_path:str, data:dict):
+    """
+    Writes the yaml file to a temporary file in the same directory and renames it over
+    file_path, so that readers see either the old or the new content.
+    file_path: str
+    data: dict
+    """
+    try:
+        dir_path = os.path.dirname(file_path)
+        os.makedirs(dir_path, exist_ok=True)
+        file_descriptor, temp_file_path = tempfile.mkstemp(dir=dir_path, suffix=".tmp")
+        try:
+            with os.fdopen(file_descriptor, "w") as yaml_file:
+                yaml.dump(data, yaml_file)
+                yaml_file.flush()
+                os.fsync(yaml_file.fileno())
+            os.replace(temp_file_path, file_path)
+        except BaseException:
+            os.remove(temp_file_path)
+            raise
+    except Exception as e:
+        raise ConcreteException(e,sys) from e
+
 def read_yaml_file(file_path:str)->dict:
     """
     Reads a YAML file and returns the contents as a dictionary.
@@ -32,9 +59,10 @@ def read_yaml_file(file_path:str)->dict:
     except Exception as e:
         raise ConcreteException(e,sys) from e
 
-def load_data(file_path:str, schema_file_path:str)-> pd.DataFrame:
+def load_data(file_path:str, schema_file_path:str)-> "pd.DataFrame":
     try:
-        schema = read_yaml_file(schema_file_path)
+        import pandas as pd
+        schema = load_config_file(schema_file_path, required_keys=SCHEMA_REQUIRED_KEYS)
         columns = schema[SCHEMA_COLUMNS_KEY]
         df = pd.read_csv(file_path)
         error_message = ""
@@ -49,7 +77,17 @@ def load_data(file_path:str, schema_file_path:str)-> pd.DataFrame:
     except Exception as e:
         raise ConcreteException(e,sys) from e
 
-def save_numpy_array_data(file_path: str, array: np.array):
+def open_artifact_file(file_path: str, blob_store=None):
+    """
+    Opens file_path for writing, through the blob store when one is given.
+    blob_store: BlobStore storing the content once for every identical artifact
+    """
+    if blob_store is None:
+        return open(file_path, "wb")
+    return blob_store.open(file_path)
+
+
+def save_numpy_array_data(file_path: str, array: np.array, blob_store=None):
     """
     Save numpy array data to file
     file_path: str location of file to save
@@ -58,7 +96,7 @@ def save_numpy_array_data(file_path: str, array: np.array):
     try:
         dir_path = os.path.dirname(file_path)
         os.makedirs(dir_path, exist_ok=True)
-        with open(file_path, 'wb') as file_obj:
+        with open_artifact_file(file_path, blob_store) as file_obj:
             np.save(file_obj, array)
     except Exception as e:
         raise ConcreteException(e, sys) from e
@@ -77,7 +115,7 @@ def load_numpy_array_data(file_path: str) -> np.array:
         raise ConcreteException(e, sys) from e
 
 
-def save_object(file_path:str,obj):
+def save_object(file_path:str,obj, blob_store=None):
     """
     file_path: str
     obj: Any sort of object
@@ -85,7 +123,7 @@ def save_object(file_path:str,obj):
     try:
         dir_path = os.path.dirname(file_path)
         os.makedirs(dir_path, exist_ok=True)
-        with open(file_path, "wb") as file_obj:
+        with open_artifact_file(file_path, blob_store) as file_obj:
             dill.dump(obj, file_obj)
     except Exception as e:
         raise ConcreteException(e,sys) from e
@@ -102,10 +140,202 @@ def load_object(file_path:str):
         raise ConcreteException(e,sys) from e
 
 
+class SplitObjectPickler(dill.Pickler):
+    """
+    Pickler writing large numpy arrays to a separate blob instead of the pickle stream.
+    """
+
+    def __init__(self, file_obj, blob_file_obj, min_array_bytes: int, **kwargs):
+        super().__init__(file_obj, **kwargs)
+        self.blob_file_obj = blob_file_obj
+        self.min_array_bytes = min_array_bytes
+        #arrays already written, keyed by id, each kept alive with its persistent id
+        self.written_arrays = dict()
+        self.blob_offset = 0
+
+    def persistent_id(self, obj):
+        if not isinstance(obj, np.ndarray) or obj.dtype.hasobject or obj.nbytes < self.min_array_bytes:
+            return None
+        if id(obj) in self.written_arrays:
+            return self.written_arrays[id(obj)][1]
+        offset = self.blob_offset
+        padding = -offset % SPLIT_OBJECT_ARRAY_ALIGNMENT
+        self.blob_file_obj.write(b"\0" * padding)
+        self.blob_file_obj.write(memoryview(np.ascontiguousarray(obj)).cast("B"))
+        self.blob_offset = offset + padding + obj.nbytes
+        pid = ("ndarray", offset + padding, obj.dtype, obj.shape)
+        self.written_arrays[id(obj)] = (obj, pid)
+        return pid
+
+
+class SplitObjectUnpickler(dill.Unpickler):
+    """
+    Unpickler reading the arrays written by SplitObjectPickler as views of the memory mapped blob.
+    """
+
+    def __init__(self, file_obj, blob, **kwargs):
+        super().__init__(file_obj, **kwargs)
+        self.blob = blob
+
+    def persistent_load(self, pid):
+        _, offset, dtype, shape = pid
+        n_bytes = int(np.prod(shape, dtype=np.int64)) * dtype.itemsize
+        return np.asarray(self.blob[offset:offset + n_bytes]).view(dtype).reshape(shape)
+
+
+def get_split_object_blob_path(file_path:str) -> str:
+    return f"{os.path.splitext(file_path)[0]}{SPLIT_OBJECT_BLOB_EXTENSION}"
+
+
+def save_split_object(file_path:str, obj, min_array_bytes:int = SPLIT_OBJECT_MIN_ARRAY_BYTES, blob_store=None):
+    """
+    Saves obj in split format: numpy arrays of at least min_array_bytes are written uncompressed
+    and aligned to a blob file next to file_path, everything else is pickled to file_path.
+    file_path: str
+    obj: Any sort of object
+    """
+    try:
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        with open_artifact_file(file_path, blob_store) as file_obj, \
+                open_artifact_file(get_split_object_blob_path(file_path), blob_store) as blob_file_obj:
+            SplitObjectPickler(file_obj, blob_file_obj, min_array_bytes=min_array_bytes).dump(obj)
+    except Exception as e:
+        raise ConcreteException(e,sys) from e
+
+
+def load_split_object(file_path:str):
+    """
+    Loads an object saved by save_split_object. Its large arrays are read-only views of the
+    memory mapped blob, so processes loading the same file share its pages through the OS cache.
+    Plain pickles saved by save_object are loaded as well.
+    file_path: str
+    """
+    try:
+        blob_path = get_split_object_blob_path(file_path)
+        blob = None
+        if os.path.exists(blob_path) and os.path.getsize(blob_path) > 0:
+            blob = np.memmap(blob_path, dtype=np.uint8, mode="r")
+        with open(file_path, "rb") as file_obj:
+            return SplitObjectUnpickler(file_obj, blob).load()
+    except Exception as e:
+        raise ConcreteException(e,sys) from e
+
+
 def get_previous_timestamp_dir(dir:str):
     try:
-        folder_name = os.listdir(dir)
+        #time stamp folder names sort in chronological order, os.listdir order is arbitrary
+        folder_name = sorted(os.listdir(dir))
         previous_timestamp_dir = os.path.join(dir, f"{folder_name[-2]}")
         return previous_timestamp_dir
     except Exception as e:
         raise ConcreteException(e, sys) from e
+
+
+def get_file_hash(file_path:str, block_size:int = 1024*1024)-> str:
+    """
+    Returns sha256 hex digest of the file content, reading it block by block
+    file_path: str
+    """
+    try:
+        file_hash = hashlib.sha256()
+        with open(file_path, "rb") as file_obj:
+            for block in iter(lambda: file_obj.read(block_size), b""):
+                file_hash.update(block)
+        return file_hash.hexdigest()
+    except Exception as e:
+        raise ConcreteException(e, sys) from e
+
+
+def save_gzip_copy(file_path:str)-> str:
+    """
+    Writes a gzip compressed copy of the file next to it, with the same modification time,
+    so that it can be served to clients accepting gzip without compressing on every request.
+    Returns the path of the compressed copy.
+    """
+    try:
+        gzip_file_path = f"{file_path}{GZIP_FILE_EXTENSION}"
+        dir_path = os.path.dirname(gzip_file_path) or "."
+        temp_fd, temp_file_path = tempfile.mkstemp(dir=dir_path, prefix=".", suffix=GZIP_FILE_EXTENSION)
+        try:
+            with open(file_path, "rb") as file_obj, os.fdopen(temp_fd, "wb") as temp_file_obj:
+                with gzip.GzipFile(fileobj=temp_file_obj, mode="wb", mtime=0) as gzip_file_obj:
+                    shutil.copyfileobj(file_obj, gzip_file_obj, 1024*1024)
+            os.replace(temp_file_path, gzip_file_path)
+        except BaseException:
+            if os.path.exists(temp_file_path):
+                os.remove(temp_file_path)
+            raise
+        source_stat = os.stat(file_path)
+        os.utime(gzip_file_path, ns=(source_stat.st_atime_ns, source_stat.st_mtime_ns))
+        return gzip_file_path
+    except Exception as e:
+        raise ConcreteException(e, sys) from e
+
+
+def get_open_file_paths()-> set:
+    """
+    Real paths of the files held open by the live processes this user can inspect, read from
+    /proc. None where /proc is not available.
+    """
+    try:
+        if not os.path.isdir("/proc/self/fd"):
+            return None
+        open_file_paths = set()
+        for pid in os.listdir("/proc"):
+            if not pid.isdigit():
+                continue
+            fd_dir = os.path.join("/proc", pid, "fd")
+            try:
+                fds = os.listdir(fd_dir)
+            except OSError:
+                continue
+            for fd in fds:
+                try:
+                    open_file_paths.add(os.path.realpath(os.readlink(os.path.join(fd_dir, fd))))
+                except OSError:
+                    continue
+        return open_file_paths
+    except Exception as e:
+        raise ConcreteException(e, sys) from e
+
+
+def get_gzip_copy_path(file_path:str)-> str:
+    """
+    Path of the gzip copy written by save_gzip_copy, None if there is none or it is out of date.
+    """
+    try:
+        gzip_file_path = f"{file_path}{GZIP_FILE_EXTENSION}"
+        try:
+            gzip_mtime = os.stat(gzip_file_path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+        return gzip_file_path if gzip_mtime == os.stat(file_path).st_mtime_ns else None
+    except Exception as e:
+        raise ConcreteException(e, sys) from e
+
+
+#directory path -> (directory modification time, sorted file names)
+directory_listing_cache: dict = {}
+
+
+def list_dir_cached(dir_path:str)-> list:
+    """
+    Sorted file names of the directory. Listings are cached until the directory modification
+    time changes, which happens whenever an entry is added, removed or renamed.
+    gzip copies written by save_gzip_copy are not listed.
+    """
+    try:
+        dir_mtime = os.stat(dir_path).st_mtime_ns
+        cached_listing = directory_listing_cache.get(dir_path)
+        if cached_listing is not None and cached_listing[0] == dir_mtime:
+            return cached_listing[1]
+        file_names = set(os.listdir(dir_path))
+        file_names = sorted(file_name for file_name in file_names
+                            if not (file_name.endswith(GZIP_FILE_EXTENSION)
+                                    and file_name[:-len(GZIP_FILE_EXTENSION)] in file_names))
+        if len(directory_listing_cache) >= DIRECTORY_LISTING_CACHE_SIZE:
+            directory_listing_cache.clear()
+        directory_listing_cache[dir_path] = (dir_mtime, file_names)
+        return file_names
+    except Exception as e:
+        raise ConcreteException(e, sys) from e
@@ -0,0 +1,98 @@
+import os
+import gc
+import sys
+import time
+import signal
+import threading
+import subprocess
+from concrete.constants import MODEL_RELOAD_MARKER_FILE_NAME, TRAINING_WORKER_RESTART_DELAY_SECONDS
+from concrete.logger import logging
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+workers = int(os.environ.get("WEB_CONCURRENCY", 4))
+
+#the app, and with it the served models, is loaded once in the master before the workers are forked.
+#arrays kept as views of the memory mapped split format blob, among them the flattened trees used for
+#intervals and attributions, are shared through the page cache by every process loading the model.
+#the node tables of the sklearn trees are not: trees copy them into their own memory when unpickled,
+#so forest memory is shared only copy-on-write between the workers forked from one master load, and
+#the training worker and batch predictions hold their own copy.
+preload_app = True
+
+#set when the master exits, the training worker is then no longer restarted
+training_worker_stopped = threading.Event()
+
+
+def pre_fork(server, worker):
+    """
+    Runs in the master before each worker is forked. Workers spawned after a reload
+    get the newly pushed model from the master instead of loading it themselves.
+    """
+    from app import get_model_server
+    get_model_server().refresh()
+    #keep the garbage collector from writing to the preloaded objects, which would copy their pages
+    gc.freeze()
+
+
+def request_master_reload(worker, latest_pointer_mtime: float):
+    """
+    Asks the master to reload the models and replace its workers when a worker notices a new model.
+    The marker file records the latest pointer version a reload was requested for, so the master
+    is signalled once per pushed model and not once per worker.
+    """
+    from app import get_model_server
+    marker_file_path = os.path.join(get_model_server().model_serving_config.model_dir, MODEL_RELOAD_MARKER_FILE_NAME)
+    with open(marker_file_path, "a+") as marker_file:
+        if fcntl is not None:
+            fcntl.flock(marker_file, fcntl.LOCK_EX)
+        marker_file.seek(0)
+        requested_mtime = marker_file.read().strip()
+        if requested_mtime and float(requested_mtime) >= latest_pointer_mtime:
+            return
+        marker_file.seek(0)
+        marker_file.truncate()
+        marker_file.write(str(latest_pointer_mtime))
+    logging.info(f"Worker [{worker.pid}] requests a model reload from master [{worker.ppid}].")
+    os.kill(worker.ppid, signal.SIGHUP)
+
+
+def post_fork(server, worker):
+    from concrete.logger import open_process_log_file
+    from app import get_model_server
+    open_process_log_file()
+    get_model_server().reload_callback = lambda latest_pointer_mtime: request_master_reload(worker, latest_pointer_mtime)
+
+
+def supervise_training_worker(server):
+    """
+    Runs the training worker as a child process of the master and starts it again whenever it
+    exits, so queued jobs keep running after a crash. A restarted worker fails the job its
+    predecessor left running.
+    """
+    while not training_worker_stopped.is_set():
+        server.training_worker = subprocess.Popen([sys.executable, "-m", "concrete.pipeline.training_worker"])
+        logging.info(f"Training worker [{server.training_worker.pid}] started.")
+        return_code = server.training_worker.wait()
+        if training_worker_stopped.is_set():
+            break
+        logging.error(f"Training worker [{server.training_worker.pid}] exited with code [{return_code}], "
+                      f"restarting in {TRAINING_WORKER_RESTART_DELAY_SECONDS} seconds.")
+        training_worker_stopped.wait(TRAINING_WORKER_RESTART_DELAY_SECONDS)
+
+
+def when_ready(server):
+    threading.Thread(target=supervise_training_worker, args=(server,), daemon=True,
+                     name="training_worker_supervisor").start()
+
+
+def on_exit(server):
+    training_worker_stopped.set()
+    training_worker = getattr(server, "training_worker", None)
+    if training_worker is not None and training_worker.poll() is None:
+        training_worker.terminate()
+        training_worker.wait()
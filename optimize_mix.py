@@ -0,0 +1,60 @@
+import sys, os
+import json
+import argparse
+from concrete.config.configuration import Configuration
+from concrete.entity.model_server import ModelServer
+from concrete.entity.prediction_input_validator import PredictionInputValidator
+from concrete.entity.mix_design_optimizer import MixDesignOptimizer
+from concrete.logger import logging
+
+
+def parse_assignments(assignments: list, parse_value) -> dict:
+    """
+    ["cement=0.12", ...] to {"cement": parse_value("0.12"), ...}
+    """
+    parsed = dict()
+    for assignment in assignments:
+        name, _, value = assignment.partition("=")
+        parsed[name.strip()] = parse_value(value)
+    return parsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Searches the cheapest concrete mix reaching a target compressive "
+                                                 "strength with the served model.")
+    parser.add_argument("--target-strength", type=float, required=True, help="target compressive strength in MPa")
+    parser.add_argument("--age", type=float, default=28, help="age in days")
+    parser.add_argument("--cost", nargs="+", required=True, metavar="INGREDIENT=COST",
+                        help="cost per kg of every ingredient, e.g. cement=0.12")
+    parser.add_argument("--bounds", nargs="*", default=[], metavar="INGREDIENT=MIN:MAX",
+                        help="kg/m3 bounds within the schema bounds, replacing the training data ranges the "
+                             "search defaults to, e.g. cement=150:450")
+    parser.add_argument("--population-size", type=int)
+    parser.add_argument("--generations", type=int)
+    parser.add_argument("--random-state", type=int)
+    parser.add_argument("--config", default=os.path.join("config", "config.yaml"), help="config file path")
+    args = parser.parse_args()
+    try:
+        configuration = Configuration(config_file_path=args.config)
+        _, model = ModelServer(model_serving_config=configuration.get_model_serving_config()).get_champion_model()
+        input_validator = PredictionInputValidator(schema_file_path=configuration.get_data_validation_config().schema_file_path)
+        optimizer = MixDesignOptimizer(model=model, input_validator=input_validator)
+        payload = {"target_strength": args.target_strength,
+                   "age": args.age,
+                   "costs": parse_assignments(args.cost, float),
+                   "bounds": parse_assignments(args.bounds, lambda value: value.split(":"))}
+        for name in ["population_size", "generations", "random_state"]:
+            if getattr(args, name) is not None:
+                payload[name] = getattr(args, name)
+        mix_design_request, error_message = optimizer.validate_request(payload)
+        if error_message is not None:
+            parser.error(error_message)
+        print(json.dumps(optimizer.optimize(mix_design_request)._asdict(), indent=4))
+    except Exception as e:
+        logging.error(f"{e}")
+        print(e)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
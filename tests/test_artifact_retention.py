@@ -0,0 +1,95 @@
+import os
+from concrete.entity.config_entity import RetentionConfig
+from concrete.entity.artifact_retention import ArtifactRetention
+from concrete.entity.model_registry import ModelRegistry
+from concrete.entity.preprocessor_store import PreprocessorStore
+from concrete.util.util import write_yaml_file
+from concrete.constants import BEST_MODEL_KEY, HISTORY_KEY, MODEL_PATH_KEY, LATEST_POINTER_FILE_NAME, \
+    MODEL_ARCHIVE_FILE_EXTENSION
+
+TIME_STAMPS = ["2026-01-01-00-00-00", "2026-01-02-00-00-00", "2026-01-03-00-00-00",
+               "2026-01-04-00-00-00", "2026-01-05-00-00-00", "2026-01-06-00-00-00"]
+STAGE_DIR_NAMES = ["data_transformation", "model_trainer"]
+
+
+def get_model_path(artifact_dir, time_stamp: str) -> str:
+    return os.path.join(artifact_dir, "model_trainer", time_stamp, "trained_model", "model.pkl")
+
+
+def get_preprocessing_object_path(artifact_dir, time_stamp: str) -> str:
+    return os.path.join(artifact_dir, "data_transformation", time_stamp, "preprocessed", "preprocessed.pkl")
+
+
+def create_artifacts(tmp_path, archive_expired_runs: bool = True) -> RetentionConfig:
+    """
+    Six runs: the first is the best model, the second is in the evaluation history, the third is the
+    source of a registered model, the fourth the latest pointer of the trainer, the last two are recent.
+    """
+    artifact_dir = str(tmp_path / "artifact")
+    for time_stamp in TIME_STAMPS:
+        for file_path in [get_model_path(artifact_dir, time_stamp), get_preprocessing_object_path(artifact_dir, time_stamp)]:
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            with open(file_path, "w") as file_obj:
+                file_obj.write(time_stamp)
+    #folders not named by a time stamp are not runs
+    os.makedirs(os.path.join(artifact_dir, "model_trainer", "tmp"))
+    write_yaml_file(file_path=os.path.join(artifact_dir, "model_trainer", LATEST_POINTER_FILE_NAME),
+                    data={MODEL_PATH_KEY: get_model_path(artifact_dir, TIME_STAMPS[3])})
+    model_evaluation_file_path = str(tmp_path / "model_evaluation.yaml")
+    write_yaml_file(file_path=model_evaluation_file_path,
+                    data={BEST_MODEL_KEY: {MODEL_PATH_KEY: get_model_path(artifact_dir, TIME_STAMPS[0])},
+                          HISTORY_KEY: {"run": {MODEL_PATH_KEY: get_model_path(artifact_dir, TIME_STAMPS[1])}}})
+    model_dir = str(tmp_path / "saved_models")
+    ModelRegistry(model_dir=model_dir).register(version="1", model_path=os.path.join(model_dir, "1", "model.pkl"),
+                                                source_model_path=get_model_path(artifact_dir, TIME_STAMPS[2]))
+    preprocessor_store = PreprocessorStore(store_dir=str(tmp_path / "preprocessor_store"))
+    for time_stamp in TIME_STAMPS:
+        preprocessor_store.put(key=time_stamp, preprocessing_obj=None,
+                               object_file_path=get_preprocessing_object_path(artifact_dir, time_stamp))
+    return RetentionConfig(artifact_dir=artifact_dir,
+                           archive_dir=os.path.join(artifact_dir, "archive"),
+                           keep_last_runs=2,
+                           archive_expired_runs=archive_expired_runs,
+                           log_dir=str(tmp_path / "logs"),
+                           log_retention_days=30,
+                           model_evaluation_file_path=model_evaluation_file_path,
+                           preprocessor_store_dir=str(tmp_path / "preprocessor_store"),
+                           model_dir=model_dir)
+
+
+def test_pinned_runs_are_kept(tmp_path):
+    retention_config = create_artifacts(tmp_path)
+    artifact_retention = ArtifactRetention(retention_config=retention_config)
+    assert artifact_retention.get_pinned_time_stamps() == set(TIME_STAMPS[:4])
+    assert artifact_retention.apply_run_retention() == []
+    for time_stamp in TIME_STAMPS:
+        assert os.path.exists(get_model_path(retention_config.artifact_dir, time_stamp))
+
+
+def test_expired_runs_are_archived_and_removed(tmp_path):
+    retention_config = create_artifacts(tmp_path)
+    artifact_dir = retention_config.artifact_dir
+    #no longer in the evaluation history, the run expires
+    write_yaml_file(file_path=retention_config.model_evaluation_file_path,
+                    data={BEST_MODEL_KEY: {MODEL_PATH_KEY: get_model_path(artifact_dir, TIME_STAMPS[0])}})
+    expired_time_stamp = TIME_STAMPS[1]
+    assert ArtifactRetention(retention_config=retention_config).apply_run_retention() == [expired_time_stamp]
+
+    for stage_dir_name in STAGE_DIR_NAMES:
+        assert not os.path.exists(os.path.join(artifact_dir, stage_dir_name, expired_time_stamp))
+    for time_stamp in TIME_STAMPS:
+        if time_stamp != expired_time_stamp:
+            assert os.path.exists(get_model_path(artifact_dir, time_stamp))
+            assert os.path.exists(get_preprocessing_object_path(artifact_dir, time_stamp))
+    assert os.path.isdir(os.path.join(artifact_dir, "model_trainer", "tmp"))
+    assert os.listdir(retention_config.archive_dir) == [f"{expired_time_stamp}{MODEL_ARCHIVE_FILE_EXTENSION}"]
+    index = PreprocessorStore(store_dir=retention_config.preprocessor_store_dir).read_index()
+    assert sorted(index) == [time_stamp for time_stamp in TIME_STAMPS if time_stamp != expired_time_stamp]
+
+
+def test_expired_runs_are_removed_without_archive(tmp_path):
+    retention_config = create_artifacts(tmp_path, archive_expired_runs=False)
+    os.remove(os.path.join(retention_config.artifact_dir, "model_trainer", LATEST_POINTER_FILE_NAME))
+    assert ArtifactRetention(retention_config=retention_config).apply_run_retention() == [TIME_STAMPS[3]]
+    assert not os.path.exists(os.path.join(retention_config.artifact_dir, "model_trainer", TIME_STAMPS[3]))
+    assert not os.path.exists(retention_config.archive_dir)
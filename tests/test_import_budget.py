@@ -0,0 +1,11 @@
+import os
+from check_import_budget import get_loaded_modules, IMPORT_BUDGET_SECONDS
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_app_import_is_light(monkeypatch):
+    monkeypatch.chdir(PROJECT_DIR)
+    result = get_loaded_modules("app")
+    assert result["loaded"] == []
+    assert result["seconds"] <= IMPORT_BUDGET_SECONDS
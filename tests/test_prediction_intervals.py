@@ -0,0 +1,45 @@
+import math
+import numpy as np
+import pytest
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.linear_model import Ridge
+from concrete.component.model_trainer import EstimatorModel
+
+COVERAGE = 0.9
+
+
+def get_data(row_count: int, random_state: int) -> tuple:
+    random = np.random.RandomState(random_state)
+    X = random.uniform(-2, 2, size=(row_count, 3))
+    y = 2 * X[:, 0] + np.sin(3 * X[:, 1]) + random.normal(scale=0.3 + 0.3 * np.abs(X[:, 2]), size=row_count)
+    return X, y
+
+
+def get_calibrated_model(estimator, calibration_row_count: int) -> EstimatorModel:
+    X_train, y_train = get_data(row_count=500, random_state=0)
+    model = EstimatorModel(preprocessing_object=None, trained_model_object=estimator.fit(X_train, y_train))
+    X_calibration, y_calibration = get_data(row_count=calibration_row_count, random_state=1)
+    model.calibrate_intervals(transformed_feature=X_calibration, y=y_calibration, coverage=COVERAGE)
+    return model
+
+
+@pytest.mark.parametrize("calibration_row_count", [5, 9, 19, 200])
+def test_quantile_is_conformal_order_statistic(calibration_row_count):
+    model = get_calibrated_model(Ridge(alpha=1.0), calibration_row_count)
+    X_calibration, y_calibration = get_data(row_count=calibration_row_count, random_state=1)
+    scores = np.sort(np.abs(y_calibration - model.trained_model_object.predict(X_calibration)))
+    rank = min(calibration_row_count, math.ceil((calibration_row_count + 1) * COVERAGE))
+    assert model.interval_quantile == pytest.approx(scores[rank - 1])
+
+
+@pytest.mark.parametrize("estimator", [Ridge(alpha=1.0), RandomForestRegressor(n_estimators=50, min_samples_leaf=5,
+                                                                               random_state=0)],
+                         ids=lambda estimator: type(estimator).__name__)
+def test_intervals_reach_coverage_on_new_rows(estimator):
+    model = get_calibrated_model(estimator, calibration_row_count=500)
+    X_test, y_test = get_data(row_count=5000, random_state=2)
+    prediction, scale = model.predict_transformed_with_scale(X_test)
+    half_width = model.interval_quantile * scale
+    covered = np.mean(np.abs(y_test - prediction) <= half_width)
+    assert COVERAGE - 0.02 <= covered <= COVERAGE + 0.05
+    assert model.interval_coverage == COVERAGE
@@ -0,0 +1,61 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concrete.entity.training_job_queue import TrainingJobQueue, JOB_STATUS_QUEUED, JOB_STATUS_RUNNING, \
+    JOB_STATUS_DONE, JOB_STATUS_FAILED
+
+PROCESS_COUNT = 8
+
+
+def submit_job(db_file_path: str) -> tuple:
+    job, is_created = TrainingJobQueue(db_file_path=db_file_path).submit_job()
+    return job.job_id, is_created
+
+
+def claim_next_job(db_file_path: str):
+    job = TrainingJobQueue(db_file_path=db_file_path).claim_next_job(worker_pid=os.getpid())
+    return None if job is None else job.job_id
+
+
+def test_submit_returns_pending_job(tmp_path):
+    queue = TrainingJobQueue(db_file_path=str(tmp_path / "jobs.db"))
+    job, is_created = queue.submit_job()
+    assert is_created and job.status == JOB_STATUS_QUEUED
+    pending_job, is_created = queue.submit_job()
+    assert not is_created and pending_job.job_id == job.job_id
+
+    running_job = queue.claim_next_job(worker_pid=os.getpid())
+    assert running_job.job_id == job.job_id and running_job.status == JOB_STATUS_RUNNING
+    assert queue.claim_next_job(worker_pid=os.getpid()) is None
+    pending_job, is_created = queue.submit_job()
+    assert not is_created and pending_job.job_id == job.job_id
+
+    queue.finish_job(job_id=job.job_id, status=JOB_STATUS_DONE, message="done")
+    next_job, is_created = queue.submit_job()
+    assert is_created and next_job.job_id != job.job_id
+
+
+def test_concurrent_submits_queue_one_job(tmp_path):
+    db_file_path = str(tmp_path / "jobs.db")
+    TrainingJobQueue(db_file_path=db_file_path)
+    with ProcessPoolExecutor(max_workers=PROCESS_COUNT) as executor:
+        results = list(executor.map(submit_job, [db_file_path] * PROCESS_COUNT))
+    assert len({job_id for job_id, _ in results}) == 1
+    assert sum(is_created for _, is_created in results) == 1
+
+
+def test_concurrent_claims_run_job_once(tmp_path):
+    db_file_path = str(tmp_path / "jobs.db")
+    job, _ = TrainingJobQueue(db_file_path=db_file_path).submit_job()
+    with ProcessPoolExecutor(max_workers=PROCESS_COUNT) as executor:
+        claimed_job_ids = list(executor.map(claim_next_job, [db_file_path] * PROCESS_COUNT))
+    assert [job_id for job_id in claimed_job_ids if job_id is not None] == [job.job_id]
+
+
+def test_interrupted_job_fails(tmp_path):
+    queue = TrainingJobQueue(db_file_path=str(tmp_path / "jobs.db"))
+    job, _ = queue.submit_job()
+    queue.claim_next_job(worker_pid=os.getpid())
+    queue.fail_interrupted_jobs()
+    assert queue.get_job(job.job_id).status == JOB_STATUS_FAILED
+    _, is_created = queue.submit_job()
+    assert is_created
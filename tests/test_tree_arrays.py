@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+from sklearn.ensemble import RandomForestRegressor, ExtraTreesRegressor, GradientBoostingRegressor
+from sklearn.linear_model import Ridge
+from concrete.entity.tree_arrays import TreeArrays
+from concrete.entity.attribution_engine import AttributionEngine
+from concrete.util.util import save_split_object, load_split_object
+
+ESTIMATORS = [RandomForestRegressor(n_estimators=20, random_state=0),
+              ExtraTreesRegressor(n_estimators=20, random_state=0),
+              GradientBoostingRegressor(n_estimators=30, random_state=0)]
+
+
+def get_data(row_count: int = 300, feature_count: int = 5, random_state: int = 0) -> tuple:
+    random = np.random.RandomState(random_state)
+    X = random.normal(size=(row_count, feature_count))
+    y = 3 * X[:, 0] - 2 * X[:, 1] * X[:, 2] + random.normal(scale=0.1, size=row_count)
+    return X, y
+
+
+@pytest.mark.parametrize("estimator", ESTIMATORS, ids=lambda estimator: type(estimator).__name__)
+def test_tree_arrays_match_sklearn(estimator):
+    X, y = get_data()
+    estimator.fit(X, y)
+    trees = [tree_estimator for tree_estimator in np.ravel(estimator.estimators_)]
+    tree_arrays = TreeArrays.from_estimator(estimator)
+    X_new, _ = get_data(random_state=1)
+
+    leaves = tree_arrays.apply(X_new) - tree_arrays.roots
+    assert np.array_equal(leaves, np.column_stack([tree.apply(X_new) for tree in trees]))
+    tree_predictions = tree_arrays.predict_trees(X_new)
+    assert np.array_equal(tree_predictions, np.column_stack([tree.predict(X_new) for tree in trees]))
+    contributions = tree_arrays.predict_contributions(X_new)
+    root_value_sum = tree_arrays.value[tree_arrays.roots].sum()
+    assert np.allclose(root_value_sum + contributions.sum(axis=1), tree_predictions.sum(axis=1))
+
+
+@pytest.mark.parametrize("estimator", ESTIMATORS + [Ridge(alpha=1.0)], ids=lambda estimator: type(estimator).__name__)
+def test_attributions_add_up_to_predictions(estimator):
+    X, y = get_data()
+    estimator.fit(X, y)
+    columns = ["a", "b", "c"]
+    attribution_engine = AttributionEngine(estimator=estimator, columns=columns,
+                                           feature_columns=["a", "a", "b", "c", "c"], feature_means=X.mean(axis=0))
+    X_new, _ = get_data(row_count=50, random_state=1)
+    attribution = attribution_engine.attribute(X_new)
+    assert attribution.contributions.shape == (len(X_new), len(columns))
+    assert np.allclose(attribution.bias + attribution.contributions.sum(axis=1), estimator.predict(X_new))
+
+
+def test_tree_arrays_load_memory_mapped(tmp_path):
+    X, y = get_data()
+    estimator = RandomForestRegressor(n_estimators=20, random_state=0).fit(X, y)
+    file_path = str(tmp_path / "model.pkl")
+    save_split_object(file_path=file_path, obj=TreeArrays.from_estimator(estimator))
+    tree_arrays = load_split_object(file_path=file_path)
+    assert not tree_arrays.children.flags.writeable
+    assert np.allclose(tree_arrays.predict_trees(X).mean(axis=1), estimator.predict(X))